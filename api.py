@@ -1,17 +1,15 @@
 """Flask API server for the document query system."""
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
-from src.query import query_documents_with_history
+from src import admission, metrics, readiness, resilience, service
 
 load_dotenv()
 
 app = Flask(__name__)
 
-conversation_sessions = {}
-
 if os.environ.get('FLASK_ENV') == 'production':
     CORS(app, origins=[
         "https://paddleprompt.onrender.com",  
@@ -26,6 +24,22 @@ else:
          allow_headers=['Content-Type', 'Authorization'], 
          supports_credentials=True) 
 
+@app.before_request
+def start_timing():
+    g.metrics_token = metrics.start_request()
+
+@app.after_request
+def add_server_timing(response):
+    # Streamed responses are timed up to their headers; their stages still
+    # reach the /metrics histograms as the stream runs
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        server_timing = metrics.finish_request(token, endpoint, response.status_code)
+        if server_timing:
+            response.headers['Server-Timing'] = server_timing
+    return response
+
 @app.after_request
 def after_request(response):
     if os.environ.get('FLASK_ENV') == 'production':
@@ -41,66 +55,167 @@ def after_request(response):
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint."""
+    """Liveness: the worker is up, whether or not it can answer yet."""
     return jsonify({"status": "healthy", "message": "API is running"})
 
+@app.route('/ready', methods=['GET'])
+def ready_check():
+    """Readiness: 200 once this worker's chains and clients are warmed, 503 until then."""
+    ready, status = readiness.readiness()
+    return jsonify(status), 200 if ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics aggregated over every worker."""
+    return Response(service.metrics_text(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/query', methods=['OPTIONS'])
 def query_options():
     """Handle CORS preflight request for query endpoint."""
     return '', 200
 
+def parse_query_request():
+    """Validate a query request.
+
+    Returns ``(question, session_id, conversation_history), None`` or
+    ``None, (error_response, status)``.
+    """
+    try:
+        return service.parse_query_payload(request.get_json() if request.is_json else None), None
+    except service.RequestError as e:
+        return None, (jsonify({
+            "error": e.message,
+            "status": "error"
+        }), e.status_code)
+
 @app.route('/query', methods=['POST'])
 def query_endpoint():
     try:
-        if not request.is_json:
-            return jsonify({
-                "error": "Request must be JSON",
-                "status": "error"
-            }), 400
-        
-        data = request.get_json()
-        
-        if 'question' not in data:
-            return jsonify({
-                "error": "Missing 'question' field in request",
-                "status": "error"
-            }), 400
-        
-        question = data['question'].strip()
-        session_id = data.get('session_id', 'default')
-        conversation_history = data.get('conversation_history', [])
-        
-        if not question:
-            return jsonify({
-                "error": "Question cannot be empty",
-                "status": "error"
-            }), 400
+        parsed, error = parse_query_request()
+        if error:
+            return error
+        question, session_id, conversation_history = parsed
+        # The query path is imported on first use (see src/readiness.py)
+        from src.query import answer_question
         
-        MAX_WORDS = 500
-        word_count = len(question.split())
-        if word_count > MAX_WORDS:
-            return jsonify({
-                "error": f"Question too long. Maximum length is {MAX_WORDS} words. Current word count: {word_count}",
-                "status": "error"
-            }), 400
-        
-        if session_id not in conversation_sessions:
-            conversation_sessions[session_id] = []
-        
-        conversation_sessions[session_id] = conversation_history[-10:]  # Last 10 messages (5 exchanges)
-        
-        answer = query_documents_with_history(question, conversation_sessions[session_id])
+        with service.admitted(question, request.headers):
+            history = service.start_turn(session_id, conversation_history)
+            
+            result = answer_question(question, history)
+            
+            if not result.degraded:
+                service.finish_turn(session_id, result.history, question, result.answer)
         
-        conversation_sessions[session_id].extend([
-            {"role": "user", "content": question},
-            {"role": "assistant", "content": answer}
-        ])
+        return jsonify({
+            "answer": result.answer,
+            "cache_hit": result.cache_hit,
+            "usage": result.stats,
+            "status": "degraded" if result.degraded else "success"
+        })
         
+    except admission.Rejected as e:
+        return jsonify({
+            "error": e.message,
+            "status": "error"
+        }), 429, service.retry_headers(e)
+    except resilience.Unavailable as e:
+        return jsonify({
+            "error": e.message,
+            "status": "error"
+        }), 503, service.retry_headers(e)
+    except Exception as e:
+        return jsonify({
+            "error": f"Internal server error: {str(e)}",
+            "status": "error"
+        }), 500
+
+@app.route('/query/stream', methods=['OPTIONS'])
+def query_stream_options():
+    """Handle CORS preflight request for the streaming query endpoint."""
+    return '', 200
+
+@app.route('/query/stream', methods=['POST'])
+def query_stream_endpoint():
+    """Stream an answer as Server-Sent Events.
+
+    Events: ``metadata`` (retrieved sources), ``token`` (answer text as it is
+    generated), ``replace`` (full answer that supersedes the streamed tokens),
+    ``done`` (final answer, ``status`` ``degraded`` when an upstream was
+    unavailable) or ``error``.
+    """
+    parsed, error = parse_query_request()
+    if error:
+        return error
+    question, session_id, conversation_history = parsed
+    from src.query import stream_answer
+
+    def generate():
+        # Runs once admitted, so a shed request never reads the session store
+        try:
+            history = service.start_turn(session_id, conversation_history)
+            for event, data in stream_answer(question, history):
+                if event == "done":
+                    yield service.stream_done_event(session_id, question, data)
+                else:
+                    yield service.sse_event(event, data)
+        except Exception as e:
+            yield service.stream_error_event(e)
+
+    try:
+        events = service.admitted_stream(question, request.headers, generate)
+    except admission.Rejected as e:
+        return jsonify({
+            "error": e.message,
+            "status": "error"
+        }), 429, service.retry_headers(e)
+
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+@app.route('/query/batch', methods=['OPTIONS'])
+def query_batch_options():
+    """Handle CORS preflight request for the batch query endpoint."""
+    return '', 200
+
+@app.route('/query/batch', methods=['POST'])
+def query_batch_endpoint():
+    """Answer a list of questions in one request.
+
+    Body: ``{"questions": [...]}`` where each item is a question string or
+    an object like the ``/query`` body (``question``, optional
+    ``session_id`` and ``conversation_history``). Returns one result or
+    error per item, in order.
+    """
+    try:
+        entries = service.parse_batch_payload(request.get_json() if request.is_json else None)
+    except service.RequestError as e:
+        return jsonify({
+            "error": e.message,
+            "status": "error"
+        }), e.status_code
+
+    try:
+        from src.query import answer_batch
+        question, weight = service.batch_admission(entries)
+        with service.admitted(question, request.headers, weight):
+            items, slots = service.prepare_batch(entries)
+            results = answer_batch(items)
         return jsonify({
-            "answer": answer,
+            "results": service.finish_batch(entries, slots, results),
             "status": "success"
         })
-        
+    except admission.Rejected as e:
+        return jsonify({
+            "error": e.message,
+            "status": "error"
+        }), 429, service.retry_headers(e)
+    except resilience.Unavailable as e:
+        return jsonify({
+            "error": e.message,
+            "status": "error"
+        }), 503, service.retry_headers(e)
     except Exception as e:
         return jsonify({
             "error": f"Internal server error: {str(e)}",
@@ -126,40 +241,10 @@ def clear_session():
         data = request.get_json() if request.is_json else {}
         session_id = data.get('session_id')
         
-        if session_id:
-            if session_id in conversation_sessions:
-                del conversation_sessions[session_id]
-                return jsonify({
-                    "message": f"Session {session_id} cleared successfully",
-                    "status": "success"
-                })
-            else:
-                return jsonify({
-                    "message": "Session not found",
-                    "status": "success"  
-                })
-        else:
-           
-            import time
-            current_time = time.time()
-            sessions_to_remove = []
-
-            if len(conversation_sessions) > 100:  
-                session_items = list(conversation_sessions.items())
-                sessions_to_keep = session_items[-50:]
-                conversation_sessions.clear()
-                conversation_sessions.update(sessions_to_keep)
-                
-                removed_count = len(session_items) - 50
-                return jsonify({
-                    "message": f"Cleaned up {removed_count} old sessions",
-                    "status": "success"
-                })
-            
-            return jsonify({
-                "message": "No cleanup needed",
-                "status": "success"
-            })
+        return jsonify({
+            "message": service.clear_sessions(session_id),
+            "status": "success"
+        })
             
     except Exception as e:
         return jsonify({
@@ -171,8 +256,7 @@ def clear_session():
 def sessions_info():
     """Get information about active sessions."""
     return jsonify({
-        "active_sessions": len(conversation_sessions),
-        "session_ids": list(conversation_sessions.keys())[:10],  
+        **service.sessions_info(),
         "status": "success"
     })
 
@@ -0,0 +1,250 @@
+"""ASGI entry point: the API on an event loop, for the async serving mode.
+
+Same routes and responses as ``api.py``, but handlers await the chains, so
+a worker holds many questions in flight while they wait on OpenAI and
+Pinecone instead of one per process. Session store calls, which can wait
+on another worker's SQLite write, run on the blocking executor
+(``registry.run_blocking``) rather than on the event loop. Served by
+``gunicorn.conf.py`` when ``SERVING_MODE=async``, or directly with
+``uvicorn asgi:app``.
+"""
+
+import json
+import os
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from src import admission, metrics, readiness, registry, resilience, service
+
+load_dotenv()
+
+if os.environ.get('FLASK_ENV') == 'production':
+    ALLOWED_ORIGINS = ["https://paddleprompt.onrender.com"]
+else:
+    ALLOWED_ORIGINS = ["*"]
+
+
+class ServerTimingMiddleware:
+    """Collect stage timings per request and return them as a ``Server-Timing`` header.
+
+    Streamed responses are timed up to their headers, as in ``api.py``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = metrics.start_request()
+        finished = False
+
+        async def send_with_timing(message):
+            nonlocal finished
+            if message["type"] == "http.response.start" and not finished:
+                finished = True
+                route = scope.get("route")
+                endpoint = (route.path if route is not None
+                            else scope["path"] if message["status"] != 404 else "unmatched")
+                server_timing = metrics.finish_request(token, endpoint, message["status"])
+                if server_timing:
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"server-timing", server_timing.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if not finished:
+                metrics.finish_request(token, "unmatched", 500)
+
+
+async def read_json(request):
+    """Request body as JSON, or ``None`` when it is not a JSON request."""
+    if "application/json" not in request.headers.get("content-type", ""):
+        return None
+    try:
+        return await request.json()
+    except json.JSONDecodeError:
+        return None
+
+
+def error_response(message, status_code):
+    return JSONResponse({"error": message, "status": "error"}, status_code=status_code)
+
+
+async def metrics_endpoint(request):
+    """Prometheus metrics aggregated over every worker."""
+    return PlainTextResponse(await registry.run_blocking(service.metrics_text),
+                             media_type="text/plain; version=0.0.4")
+
+
+async def health_check(request):
+    """Liveness: the worker is up, whether or not it can answer yet."""
+    return JSONResponse({"status": "healthy", "message": "API is running"})
+
+
+async def ready_check(request):
+    """Readiness: 200 once this worker's chains and clients are warmed, 503 until then."""
+    ready, status = readiness.readiness()
+    return JSONResponse(status, status_code=200 if ready else 503)
+
+
+async def preflight(request):
+    """Handle CORS preflight requests."""
+    return Response("", status_code=200)
+
+
+async def query_get_info(request):
+    """Information about the query endpoint."""
+    return JSONResponse({
+        "message": "Send a POST request with JSON containing a 'question' field",
+        "example": {
+            "question": "What is the best basketball player in the world?"
+        },
+        "endpoint": "/query",
+        "method": "POST"
+    })
+
+
+async def query_endpoint(request):
+    try:
+        question, session_id, conversation_history = service.parse_query_payload(await read_json(request))
+        # The query path is imported on first use (see src/readiness.py)
+        from src.query import aanswer_question
+        async with service.aadmitted(question, request.headers):
+            history = await service.astart_turn(session_id, conversation_history)
+            result = await aanswer_question(question, history)
+            if not result.degraded:
+                await service.afinish_turn(session_id, result.history, question, result.answer)
+        return JSONResponse({
+            "answer": result.answer,
+            "cache_hit": result.cache_hit,
+            "usage": result.stats,
+            "status": "degraded" if result.degraded else "success"
+        })
+    except service.RequestError as e:
+        return error_response(e.message, e.status_code)
+    except admission.Rejected as e:
+        return JSONResponse({"error": e.message, "status": "error"}, status_code=429,
+                            headers=service.retry_headers(e))
+    except resilience.Unavailable as e:
+        return JSONResponse({"error": e.message, "status": "error"}, status_code=503,
+                            headers=service.retry_headers(e))
+    except Exception as e:
+        return error_response(f"Internal server error: {str(e)}", 500)
+
+
+async def query_stream_endpoint(request):
+    """Stream an answer as Server-Sent Events (see ``api.query_stream_endpoint``)."""
+    try:
+        question, session_id, conversation_history = service.parse_query_payload(await read_json(request))
+    except service.RequestError as e:
+        return error_response(e.message, e.status_code)
+    from src.query import astream_answer
+
+    async def generate():
+        # Runs once admitted, so a shed request never reads the session store
+        try:
+            history = await service.astart_turn(session_id, conversation_history)
+            async for event, data in astream_answer(question, history):
+                if event == "done":
+                    yield await service.astream_done_event(session_id, question, data)
+                else:
+                    yield service.sse_event(event, data)
+        except Exception as e:
+            yield service.stream_error_event(e)
+
+    try:
+        events = await service.aadmitted_stream(question, request.headers, generate)
+    except admission.Rejected as e:
+        return JSONResponse({"error": e.message, "status": "error"}, status_code=429,
+                            headers=service.retry_headers(e))
+
+    return StreamingResponse(events, media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+async def query_batch_endpoint(request):
+    """Answer a list of questions in one request (see ``api.query_batch_endpoint``)."""
+    try:
+        entries = service.parse_batch_payload(await read_json(request))
+        from src.query import aanswer_batch
+        question, weight = service.batch_admission(entries)
+        async with service.aadmitted(question, request.headers, weight):
+            items, slots = await service.aprepare_batch(entries)
+            results = await aanswer_batch(items)
+        return JSONResponse({
+            "results": await service.afinish_batch(entries, slots, results),
+            "status": "success"
+        })
+    except service.RequestError as e:
+        return error_response(e.message, e.status_code)
+    except admission.Rejected as e:
+        return JSONResponse({"error": e.message, "status": "error"}, status_code=429,
+                            headers=service.retry_headers(e))
+    except resilience.Unavailable as e:
+        return JSONResponse({"error": e.message, "status": "error"}, status_code=503,
+                            headers=service.retry_headers(e))
+    except Exception as e:
+        return error_response(f"Internal server error: {str(e)}", 500)
+
+
+async def clear_session(request):
+    try:
+        data = await read_json(request) or {}
+        return JSONResponse({
+            "message": await registry.run_blocking(service.clear_sessions, data.get('session_id')),
+            "status": "success"
+        })
+    except Exception as e:
+        return error_response(f"Internal server error: {str(e)}", 500)
+
+
+async def sessions_info(request):
+    """Get information about active sessions."""
+    return JSONResponse({
+        **await registry.run_blocking(service.sessions_info),
+        "status": "success"
+    })
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Warm this worker up in the background; /ready reports when it is done
+    readiness.start_warm_up()
+    yield
+
+
+routes = [
+    Route('/health', health_check, methods=['GET']),
+    Route('/ready', ready_check, methods=['GET']),
+    Route('/metrics', metrics_endpoint, methods=['GET']),
+    Route('/query', query_get_info, methods=['GET']),
+    Route('/query', query_endpoint, methods=['POST']),
+    Route('/query', preflight, methods=['OPTIONS']),
+    Route('/query/stream', query_stream_endpoint, methods=['POST']),
+    Route('/query/stream', preflight, methods=['OPTIONS']),
+    Route('/query/batch', query_batch_endpoint, methods=['POST']),
+    Route('/query/batch', preflight, methods=['OPTIONS']),
+    Route('/clear-session', clear_session, methods=['POST']),
+    Route('/sessions-info', sessions_info, methods=['GET']),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan, middleware=[
+    Middleware(ServerTimingMiddleware),
+    Middleware(
+        CORSMiddleware,
+        allow_origins=ALLOWED_ORIGINS,
+        allow_methods=['GET', 'POST', 'OPTIONS'],
+        allow_headers=['Content-Type', 'Authorization'],
+        allow_credentials=True,
+    ),
+])
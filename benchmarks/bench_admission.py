@@ -0,0 +1,147 @@
+"""Traffic spike against /query with admission control off and on.
+
+    python -m benchmarks.bench_admission --requests 400 --timeout 10
+
+Starts gunicorn with ``gunicorn.conf.py`` against the local stand-ins in each
+serving mode, once with ``ADMISSION_ENABLED=false`` and once with it on. It
+fires ``--requests`` distinct questions at once, each with
+``X-Request-Timeout: --timeout``, and gives up on them client-side after the
+same timeout. The report shows how the spike was answered (200, 429, other
+errors and client timeouts), p50/p99 latency of the answers, how fast the
+429s came back, and the deepest admission queue ``/metrics`` showed while
+the spike ran. The answer and embedding caches are disabled so every answer
+reaches the stand-ins.
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from benchmarks import standins
+from benchmarks.load_test import ROOT, percentile, wait_until_healthy
+
+_QUEUE_DEPTH = re.compile(r"^paddleprompt_admission_queue_depth (\S+)$", re.MULTILINE)
+
+
+async def spike(url, requests, timeout):
+    """Send ``requests`` questions at once; returns the outcomes and the deepest queue seen."""
+    outcomes = {"ok": [], "rejected": [], "error": 0, "timeout": 0}
+    deepest = 0
+    limits = httpx.Limits(max_connections=requests + 1, max_keepalive_connections=requests + 1)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        async def one(i):
+            start = time.perf_counter()
+            try:
+                response = await client.post("/query", headers={"X-Request-Timeout": str(timeout)}, json={
+                    "question": f"How was the hull of canoe {i} designed?",
+                    "session_id": f"spike-{i}",
+                })
+            except httpx.TimeoutException:
+                outcomes["timeout"] += 1
+                return
+            except httpx.HTTPError:
+                outcomes["error"] += 1
+                return
+            elapsed = time.perf_counter() - start
+            if response.status_code == 200:
+                outcomes["ok"].append(elapsed)
+            elif response.status_code == 429:
+                outcomes["rejected"].append(elapsed)
+            else:
+                outcomes["error"] += 1
+
+        async def watch(done):
+            nonlocal deepest
+            while not done.is_set():
+                try:
+                    text = (await client.get("/metrics", timeout=2.0)).text
+                    deepest = max([deepest] + [int(float(value)) for value in _QUEUE_DEPTH.findall(text)])
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.2)
+
+        done = asyncio.Event()
+        watcher = asyncio.create_task(watch(done))
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        done.set()
+        await watcher
+    return outcomes, deepest
+
+
+def run(mode, enabled, args, environment, port):
+    url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, **environment, "SERVING_MODE": mode, "PORT": str(port),
+           "GUNICORN_WORKERS": str(args.workers), "ADMISSION_ENABLED": str(enabled).lower()}
+    with tempfile.TemporaryFile() as log, tempfile.TemporaryDirectory() as directory:
+        env["METRICS_DIR"] = directory
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "--access-logfile", "/dev/null"],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            wait_until_healthy(url, process)
+            outcomes, deepest = asyncio.run(spike(url, args.requests, args.timeout))
+        except Exception:
+            log.seek(0)
+            sys.stderr.write(log.read().decode("utf-8", "replace")[-4000:])
+            raise
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    ok, rejected = outcomes["ok"], outcomes["rejected"]
+    return {
+        "label": f"{mode} {'admission' if enabled else 'unbounded'}",
+        "ok": len(ok),
+        "rejected": len(rejected),
+        "error": outcomes["error"],
+        "timeout": outcomes["timeout"],
+        "p50": statistics.median(ok) if ok else float("nan"),
+        "p99": percentile(ok, 0.99) if ok else float("nan"),
+        "reject_p50": statistics.median(rejected) if rejected else float("nan"),
+        "deepest": deepest,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400, help="questions in the spike")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds each client waits")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="seconds added to every upstream request")
+    parser.add_argument("--token-latency", type=float, default=0.05,
+                        help="seconds per generated chat token")
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--port", type=int, default=18200)
+    args = parser.parse_args()
+
+    with standins.openai_standin(latency=args.latency, token_latency=args.token_latency) as openai_server, \
+            standins.pinecone_standin(latency=args.latency) as pinecone_server:
+        standins.seed_pinecone(pinecone_server, ["Hull design and structural analysis of the concrete canoe."])
+        environment = {
+            **standins.standin_environment(openai_server, pinecone_server),
+            "ANSWER_CACHE_ENABLED": "false",
+            "EMBEDDING_CACHE_ENABLED": "false",
+        }
+        runs = [(mode, enabled) for mode in args.modes.split(",") for enabled in (False, True)]
+        results = [run(mode, enabled, args, environment, args.port + i) for i, (mode, enabled) in enumerate(runs)]
+
+    print(f"spike of {args.requests} questions, client timeout {args.timeout}s, {args.workers} workers, "
+          f"upstream latency {args.latency}s")
+    for result in results:
+        print(f"{result['label']:>15}: 200 {result['ok']:4d}  429 {result['rejected']:4d}  "
+              f"errors {result['error']:4d}  timeouts {result['timeout']:4d}  "
+              f"p50 {result['p50'] * 1000:7.1f} ms  p99 {result['p99'] * 1000:7.1f} ms  "
+              f"429 p50 {result['reject_p50'] * 1000:6.1f} ms  deepest queue {result['deepest']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Questions per minute through ``/query/batch`` versus looping over ``/query``.
+
+    python -m benchmarks.bench_batch --questions 100
+
+Uses the Flask test client against the local stand-ins with the answer and
+embedding caches disabled, so every question is embedded, retrieved and
+answered. Also reports how many embedding requests each approach made and
+the mean prompt size. With ``--paper`` the index holds the overlapping
+chunks of ``bench_context_packing``, stored under two sources, so running
+with ``CONTEXT_PACKING_ENABLED`` true and false compares packed and stuffed
+contexts on both paths.
+"""
+
+import argparse
+import os
+import statistics
+import time
+from benchmarks import standins
+from benchmarks.bench_context_packing import overlapping_chunks, synthetic_paper
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=50, help="questions per /query/batch request")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds added to every upstream request")
+    parser.add_argument("--token-latency", type=float, default=0.02,
+                        help="seconds per generated chat token")
+    parser.add_argument("--prompt-latency", type=float, default=0.0,
+                        help="seconds per prompt token at the stand-in chat model")
+    parser.add_argument("--paper", action="store_true",
+                        help="index overlapping 800-token chunks of a long paper instead of two sentences")
+    args = parser.parse_args()
+
+    with standins.openai_standin(latency=args.latency, token_latency=args.token_latency,
+                                 prompt_latency=args.prompt_latency) as openai_server, \
+            standins.pinecone_standin(latency=args.latency) as pinecone_server:
+        # Before anything imports src.config
+        os.environ.update(standins.standin_environment(openai_server, pinecone_server))
+        os.environ["ANSWER_CACHE_ENABLED"] = "false"
+        os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+
+        if args.paper:
+            chunks = overlapping_chunks(synthetic_paper())
+            standins.seed_pinecone(pinecone_server, chunks, source="canoe_report.pdf")
+            standins.seed_pinecone(pinecone_server, chunks, source="canoe_report_ocr.pdf")
+        else:
+            standins.seed_pinecone(pinecone_server, [
+                "Hull design and structural analysis of the concrete canoe.",
+                "The concrete mix used lightweight aggregate and glass microspheres.",
+            ])
+
+        import api
+        client = api.app.test_client()
+        questions = [f"What was decided about hull section {i}?" for i in range(args.questions)]
+
+        embeddings_before = openai_server.counters.get("POST /v1/embeddings", 0)
+        start = time.perf_counter()
+        loop_prompts = []
+        for question in questions:
+            body = client.post("/query", json={"question": question}).get_json()
+            assert body["status"] == "success"
+            loop_prompts.append(body["usage"]["prompt_tokens"])
+        loop_seconds = time.perf_counter() - start
+        loop_embeddings = openai_server.counters.get("POST /v1/embeddings", 0) - embeddings_before
+
+        embeddings_before = openai_server.counters.get("POST /v1/embeddings", 0)
+        start = time.perf_counter()
+        errors, batch_prompts = 0, []
+        for offset in range(0, len(questions), args.batch_size):
+            body = client.post("/query/batch", json={"questions": questions[offset:offset + args.batch_size]}).get_json()
+            errors += sum(item["status"] != "success" for item in body["results"])
+            batch_prompts += [item["usage"]["prompt_tokens"] for item in body["results"] if item["status"] == "success"]
+        batch_seconds = time.perf_counter() - start
+        batch_embeddings = openai_server.counters.get("POST /v1/embeddings", 0) - embeddings_before
+
+    print(f"{args.questions} questions, upstream latency {args.latency}s, token latency {args.token_latency}s, "
+          f"prompt latency {args.prompt_latency * 1000:.2f} ms/token, context packing "
+          f"{os.environ.get('CONTEXT_PACKING_ENABLED', 'true')}")
+    print(f"/query loop : {args.questions / loop_seconds * 60:8.0f} questions/min  "
+          f"({loop_seconds:.1f}s, {loop_embeddings} embedding requests, "
+          f"prompt {statistics.mean(loop_prompts):.0f} tokens)")
+    print(f"/query/batch: {args.questions / batch_seconds * 60:8.0f} questions/min  "
+          f"({batch_seconds:.1f}s, {batch_embeddings} embedding requests, {errors} errors, "
+          f"batches of {args.batch_size}, prompt {statistics.mean(batch_prompts or [0]):.0f} tokens)")
+
+
+if __name__ == "__main__":
+    main()
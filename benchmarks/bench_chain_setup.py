@@ -0,0 +1,85 @@
+"""Per-request overhead of building the QA chain versus reusing it.
+
+Runs offline against the local stand-ins in ``benchmarks/standins.py``:
+
+    python -m benchmarks.bench_chain_setup --requests 50 --connect-latency 0.05
+
+"rebuild" reproduces the old behaviour (fresh Pinecone client, index handle,
+OpenAI clients, prompt and chain on every request); "reuse" goes through the
+per-process registry the API now uses.
+"""
+
+import argparse
+import os
+import statistics
+import time
+from benchmarks import standins
+
+
+def _summarize(name, timings, connections):
+    timings_ms = sorted(t * 1000 for t in timings)
+    p95 = timings_ms[max(0, int(len(timings_ms) * 0.95) - 1)]
+    print(f"{name:>8}: mean {statistics.mean(timings_ms):7.1f} ms  "
+          f"p50 {statistics.median(timings_ms):7.1f} ms  p95 {p95:7.1f} ms  "
+          f"new connections {connections}")
+    return statistics.mean(timings_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every upstream request")
+    parser.add_argument("--connect-latency", type=float, default=0.03,
+                        help="seconds added per new upstream connection (TLS stand-in)")
+    args = parser.parse_args()
+
+    knobs = {"latency": args.latency, "connect_latency": args.connect_latency}
+    with standins.openai_standin(**knobs) as openai_server, \
+            standins.pinecone_standin(**knobs) as pinecone_server:
+        standins.seed_pinecone(pinecone_server, [
+            "Hull design and structural analysis of the concrete canoe.",
+            "Concrete mix design with lightweight aggregates and fibers.",
+            "Construction of the female mold and curing schedule.",
+        ])
+        os.environ.update(standins.standin_environment(openai_server, pinecone_server))
+        os.environ["WARM_CONNECTIONS"] = "false"
+
+        from src import registry
+        from src.query import setup_qa_chain_with_history, get_qa_chain_with_history
+
+        payload = {"input": "What concrete mix design did teams use?", "conversation_history": ""}
+
+        def connections():
+            return openai_server.connections + pinecone_server.connections
+
+        # Old behaviour: everything rebuilt for each request
+        start_connections = connections()
+        rebuild = []
+        for _ in range(args.requests):
+            registry.reset()
+            start = time.perf_counter()
+            setup_qa_chain_with_history().invoke(payload)
+            rebuild.append(time.perf_counter() - start)
+        rebuild_connections = connections() - start_connections
+
+        # New behaviour: one chain per process, pooled connections
+        registry.reset()
+        get_qa_chain_with_history().invoke(payload)
+        start_connections = connections()
+        reuse = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            get_qa_chain_with_history().invoke(payload)
+            reuse.append(time.perf_counter() - start)
+        reuse_connections = connections() - start_connections
+
+    print(f"{args.requests} requests, latency {args.latency}s, "
+          f"connect latency {args.connect_latency}s")
+    before = _summarize("rebuild", rebuild, rebuild_connections)
+    after = _summarize("reuse", reuse, reuse_connections)
+    print(f"per-request overhead removed: {before - after:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Chunking throughput and chunk counts: fixed token windows versus the structure-aware chunker.
+
+    python -m benchmarks.bench_chunking --folder pdfs --files 40
+
+Extracts the PDFs once, then chunks the same texts three ways and reports
+tokens per second, chunk count, mean chunk size and how many chunks start
+at a section heading:
+
+- fixed: the old ``chunk_text_by_tokens``, a fresh encoder per call and
+  back-to-back ``chunk_size`` windows with no overlap
+- structured: ``Chunker.chunk`` one document at a time
+- structured batch: ``Chunker.chunk_many`` over all documents at once
+
+Without the Git LFS objects of ``pdfs/``, point ``--folder`` at papers
+written by ``python -m benchmarks.corpus``.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import tiktoken
+from src.chunking import Chunker, ENCODING_NAME, section_of
+from src.pdf_loader import iter_pdf_texts
+
+
+def fixed_windows(text, chunk_size):
+    encoding = tiktoken.get_encoding(ENCODING_NAME)
+    tokens = encoding.encode(text)
+    return [encoding.decode(tokens[i:i + chunk_size]) for i in range(0, len(tokens), chunk_size)]
+
+
+def report(name, seconds, tokens, chunks, chunker):
+    sizes = [len(chunker.encoding.encode_ordinary(text)) for text in chunks]
+    at_heading = sum(section_of(text.split("\n", 1)[0]) is not None for text in chunks)
+    print(f"{name:>17}: {tokens / seconds:>10,.0f} tokens/s  {len(chunks):5d} chunks  "
+          f"mean {statistics.mean(sizes):5.0f} tokens  {at_heading:4d} start at a heading")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", default="./pdfs")
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--chunk-size", type=int, default=800)
+    parser.add_argument("--overlap", type=int, default=100)
+    args = parser.parse_args()
+
+    paths = sorted(os.path.join(args.folder, f) for f in os.listdir(args.folder) if f.endswith(".pdf"))
+    documents = [(os.path.basename(path), text) for path, text in iter_pdf_texts(paths[:args.files])]
+    if not documents:
+        sys.exit(f"No text extracted from {args.folder}; see benchmarks/corpus.py")
+    chunker = Chunker(chunk_size=args.chunk_size, overlap=args.overlap)
+    tokens = sum(len(t) for t in chunker.encoding.encode_ordinary_batch([text for _, text in documents]))
+    print(f"{len(documents)} documents, {tokens:,} tokens")
+
+    started = time.perf_counter()
+    fixed = [chunk for _, text in documents for chunk in fixed_windows(text, args.chunk_size)]
+    report("fixed", time.perf_counter() - started, tokens, fixed, chunker)
+
+    started = time.perf_counter()
+    structured = [chunk.text for source, text in documents for chunk in chunker.chunk(text, source)]
+    report("structured", time.perf_counter() - started, tokens, structured, chunker)
+
+    started = time.perf_counter()
+    batched = [chunk.text for chunks in chunker.chunk_many(documents) for chunk in chunks]
+    report("structured batch", time.perf_counter() - started, tokens, batched, chunker)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Upstream calls saved by coalescing identical questions under bursty traffic.
+
+    python -m benchmarks.bench_coalescing --bursts 5 --burst-size 50
+
+Starts gunicorn with ``gunicorn.conf.py`` against the local stand-ins, once
+with ``COALESCING_ENABLED=false`` and once with it on, in each serving mode.
+Each burst sends ``--burst-size`` copies of one question to ``/query`` at
+the same moment (a class asking about the same assignment), spread over
+fresh sessions. Then the next burst sends a new question. The report covers
+embedding, chat completion and Pinecone query calls made upstream, p50/p99
+latency, and the requests each scope of coalescing answered. The answer and
+embedding caches are disabled, so only coalescing saves calls.
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from benchmarks import standins
+from benchmarks.load_test import ROOT, percentile, wait_until_healthy
+
+UPSTREAM = {
+    "embeddings": "POST /v1/embeddings",
+    "completions": "POST /v1/chat/completions",
+    "pinecone": "POST /query",
+}
+_COALESCED = re.compile(r'^paddleprompt_coalesced_requests_total\{scope="(\w+)"\} (\S+)$', re.MULTILINE)
+
+
+async def fire_bursts(url, bursts, burst_size, pause):
+    """Send ``bursts`` rounds of ``burst_size`` identical questions at once."""
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=burst_size, max_keepalive_connections=burst_size)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=300.0) as client:
+        async def one(burst, i):
+            nonlocal errors
+            start = time.perf_counter()
+            try:
+                response = await client.post("/query", json={
+                    "question": f"How was the hull of canoe {burst} designed?",
+                    "session_id": f"burst-{burst}-{i}",
+                })
+                if response.status_code != 200:
+                    errors += 1
+                    return
+            except httpx.HTTPError:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+        for burst in range(bursts):
+            await asyncio.gather(*(one(burst, i) for i in range(burst_size)))
+            await asyncio.sleep(pause)
+    return latencies, errors
+
+
+def coalesced_counts(url):
+    text = httpx.get(f"{url}/metrics", timeout=5.0).text
+    return {scope: int(float(value)) for scope, value in _COALESCED.findall(text)}
+
+
+def run(mode, coalescing, args, environment, openai_server, pinecone_server, port):
+    url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, **environment, "SERVING_MODE": mode, "PORT": str(port),
+           "GUNICORN_WORKERS": str(args.workers), "COALESCING_ENABLED": str(coalescing).lower()}
+    with tempfile.TemporaryFile() as log, tempfile.TemporaryDirectory() as directory:
+        env["COALESCE_DIR"] = directory
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "--access-logfile", "/dev/null"],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            wait_until_healthy(url, process)
+            before = {**openai_server.counters, **pinecone_server.counters}
+            latencies, errors = asyncio.run(fire_bursts(url, args.bursts, args.burst_size, args.pause))
+            after = {**openai_server.counters, **pinecone_server.counters}
+            coalesced = coalesced_counts(url)
+        except Exception:
+            log.seek(0)
+            sys.stderr.write(log.read().decode("utf-8", "replace")[-4000:])
+            raise
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    return {
+        "label": f"{mode} {'coalesced' if coalescing else 'baseline'}",
+        "upstream": {name: after.get(route, 0) - before.get(route, 0) for name, route in UPSTREAM.items()},
+        "p50": statistics.median(latencies) if latencies else float("nan"),
+        "p99": percentile(latencies, 0.99) if latencies else float("nan"),
+        "errors": errors,
+        "coalesced": coalesced,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--burst-size", type=int, default=50, help="identical questions per burst")
+    parser.add_argument("--pause", type=float, default=0.5, help="seconds between bursts")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds added to every upstream request")
+    parser.add_argument("--token-latency", type=float, default=0.02,
+                        help="seconds per generated chat token")
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--port", type=int, default=18100)
+    args = parser.parse_args()
+
+    with standins.openai_standin(latency=args.latency, token_latency=args.token_latency) as openai_server, \
+            standins.pinecone_standin(latency=args.latency) as pinecone_server:
+        standins.seed_pinecone(pinecone_server, ["Hull design and structural analysis of the concrete canoe."])
+        environment = {
+            **standins.standin_environment(openai_server, pinecone_server),
+            "ANSWER_CACHE_ENABLED": "false",
+            "EMBEDDING_CACHE_ENABLED": "false",
+        }
+        runs = [(mode, coalescing) for mode in args.modes.split(",") for coalescing in (False, True)]
+        results = [run(mode, coalescing, args, environment, openai_server, pinecone_server, args.port + i)
+                   for i, (mode, coalescing) in enumerate(runs)]
+
+    requests = args.bursts * args.burst_size
+    print(f"{args.bursts} bursts of {args.burst_size} identical questions ({requests} requests), "
+          f"{args.workers} workers, upstream latency {args.latency}s")
+    for result in results:
+        upstream = result["upstream"]
+        coalesced = result["coalesced"]
+        print(f"{result['label']:>15}: embeddings {upstream['embeddings']:4d}  "
+              f"completions {upstream['completions']:4d}  pinecone {upstream['pinecone']:4d}  "
+              f"p50 {result['p50'] * 1000:7.1f} ms  p99 {result['p99'] * 1000:7.1f} ms  "
+              f"coalesced worker {coalesced.get('worker', 0):4d} host {coalesced.get('host', 0):4d}  "
+              f"errors {result['errors']}")
+
+
+if __name__ == "__main__":
+    main()
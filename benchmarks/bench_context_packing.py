@@ -0,0 +1,104 @@
+"""Prompt tokens and answer latency with and without the context packer.
+
+    python -m benchmarks.bench_context_packing --requests 10
+
+Seeds the Pinecone stand-in with overlapping 800-token chunks of a long
+synthetic paper, stored twice under different sources (as two ingestion
+paths would), so the top ``k=8`` hits contain near-duplicates and
+neighbouring chunks. Each mode runs in its own process with
+``CONTEXT_PACKING_ENABLED`` set accordingly; the stand-in chat model waits
+``--prompt-latency`` seconds per prompt token to model prefill time.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from benchmarks import standins
+
+CHUNK_TOKENS = 800
+OVERLAP_TOKENS = 100
+
+
+def synthetic_paper(paragraphs=60):
+    topics = ["hull", "mix design", "reinforcement", "flotation", "formwork", "curing", "paddling"]
+    return "\n\n".join(
+        f"Section {i}. The {topics[i % len(topics)]} of the concrete canoe was studied in detail. "
+        + " ".join(f"Observation {i}.{j}: the {topics[(i + j) % len(topics)]} measurements for the "
+                   f"canoe hull were recorded and compared against the design target."
+                   for j in range(12))
+        for i in range(paragraphs)
+    )
+
+
+def overlapping_chunks(text):
+    from src.history import get_encoding
+    tokens = get_encoding().encode(text)
+    step = CHUNK_TOKENS - OVERLAP_TOKENS
+    return [get_encoding().decode(tokens[i:i + CHUNK_TOKENS]) for i in range(0, len(tokens), step)]
+
+
+def _run(requests):
+    from src.query import answer_question
+    latencies, stats = [], []
+    for i in range(requests):
+        start = time.perf_counter()
+        result = answer_question(f"What hull measurements were recorded for the canoe? ({i})", [])
+        latencies.append(time.perf_counter() - start)
+        stats.append(result.stats)
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "prompt_tokens": statistics.mean(s.get("prompt_tokens", 0) for s in stats),
+        "context_tokens_retrieved": statistics.mean(s.get("context_tokens_retrieved", 0) for s in stats),
+        "context_tokens": statistics.mean(s.get("context_tokens", 0) for s in stats),
+        "duplicates_dropped": statistics.mean(s.get("context_duplicates_dropped", 0) for s in stats),
+        "chunks_merged": statistics.mean(s.get("context_chunks_merged", 0) for s in stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--prompt-latency", type=float, default=0.0002,
+                        help="seconds per prompt token at the stand-in chat model")
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(_run(args.requests)))
+        return
+
+    with standins.openai_standin(prompt_latency=args.prompt_latency) as openai_server, \
+            standins.pinecone_standin() as pinecone_server:
+        chunks = overlapping_chunks(synthetic_paper())
+        standins.seed_pinecone(pinecone_server, chunks, source="canoe_report.pdf")
+        standins.seed_pinecone(pinecone_server, chunks, source="canoe_report_ocr.pdf")
+        environment = {
+            **os.environ,
+            **standins.standin_environment(openai_server, pinecone_server),
+            "ANSWER_CACHE_ENABLED": "false",
+            "EMBEDDING_CACHE_ENABLED": "false",
+        }
+
+        print(f"{args.requests} requests, {len(chunks)} chunks x 2 sources, "
+              f"prompt latency {args.prompt_latency * 1000:.2f} ms/token")
+        for enabled in ("false", "true"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_context_packing", "--run",
+                 "--requests", str(args.requests)],
+                env={**environment, "CONTEXT_PACKING_ENABLED": enabled},
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            label = "packed" if enabled == "true" else "stuffed"
+            print(f"{label:>8}: prompt {result['prompt_tokens']:7.0f} tokens  "
+                  f"context {result['context_tokens']:6.0f} of {result['context_tokens_retrieved']:6.0f} tokens  "
+                  f"p50 {result['p50_ms']:7.1f} ms  "
+                  f"(dropped {result['duplicates_dropped']:.1f} duplicates, merged {result['chunks_merged']:.1f} chunks)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Near-duplicate chunks in the corpus: how many embeddings and index entries deduplication saves.
+
+    python -m benchmarks.bench_dedup --folder pdfs --threshold 0.85
+
+Extracts and chunks the PDFs as ingestion does, then assigns every chunk
+through a fresh ``DedupIndex`` and reports the time it took, the
+duplicates found and the files that share the most chunks.
+"""
+
+import argparse
+import os
+import time
+from collections import Counter
+from src.chunking import Chunker
+from src.dedup import DedupIndex
+from src.pdf_loader import iter_pdf_texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", default="./pdfs")
+    parser.add_argument("--files", type=int, default=None, help="only the first N files")
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--top", type=int, default=10, help="file pairs to list")
+    args = parser.parse_args()
+
+    paths = sorted(os.path.join(args.folder, f) for f in os.listdir(args.folder) if f.endswith(".pdf"))
+    documents = [(os.path.basename(path), text) for path, text in iter_pdf_texts(paths[:args.files])]
+    chunker = Chunker()
+    chunked = chunker.chunk_many(documents)
+
+    index = DedupIndex(path=None, threshold=args.threshold, enabled=True)
+    pairs = Counter()
+    started = time.perf_counter()
+    for (source, _), chunks in zip(documents, chunked):
+        for chunk in chunks:
+            canonical_id = index.assign(chunk.id, chunk.text, source)
+            if canonical_id is not None:
+                pairs[tuple(sorted((source, index.canonicals[canonical_id]["source"])))] += 1
+    seconds = time.perf_counter() - started
+
+    total = len(index.canonicals) + len(index.duplicates)
+    print(f"{len(documents)} documents, {total} chunks, deduplicated in {seconds:.2f}s "
+          f"({total / seconds:,.0f} chunks/s)")
+    print(f"{len(index.duplicates)} near-duplicates ({len(index.duplicates) / max(total, 1):.1%}): "
+          f"{len(index.canonicals)} embeddings and index entries instead of {total}")
+    for (first, second), count in pairs.most_common(args.top):
+        label = first if first == second else f"{first} <-> {second}"
+        print(f"  {count:4d}  {label}")
+
+
+if __name__ == "__main__":
+    main()
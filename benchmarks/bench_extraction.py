@@ -0,0 +1,99 @@
+"""PDF extraction throughput and peak memory, serial versus process pool.
+
+    python -m benchmarks.bench_extraction --folder pdfs --workers 8
+
+Each mode runs in a fresh interpreter so its peak RSS is measured on its
+own. Peak RSS covers the parent plus the largest pool worker. "serial" and
+"parallel" read the text layer only. "ocr" also OCRs scanned pages. It
+runs twice (cold, then warm): pages OCRed on the first run come from
+``OCR_CACHE_DIR`` on the second, unless ``--clear-ocr-cache`` is given.
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+
+def _peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
+
+
+def _run(mode, paths, workers):
+    from src.pdf_loader import iter_pdf_pages
+
+    pages = chars = 0
+    started = time.perf_counter()
+    if mode == "serial":
+        # The old path: whole document text built up one file at a time
+        import fitz
+        for path in paths:
+            try:
+                doc = fitz.open(path)
+            except Exception:
+                continue
+            text = ""
+            for page in doc:
+                text += page.get_text()
+                pages += 1
+            chars += len(text)
+    else:
+        for _, _, text in iter_pdf_pages(paths, max_workers=workers, ocr=mode.startswith("ocr")):
+            pages += 1
+            chars += len(text)
+    seconds = time.perf_counter() - started
+    own_mb, worker_mb = _peak_rss_mb()
+    return {
+        "mode": mode,
+        "files": len(paths),
+        "pages": pages,
+        "chars": chars,
+        "seconds": round(seconds, 3),
+        "pages_per_second": round(pages / seconds, 1) if seconds else 0.0,
+        "peak_rss_mb": round(own_mb, 1),
+        "peak_worker_rss_mb": round(worker_mb, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", default="./pdfs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--clear-ocr-cache", action="store_true",
+                        help="delete OCR_CACHE_DIR first, so the cold run OCRs every scanned page")
+    parser.add_argument("--mode", choices=["serial", "parallel", "ocr cold", "ocr warm"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    paths = sorted(os.path.join(args.folder, f) for f in os.listdir(args.folder) if f.endswith(".pdf"))
+
+    if args.mode:
+        print(json.dumps(_run(args.mode, paths, args.workers)))
+        return
+
+    if args.clear_ocr_cache:
+        from src import config
+        shutil.rmtree(config.OCR_CACHE_DIR, ignore_errors=True)
+
+    for mode in ("serial", "parallel", "ocr cold", "ocr warm"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_extraction", "--folder", args.folder,
+             "--workers", str(args.workers), "--mode", mode],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        if mode.startswith("ocr"):
+            # Per-document OCR timings
+            print("\n".join(line for line in output.splitlines() if line.startswith("OCR: ")))
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:>8}: {result['pages']} pages from {result['files']} files in {result['seconds']}s "
+              f"= {result['pages_per_second']} pages/s, peak RSS {result['peak_rss_mb']} MB "
+              f"(workers {result['peak_worker_rss_mb']} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Effect of deadlines, hedging and circuit breaking on /query tail latency.
+
+    python -m benchmarks.bench_resilience --requests 300 --slow-rate 0.05 --slow-latency 5
+
+Starts gunicorn with ``gunicorn.conf.py`` against fault-injecting local
+stand-ins, once with ``RESILIENCE_ENABLED=false`` and once with it on, in
+each serving mode, and runs two phases:
+
+- tail: ``--slow-rate`` of the requests to OpenAI and Pinecone stall
+  ``--slow-latency`` extra seconds; hedging should take most of them out of
+  p99
+- outage: every Pinecone request fails with a 429 for ``--outage-requests``
+  questions; the breaker should turn them into fast degraded answers
+  instead of slow errors
+
+Each phase reports p50/p99 latency and how the questions were answered
+(``success``, ``degraded`` or an error status). The run adds the hedges,
+timeouts, breaker rejections and degraded answers counted in ``/metrics``.
+The answer and embedding caches are disabled so every question reaches
+the stand-ins.
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+import httpx
+from benchmarks import standins
+from benchmarks.load_test import ROOT, percentile, wait_until_healthy
+
+_COUNTER = re.compile(r'^(paddleprompt_(?:hedged_calls|upstream_calls|degraded_answers)_total)\{(.*)\} (\S+)$',
+                      re.MULTILINE)
+
+
+async def fire(url, requests, concurrency, offset, timeout):
+    """Send ``requests`` distinct questions, ``concurrency`` at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, outcomes = [], Counter()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        async def one(i):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/query", json={
+                        "question": f"How was the hull of canoe {offset + i} designed?",
+                        "session_id": f"resilience-{offset + i}",
+                    })
+                except httpx.TimeoutException:
+                    outcomes["client timeout"] += 1
+                    return
+                latencies.append(time.perf_counter() - start)
+                if response.status_code == 200:
+                    outcomes[response.json().get("status", "success")] += 1
+                else:
+                    outcomes[str(response.status_code)] += 1
+
+        await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, outcomes
+
+
+def summarize(latencies, outcomes):
+    return {
+        "p50": statistics.median(latencies) if latencies else float("nan"),
+        "p99": percentile(latencies, 0.99) if latencies else float("nan"),
+        "outcomes": dict(outcomes),
+    }
+
+
+def upstream_counters(url):
+    text = httpx.get(f"{url}/metrics", timeout=5.0).text
+    counters = Counter()
+    for name, labels, value in _COUNTER.findall(text):
+        short = name[len("paddleprompt_"):-len("_total")]
+        counters[f"{short}{{{labels}}}"] += int(float(value))
+    return counters
+
+
+def run(mode, enabled, args, environment, openai_server, pinecone_server, port):
+    url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, **environment, "SERVING_MODE": mode, "PORT": str(port),
+           "GUNICORN_WORKERS": str(args.workers), "RESILIENCE_ENABLED": str(enabled).lower()}
+    with tempfile.TemporaryFile() as log, tempfile.TemporaryDirectory() as directory:
+        env["METRICS_DIR"] = directory
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "--access-logfile", "/dev/null"],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            wait_until_healthy(url, process)
+            for server in (openai_server, pinecone_server):
+                server.slow_rate, server.slow_latency = args.slow_rate, args.slow_latency
+            tail = summarize(*asyncio.run(fire(url, args.requests, args.concurrency, 0, args.client_timeout)))
+            for server in (openai_server, pinecone_server):
+                server.slow_rate = 0.0
+            pinecone_server.error_rate = 1.0
+            outage = summarize(*asyncio.run(fire(url, args.outage_requests, args.concurrency,
+                                                 args.requests, args.client_timeout)))
+            pinecone_server.error_rate = 0.0
+            counters = upstream_counters(url)
+        except Exception:
+            log.seek(0)
+            sys.stderr.write(log.read().decode("utf-8", "replace")[-4000:])
+            raise
+        finally:
+            pinecone_server.error_rate = openai_server.slow_rate = pinecone_server.slow_rate = 0.0
+            process.terminate()
+            process.wait(timeout=30)
+
+    return {"label": f"{mode} {'resilient' if enabled else 'baseline'}", "tail": tail, "outage": outage,
+            "counters": counters}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300, help="questions in the tail phase")
+    parser.add_argument("--outage-requests", type=int, default=100, help="questions in the outage phase")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every upstream request")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="fraction of upstream requests that stall")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="seconds a stalled request stalls")
+    parser.add_argument("--client-timeout", type=float, default=60.0)
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--port", type=int, default=18300)
+    args = parser.parse_args()
+
+    with standins.openai_standin(latency=args.latency) as openai_server, \
+            standins.pinecone_standin(latency=args.latency) as pinecone_server:
+        standins.seed_pinecone(pinecone_server, ["Hull design and structural analysis of the concrete canoe."])
+        environment = {
+            **standins.standin_environment(openai_server, pinecone_server),
+            "ANSWER_CACHE_ENABLED": "false",
+            "EMBEDDING_CACHE_ENABLED": "false",
+        }
+        runs = [(mode, enabled) for mode in args.modes.split(",") for enabled in (False, True)]
+        results = [run(mode, enabled, args, environment, openai_server, pinecone_server, args.port + i)
+                   for i, (mode, enabled) in enumerate(runs)]
+
+    print(f"{args.workers} workers, {args.concurrency} concurrent; tail: {args.requests} questions with "
+          f"{args.slow_rate:.0%} of upstream requests stalling {args.slow_latency}s; "
+          f"outage: {args.outage_requests} questions with Pinecone failing")
+    for result in results:
+        for phase in ("tail", "outage"):
+            summary = result[phase]
+            outcomes = "  ".join(f"{name} {count}" for name, count in sorted(summary["outcomes"].items()))
+            print(f"{result['label']:>16} {phase:>6}: p50 {summary['p50'] * 1000:8.1f} ms  "
+                  f"p99 {summary['p99'] * 1000:8.1f} ms  {outcomes}")
+        for name, count in sorted(result["counters"].items()):
+            print(f"{'':>24}{name} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Retrieval quality and latency: vector only, hybrid, and hybrid with the lexical fast path.
+
+    python -m benchmarks.bench_retrieval --chunks 400 --queries 100
+
+Builds a synthetic corpus where each chunk describes one team's canoe,
+with its name, mix code and hull measurements, seeds the Pinecone stand-in
+with it and writes a BM25 index to a temporary directory. Half the queries
+name the team or mix code (exact-term lookups), half describe the canoe in
+other words. Reports hit rate (the target chunk is in the top ``k``),
+mean reciprocal rank, p50 retrieval latency and how many embedding requests
+each mode made, with ``--latency`` seconds added to every upstream request.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from benchmarks import standins
+
+ADJECTIVES = ["Granite", "Silver", "Midnight", "Coastal", "Prairie", "Summit", "Harbor", "Aurora",
+              "Cedar", "Falcon", "Glacier", "Maple", "Quartz", "Thunder", "Willow", "Zephyr"]
+NOUNS = ["Otter", "Heron", "Pike", "Loon", "Beaver", "Marlin", "Osprey", "Sturgeon"]
+FINISHES = ["sealed", "stained", "polished", "sanded", "painted"]
+
+
+def synthetic_corpus(chunks, seed=7):
+    rng = random.Random(seed)
+    names = [f"{a} {n}" for a in ADJECTIVES for n in NOUNS]
+    rng.shuffle(names)
+    corpus = []
+    for i in range(chunks):
+        team = f"{names[i % len(names)]} {i // len(names) + 1}"
+        mix = f"MX{rng.randint(1000, 9999)}"
+        length, width = rng.randint(180, 220), rng.randint(24, 32)
+        corpus.append({
+            "team": team, "mix": mix, "length": length,
+            "text": (f"Team {team} built their concrete canoe with mix design {mix}. "
+                     f"The hull was {length} inches long and {width} inches wide, "
+                     f"{rng.choice(FINISHES)} after curing. The paddlers reported good tracking "
+                     f"and the reinforcement mesh held up during the sprint races."),
+        })
+    return corpus
+
+
+def queries(corpus, count, seed=11):
+    rng = random.Random(seed)
+    picked = rng.sample(range(len(corpus)), count)
+    result = []
+    for n, i in enumerate(picked):
+        entry = corpus[i]
+        if n % 2 == 0:
+            text = rng.choice([f"What mix did team {entry['team']} use?", f"Which team used mix {entry['mix']}?"])
+        else:
+            text = (f"Which concrete canoe hull was {entry['length']} inches long "
+                    f"with mix {entry['mix'][:4]} reinforcement mesh?")
+        result.append((text, i))
+    return result
+
+
+def evaluate(retriever, workload, ids, openai_server):
+    before = openai_server.counters.get("POST /v1/embeddings", 0)
+    latencies, hits, reciprocal_ranks = [], 0, []
+    for text, target in workload:
+        start = time.perf_counter()
+        documents = retriever.invoke(text)
+        latencies.append(time.perf_counter() - start)
+        ranked = [document.metadata.get("id") for document in documents]
+        rank = ranked.index(ids[target]) + 1 if ids[target] in ranked else None
+        hits += rank is not None
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+    return {
+        "hit_rate": hits / len(workload),
+        "mrr": statistics.mean(reciprocal_ranks),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "embeddings": openai_server.counters.get("POST /v1/embeddings", 0) - before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=400)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.03,
+                        help="seconds added to every upstream request")
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.chunks)
+    workload = queries(corpus, min(args.queries, len(corpus)))
+
+    with standins.openai_standin(latency=args.latency) as openai_server, \
+            standins.pinecone_standin(latency=args.latency) as pinecone_server, \
+            tempfile.TemporaryDirectory() as lexical_dir:
+        standins.seed_pinecone(pinecone_server, [entry["text"] for entry in corpus], source="teams.pdf")
+        ids = [f"teams_chunk_{i}" for i in range(len(corpus))]
+
+        os.environ.update(standins.standin_environment(openai_server, pinecone_server))
+        os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+        from src import registry
+        from src.lexical_index import HybridRetriever, LexicalIndex
+        from src.query import build_vector_retriever
+
+        lexical_index = LexicalIndex(lexical_dir)
+        lexical_index.upsert([(vector_id, None, {"id": vector_id, "source": "teams.pdf", "chunk": i,
+                                                 "text": entry["text"]})
+                              for i, (vector_id, entry) in enumerate(zip(ids, corpus))])
+        lexical_index.save()
+
+        vector_retriever = build_vector_retriever()
+        modes = {"vector": vector_retriever}
+        for name, fast_path in (("hybrid", False), ("hybrid+fast", True)):
+            modes[name] = HybridRetriever(
+                vector_retriever=vector_retriever, lexical_index=lexical_index,
+                embeddings=registry.get_embedding_model(), executor=registry.get_blocking_executor(),
+                k=8, fast_path=fast_path,
+            )
+
+        vector_retriever.invoke("warm up")
+        print(f"{len(workload)} queries over {len(corpus)} chunks, upstream latency {args.latency}s")
+        for name, retriever in modes.items():
+            result = evaluate(retriever, workload, ids, openai_server)
+            print(f"{name:>12}: hit@8 {result['hit_rate']:5.1%}  MRR {result['mrr']:.3f}  "
+                  f"p50 {result['p50_ms']:6.1f} ms  {result['embeddings']:4d} embedding requests")
+
+
+if __name__ == "__main__":
+    main()
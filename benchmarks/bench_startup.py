@@ -0,0 +1,101 @@
+"""Cold-start profile: import time of each entry point and time until a worker is ready.
+
+    python -m benchmarks.bench_startup --top 15
+
+Each measurement runs in a fresh interpreter so nothing is already
+imported:
+
+- import profile: ``python -X importtime -c "import <module>"`` for the
+  WSGI and ASGI entry points and for ``src.query`` (what a worker imports
+  while warming up), with the wall time beyond interpreter startup and
+  the top-level packages that account for most of it
+- ready: against the local stand-ins in ``benchmarks/standins.py``, the
+  time to import ``api`` and then for ``src.readiness`` to report the
+  worker ready, split into the two
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from benchmarks import standins
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ("wsgi", "asgi", "src.query")
+
+READY_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import api
+imported = time.perf_counter()
+from src import readiness
+readiness.start_warm_up()
+while readiness.get_warm_up().status()["status"] == "warming":
+    time.sleep(0.005)
+print(json.dumps({"import": imported - started, "warm_up": time.perf_counter() - imported,
+                  "status": readiness.get_warm_up().status()}))
+"""
+
+
+def import_profile(module):
+    """``(wall seconds, {top-level package: self microseconds}, error)`` of importing ``module``."""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    error = result.stderr.strip().splitlines()[-1] if result.returncode else None
+    return wall, packages, error
+
+
+def time_to_ready(env):
+    result = subprocess.run([sys.executable, "-c", READY_SCRIPT], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=10, help="packages to list per entry point")
+    parser.add_argument("--connect-latency", type=float, default=0.03,
+                        help="seconds added per new upstream connection (TLS stand-in)")
+    parser.add_argument("--runs", type=int, default=3, help="time-to-ready runs")
+    args = parser.parse_args()
+
+    # Interpreter startup (site, encodings, ...) is the same for every module
+    startup_wall, startup, _ = import_profile("sys")
+    print(f"interpreter startup: {startup_wall:.2f}s wall (excluded below)")
+    for module in MODULES:
+        wall, packages, error = import_profile(module)
+        wall -= startup_wall
+        packages = {package: us - startup.get(package, 0) for package, us in packages.items()
+                    if us > startup.get(package, 0)}
+        total = sum(packages.values()) / 1e6
+        print(f"import {module}: {wall:.2f}s wall, {total:.2f}s in imports"
+              + (f" (failed: {error})" if error else ""))
+        for package, us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {package:<28} {us / 1000:8.1f} ms")
+
+    knobs = {"connect_latency": args.connect_latency}
+    with standins.openai_standin(**knobs) as openai_server, \
+            standins.pinecone_standin(**knobs) as pinecone_server:
+        standins.seed_pinecone(pinecone_server, ["Hull design and structural analysis of the concrete canoe."])
+        env = {**os.environ, **standins.standin_environment(openai_server, pinecone_server)}
+        for run in range(args.runs):
+            timing = time_to_ready(env)
+            print(f"ready run {run + 1}: import api {timing['import']:.2f}s, "
+                  f"warm-up {timing['warm_up']:.2f}s -> {timing['status']['status']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Time to first token of ``/query/stream`` versus ``/query``.
+
+    python -m benchmarks.bench_streaming --requests 10 --token-latency 0.05
+
+Uses the Flask test client against the local stand-ins; the stand-in chat
+model waits ``--token-latency`` seconds per generated token. The answer
+cache is disabled so every request reaches the model.
+"""
+
+import argparse
+import os
+import statistics
+import time
+from benchmarks import standins
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds added to every upstream request")
+    parser.add_argument("--token-latency", type=float, default=0.05,
+                        help="seconds per generated chat token")
+    args = parser.parse_args()
+
+    with standins.openai_standin(latency=args.latency, token_latency=args.token_latency) as openai_server, \
+            standins.pinecone_standin(latency=args.latency) as pinecone_server:
+        standins.seed_pinecone(pinecone_server, ["Hull design and structural analysis of the concrete canoe."])
+        os.environ.update(standins.standin_environment(openai_server, pinecone_server))
+        os.environ["ANSWER_CACHE_ENABLED"] = "false"
+
+        import api
+        client = api.app.test_client()
+        question = {"question": "How was the hull designed?"}
+
+        blocking = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            client.post("/query", json=question).get_json()
+            blocking.append(time.perf_counter() - start)
+
+        first_token, complete = [], []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            response = client.post("/query/stream", json=question, buffered=False)
+            seen_token = False
+            for piece in response.response:
+                if not seen_token and b"event: token" in piece:
+                    first_token.append(time.perf_counter() - start)
+                    seen_token = True
+            complete.append(time.perf_counter() - start)
+            response.close()
+
+    def ms(values):
+        return f"p50 {statistics.median(values) * 1000:7.1f} ms  max {max(values) * 1000:7.1f} ms"
+
+    print(f"{args.requests} requests, upstream latency {args.latency}s, token latency {args.token_latency}s")
+    print(f"/query        full answer: {ms(blocking)}")
+    print(f"/query/stream first token: {ms(first_token)}")
+    print(f"/query/stream full answer: {ms(complete)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Synthetic design-paper PDFs, for benchmarking extraction and chunking without the real corpus.
+
+    python -m benchmarks.corpus --folder /tmp/corpus --files 40
+
+``pdfs/`` is stored in Git LFS; in a checkout without the LFS objects its
+files are pointers that cannot be opened. The papers written here have what
+the chunker looks for in the real ones: a table of contents, numbered section
+headings from ``SECTION_HEADINGS``, paragraphs of varying length,
+and some paragraphs (competition boilerplate) repeated across papers.
+"""
+
+import argparse
+import os
+import random
+from html import escape
+import fitz
+from src.chunking import SECTION_HEADINGS
+
+WORDS = ("hull concrete canoe mix aggregate cement binder fiber mesh reinforcement mold foam "
+         "paddler stability freeboard rocker beam draft density strength compressive tensile "
+         "flexural cylinder cure slump batch placement finishing sanding stain sealer gunwale "
+         "keel bow stern load shear moment analysis model testing schedule budget safety "
+         "quality team captain design construction sustainability recycled microspheres").split()
+BOILERPLATE = [
+    "All mixtures met the competition rules for cementitious materials, aggregates and "
+    "reinforcement, and every material used is listed in the technical data sheets in Appendix B.",
+    "The team thanks its faculty advisor, the department of civil engineering and its sponsors "
+    "for the materials, shop space and guidance that made this project possible.",
+]
+PAGE = fitz.paper_rect("letter")
+MARGINS = (54, 54, -54, -54)
+
+
+def _paragraph(rng):
+    sentences = []
+    for _ in range(rng.randint(3, 9)):
+        words = rng.choices(WORDS, k=rng.randint(8, 22))
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def paper_blocks(index, words=6000, seed=0):
+    """``(heading, paragraphs)`` blocks of synthetic paper ``index``, about ``words`` words long."""
+    rng = random.Random(seed * 100_003 + index)
+    headings = [f"{i}.0 {name}" for i, name in enumerate(SECTION_HEADINGS, 1)]
+    contents = [f"{heading} {'.' * 20} {2 + 3 * i}" for i, heading in enumerate(headings)]
+    blocks = [(f"Team {index} Concrete Canoe Design Paper", []), ("Table of Contents", contents)]
+    for heading in headings:
+        paragraphs, written = [], 0
+        while written < words // len(headings):
+            paragraph = rng.choice(BOILERPLATE) if rng.random() < 0.05 else _paragraph(rng)
+            paragraphs.append(paragraph)
+            written += len(paragraph.split())
+        blocks.append((heading, paragraphs))
+    return blocks
+
+
+def write_paper(path, blocks):
+    html = "".join(f"<h2>{escape(heading)}</h2>" + "".join(f"<p>{escape(p)}</p>" for p in paragraphs)
+                   for heading, paragraphs in blocks)
+    story = fitz.Story(html)
+    writer = fitz.DocumentWriter(path)
+    more = True
+    while more:
+        device = writer.begin_page(PAGE)
+        more, _ = story.place(PAGE + MARGINS)
+        story.draw(device)
+        writer.end_page()
+    writer.close()
+
+
+def write_corpus(folder, files, words=6000, seed=0):
+    """Write ``files`` synthetic papers to ``folder``; returns their paths."""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for index in range(files):
+        path = os.path.join(folder, f"synthetic-design-paper-{index:03d}.pdf")
+        write_paper(path, paper_blocks(index, words, seed))
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", required=True)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--words", type=int, default=6000, help="approximate words per paper")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = write_corpus(args.folder, args.files, args.words, args.seed)
+    print(f"Wrote {len(paths)} papers to {args.folder}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Concurrency and tail latency of the sync and async serving modes.
+
+    python -m benchmarks.load_test --requests 200 --concurrency 100
+
+Starts gunicorn with ``gunicorn.conf.py`` once per mode (``SERVING_MODE=sync``
+and ``SERVING_MODE=async``) against the local stand-ins, fires
+``--requests`` distinct questions at ``/query`` with ``--concurrency`` of them
+outstanding at once, and reports throughput, p50/p99 latency and the peak
+number of OpenAI requests in flight upstream. The answer and embedding
+caches are disabled so every request reaches the stand-ins.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from benchmarks import standins
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def wait_until_healthy(url, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}")
+        try:
+            if httpx.get(f"{url}/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become healthy within {timeout}s")
+
+
+async def fire(url, requests, concurrency):
+    """Send ``requests`` questions with at most ``concurrency`` outstanding."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=300.0) as client:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/query", json={
+                        "question": f"How was the hull of canoe {i} designed?",
+                        "session_id": f"load-{i}",
+                    })
+                    if response.status_code != 200:
+                        errors += 1
+                        return
+                except httpx.HTTPError:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def run_mode(mode, args, environment, openai_server, port):
+    url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, **environment, "SERVING_MODE": mode, "PORT": str(port),
+           "GUNICORN_WORKERS": str(args.workers)}
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "--access-logfile", "/dev/null"],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            wait_until_healthy(url, process)
+            openai_server.peak_in_flight = 0
+            latencies, errors, elapsed = asyncio.run(fire(url, args.requests, args.concurrency))
+        except Exception:
+            log.seek(0)
+            sys.stderr.write(log.read().decode("utf-8", "replace")[-4000:])
+            raise
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    return {
+        "mode": mode,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": statistics.median(latencies) if latencies else float("nan"),
+        "p99": percentile(latencies, 0.99) if latencies else float("nan"),
+        "errors": errors,
+        "peak_upstream": openai_server.peak_in_flight,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers in both modes")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds added to every upstream request")
+    parser.add_argument("--token-latency", type=float, default=0.05,
+                        help="seconds per generated chat token")
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--port", type=int, default=18000)
+    args = parser.parse_args()
+
+    with standins.openai_standin(latency=args.latency, token_latency=args.token_latency) as openai_server, \
+            standins.pinecone_standin(latency=args.latency) as pinecone_server:
+        standins.seed_pinecone(pinecone_server, ["Hull design and structural analysis of the concrete canoe."])
+        environment = {
+            **standins.standin_environment(openai_server, pinecone_server),
+            "ANSWER_CACHE_ENABLED": "false",
+            "EMBEDDING_CACHE_ENABLED": "false",
+        }
+        results = [run_mode(mode, args, environment, openai_server, args.port + i)
+                   for i, mode in enumerate(args.modes.split(","))]
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent, {args.workers} workers, "
+          f"upstream latency {args.latency}s, token latency {args.token_latency}s")
+    for result in results:
+        print(f"{result['mode']:>5}: {result['throughput']:7.1f} req/s  "
+              f"p50 {result['p50'] * 1000:8.1f} ms  p99 {result['p99'] * 1000:8.1f} ms  "
+              f"peak OpenAI in flight {result['peak_upstream']:4d}  errors {result['errors']}")
+
+
+if __name__ == "__main__":
+    main()
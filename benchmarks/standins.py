@@ -0,0 +1,414 @@
+"""Local stand-ins for the OpenAI and Pinecone HTTP APIs.
+
+The servers speak just enough of each API for the clients used in ``src/``
+(``openai``, ``langchain_openai`` and ``pinecone``) to work unchanged when
+pointed at them, which lets the benchmarks run fully offline:
+
+    OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+    PINECONE_INDEX_HOST=http://127.0.0.1:<port>
+    PINECONE_CONTROLLER_HOST=http://127.0.0.1:<port>
+
+Embeddings are a hashed bag of words, so texts sharing vocabulary get a
+high cosine similarity, and chat completions echo a short canned answer.
+``connect_latency`` is paid once per new TCP connection to model a TLS
+handshake; ``latency`` is paid on every request, ``token_latency`` per generated
+chat token (streamed or not) and ``prompt_latency`` per prompt token. ``peak_in_flight`` records the most
+requests a server was handling at once. Faults: ``error_rate`` of requests
+fail with a 429, and ``slow_rate`` of them stall ``slow_latency`` extra
+seconds (a latency tail); both can be changed while the server runs.
+"""
+
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DIMENSION = 1536
+_WORD = re.compile(r"[a-z0-9]+")
+_encoding = None
+
+
+def _decode_tokens(tokens):
+    global _encoding
+    if _encoding is None:
+        import tiktoken
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding.decode(tokens)
+
+
+def fake_embedding(text, dimension=DIMENSION):
+    """Deterministic unit vector for ``text`` (hashed bag of words)."""
+    vector = [0.0] * dimension
+    for word in _WORD.findall(text.lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        slot = int.from_bytes(digest[:4], "little") % dimension
+        vector[slot] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0:
+        vector[0], norm = 1.0, 1.0
+    return [v / norm for v in vector]
+
+
+def _normalize_inputs(value):
+    """Return the embedding input as a list of strings."""
+    if isinstance(value, str):
+        return [value]
+    if value and isinstance(value[0], int):
+        return [_decode_tokens(value)]
+    return [item if isinstance(item, str) else _decode_tokens(item) for item in value]
+
+
+class StandinServer(ThreadingHTTPServer):
+    """Threaded HTTP server with latency and fault injection knobs."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handler, latency=0.0, connect_latency=0.0, error_rate=0.0, token_latency=0.0,
+                 prompt_latency=0.0, slow_rate=0.0, slow_latency=0.0):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.prompt_latency = prompt_latency
+        self.connect_latency = connect_latency
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.counters = {}
+        self.connections = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._counter_lock = threading.Lock()
+        self._thread = None
+        self._fault_tick = 0
+        self._slow_tick = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, route):
+        with self._counter_lock:
+            self.counters[route] = self.counters.get(route, 0) + 1
+
+    def enter(self):
+        with self._counter_lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def leave(self):
+        with self._counter_lock:
+            self.in_flight -= 1
+
+    def should_fail(self):
+        """Deterministically fail ``error_rate`` of requests."""
+        if self.error_rate <= 0:
+            return False
+        with self._counter_lock:
+            self._fault_tick += 1
+            return (self._fault_tick * self.error_rate) % 1.0 < self.error_rate
+
+    def should_stall(self):
+        """Deterministically stall ``slow_rate`` of requests."""
+        if self.slow_rate <= 0:
+            return False
+        with self._counter_lock:
+            self._slow_tick += 1
+            return (self._slow_tick * self.slow_rate) % 1.0 < self.slow_rate
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server._counter_lock:
+            self.server.connections += 1
+        if self.server.connect_latency:
+            time.sleep(self.server.connect_latency)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method):
+        path = self.path.split("?", 1)[0]
+        route = self.routes.get((method, path))
+        if route is None:
+            for (route_method, prefix), handler in self.prefix_routes.items():
+                if route_method == method and path.startswith(prefix):
+                    route = handler
+                    break
+        if route is None:
+            self._send_json({"error": {"message": f"no route {method} {path}"}}, 404)
+            return
+        self.server.count(f"{method} {path}")
+        body = self._read_json() if method in ("POST", "PATCH") else {}
+        self.server.enter()
+        try:
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            if self.server.should_stall():
+                time.sleep(self.server.slow_latency)
+            if self.server.should_fail():
+                self._send_json(
+                    {"error": {"message": "injected fault", "type": "rate_limit_exceeded"}},
+                    429, {"Retry-After": "0"},
+                )
+                return
+            route(self, body)
+        finally:
+            self.server.leave()
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    routes = {}
+    prefix_routes = {}
+
+
+class OpenAIHandler(_Handler):
+    """``/v1/embeddings``, ``/v1/chat/completions`` and ``/v1/models``."""
+
+    answer = "Stand-in answer drawn from the retrieved concrete canoe design papers."
+
+    def embeddings(self, body):
+        texts = _normalize_inputs(body.get("input", ""))
+        dimension = body.get("dimensions") or DIMENSION
+        tokens = sum(len(text.split()) for text in texts)
+        self._send_json({
+            "object": "list",
+            "model": body.get("model", "text-embedding-ada-002"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text, dimension)}
+                for i, text in enumerate(texts)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def chat(self, body):
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+        if self.server.prompt_latency:
+            time.sleep(self.server.prompt_latency * prompt_tokens)
+        words = self.answer.split(" ")
+        created = int(time.time())
+        if self.server.token_latency and not body.get("stream"):
+            time.sleep(self.server.token_latency * len(words))
+        model = body.get("model", "gpt-3.5-turbo")
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            chunks = [{"role": "assistant", "content": ""}]
+            chunks += [{"content": (" " if i else "") + word} for i, word in enumerate(words)]
+            for delta in chunks:
+                if self.server.token_latency:
+                    time.sleep(self.server.token_latency)
+                event = {
+                    "id": "chatcmpl-standin", "object": "chat.completion.chunk",
+                    "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(event)}\n\n")
+            final = {
+                "id": "chatcmpl-standin", "object": "chat.completion.chunk",
+                "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            self._write_chunk(f"data: {json.dumps(final)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self._write_chunk("")
+            return
+        self._send_json({
+            "id": "chatcmpl-standin", "object": "chat.completion",
+            "created": created, "model": model,
+            "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": self.answer},
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(words),
+                "total_tokens": prompt_tokens + len(words),
+            },
+        })
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def models(self, body):
+        self._send_json({"object": "list", "data": [
+            {"id": "gpt-3.5-turbo", "object": "model", "created": 0, "owned_by": "standin"},
+        ]})
+
+    routes = {
+        ("POST", "/v1/embeddings"): embeddings,
+        ("POST", "/v1/chat/completions"): chat,
+        ("GET", "/v1/models"): models,
+    }
+
+
+class PineconeHandler(_Handler):
+    """Pinecone control plane (``/indexes``) and data plane for one index."""
+
+    index_name = "text-analyzer"
+
+    def _store(self):
+        return self.server.vectors
+
+    def _index_description(self):
+        return {
+            "name": self.index_name,
+            "dimension": DIMENSION,
+            "metric": "cosine",
+            "host": self.server.url,
+            "vector_type": "dense",
+            "deletion_protection": "disabled",
+            "spec": {"serverless": {"cloud": "aws", "region": "us-east-1"}},
+            "status": {"ready": True, "state": "Ready"},
+        }
+
+    def list_indexes(self, body):
+        self._send_json({"indexes": [self._index_description()]})
+
+    def describe_index(self, body):
+        self._send_json(self._index_description())
+
+    def create_index(self, body):
+        self._send_json(self._index_description(), 201)
+
+    def upsert(self, body):
+        store = self._store()
+        with self.server.store_lock:
+            for vector in body.get("vectors", []):
+                store[vector["id"]] = (vector["values"], vector.get("metadata") or {})
+        self._send_json({"upsertedCount": len(body.get("vectors", []))})
+
+    def delete(self, body):
+        store = self._store()
+        with self.server.store_lock:
+            if body.get("deleteAll"):
+                store.clear()
+            for vector_id in body.get("ids", []):
+                store.pop(vector_id, None)
+        self._send_json({})
+
+    def query(self, body):
+        query = body.get("vector") or []
+        top_k = body.get("topK", 10)
+        with self.server.store_lock:
+            items = list(self._store().items())
+        scored = sorted(
+            ((sum(a * b for a, b in zip(query, values)), vector_id, metadata)
+             for vector_id, (values, metadata) in items),
+            key=lambda item: item[0], reverse=True,
+        )[:top_k]
+        include_metadata = body.get("includeMetadata", False)
+        self._send_json({
+            "matches": [
+                {"id": vector_id, "score": score, "values": [],
+                 **({"metadata": metadata} if include_metadata else {})}
+                for score, vector_id, metadata in scored
+            ],
+            "namespace": body.get("namespace", ""),
+            "usage": {"readUnits": 1},
+        })
+
+    def describe_index_stats(self, body):
+        count = len(self._store())
+        self._send_json({
+            "namespaces": {"": {"vectorCount": count}},
+            "dimension": DIMENSION,
+            "indexFullness": 0.0,
+            "totalVectorCount": count,
+        })
+
+    routes = {
+        ("GET", "/indexes"): list_indexes,
+        ("POST", "/indexes"): create_index,
+        ("POST", "/vectors/upsert"): upsert,
+        ("POST", "/vectors/delete"): delete,
+        ("POST", "/query"): query,
+        ("POST", "/describe_index_stats"): describe_index_stats,
+        ("GET", "/describe_index_stats"): describe_index_stats,
+    }
+    prefix_routes = {("GET", "/indexes/"): describe_index}
+
+
+def openai_standin(**knobs):
+    """Create (but do not start) an OpenAI stand-in server."""
+    return StandinServer(OpenAIHandler, **knobs)
+
+
+def pinecone_standin(**knobs):
+    """Create (but do not start) a Pinecone stand-in server."""
+    server = StandinServer(PineconeHandler, **knobs)
+    server.vectors = {}
+    server.store_lock = threading.Lock()
+    return server
+
+
+def seed_pinecone(server, texts, source="standin.pdf"):
+    """Load ``texts`` into a Pinecone stand-in as ``<source>_chunk_<i>`` vectors."""
+    stem = source.split(".")[0]
+    with server.store_lock:
+        for i, text in enumerate(texts):
+            vector_id = f"{stem}_chunk_{i}"
+            server.vectors[vector_id] = (
+                fake_embedding(text),
+                {"id": vector_id, "source": source, "chunk": i, "text": text},
+            )
+
+
+def standin_environment(openai_server, pinecone_server):
+    """Environment variables that point ``src/`` at the given stand-ins."""
+    return {
+        "OPENAI_API_KEY": "sk-standin",
+        "PINECONE_API_KEY": "standin",
+        "OPENAI_BASE_URL": f"{openai_server.url}/v1",
+        "PINECONE_INDEX_HOST": pinecone_server.url,
+        "PINECONE_CONTROLLER_HOST": pinecone_server.url,
+    }
@@ -0,0 +1,292 @@
+"""Offline performance suite: /query, ingestion, PineconeStore.save_vectors and chunking.
+
+    python -m benchmarks.suite --files 10 --queries 200 --concurrency 8
+    python -m benchmarks.suite --baseline benchmarks/results/suite-<earlier>.json
+
+Everything runs against the local OpenAI and Pinecone stand-ins
+(``benchmarks/standins.py``), with ``--latency`` seconds added to every
+upstream request and ``--error-rate`` of them failing with a 429, so no
+network access or API keys are needed. Each scenario runs in a fresh
+interpreter so its peak RSS is its own:
+
+- ingest: ``load_pdfs_to_vectordb(incremental=False)`` over the first
+  ``--files`` PDFs of ``--folder``, into the Pinecone stand-in
+- save_vectors: ``PineconeStore.save_vectors`` with ``--upsert-rounds``
+  rounds of ``--upsert-vectors`` random vectors
+- chunking: ``Chunker.chunk`` over the same PDFs, timed per document
+- query: ``POST /query`` through the Flask test client, ``--concurrency``
+  requests at a time, over the index the ingest scenario built
+
+Without the Git LFS objects of ``pdfs/``, point ``--folder`` at papers
+written by ``python -m benchmarks.corpus``.
+
+Each scenario reports throughput, p50/p95/p99 latency, errors and peak RSS.
+Results are written as JSON to ``--output``; with ``--baseline`` each
+scenario is compared against an earlier run and the suite exits non-zero if
+throughput dropped or p95 latency grew by more than ``--tolerance``.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks import standins
+from benchmarks.load_test import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ["ingest", "save_vectors", "chunking", "query"]
+SEED_TEXTS = [
+    "Hull design and structural analysis of the concrete canoe.",
+    "The concrete mix used lightweight aggregate and glass microspheres.",
+    "Construction began with a CNC-cut foam mold and two layers of mesh reinforcement.",
+]
+
+
+def _peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
+
+
+def _pdf_paths(folder, files):
+    paths = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".pdf"))
+    return paths[:files]
+
+
+def _result(unit, count, seconds, latencies, errors=0, **extra):
+    own_mb, worker_mb = _peak_rss_mb()
+    return {
+        "throughput": round(count / seconds, 2) if seconds else 0.0,
+        "throughput_unit": unit,
+        "count": count,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "latency_ms": {
+            name: round(percentile(latencies, fraction) * 1000, 2) if latencies else None
+            for name, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+        },
+        "peak_rss_mb": round(own_mb, 1),
+        "peak_worker_rss_mb": round(worker_mb, 1),
+        **extra,
+    }
+
+
+# Scenarios (each runs in its own interpreter)
+
+def run_ingest(args):
+    from src.load_documents import load_pdfs_to_vectordb
+
+    # load_pdfs_to_vectordb reads ./pdfs, which the parent pointed at a
+    # folder holding just the selected files
+    started = time.perf_counter()
+    load_pdfs_to_vectordb(incremental=False, backend="pinecone")
+    seconds = time.perf_counter() - started
+    files = len(os.listdir("pdfs"))
+    # Whole-run latency only: ingestion is one pipelined pass, not per-file calls
+    return _result("files/s", files, seconds, [seconds])
+
+
+def run_save_vectors(args):
+    from src.vector_store import PineconeStore
+
+    store = PineconeStore()
+    rng = random.Random(0)
+    rounds = []
+    for r in range(args.upsert_rounds):
+        vectors = [[rng.uniform(-1, 1) for _ in range(standins.DIMENSION)] for _ in range(args.upsert_vectors)]
+        chunks = [f"Benchmark chunk {r}-{i} about hull design and mix testing." for i in range(args.upsert_vectors)]
+        rounds.append((vectors, chunks))
+
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for r, (vectors, chunks) in enumerate(rounds):
+        start = time.perf_counter()
+        report = store.save_vectors(vectors, {"id": f"bench{r}", "source": f"bench{r}.pdf"}, chunks)
+        latencies.append(time.perf_counter() - start)
+        errors += report.failed_vectors
+    seconds = time.perf_counter() - started
+    return _result("vectors/s", args.upsert_rounds * args.upsert_vectors, seconds, latencies, errors)
+
+
+def run_chunking(args):
+    from src.chunking import Chunker
+    from src.pdf_loader import iter_pdf_texts
+
+    documents = list(iter_pdf_texts(_pdf_paths(args.folder, args.files)))
+    chunker = Chunker()
+    tokens = sum(len(t) for t in chunker.encoding.encode_ordinary_batch([text for _, text in documents]))
+
+    latencies, chunks = [], 0
+    started = time.perf_counter()
+    for path, text in documents:
+        start = time.perf_counter()
+        chunks += len(chunker.chunk(text, source=os.path.basename(path)))
+        latencies.append(time.perf_counter() - start)
+    seconds = time.perf_counter() - started
+    return _result("tokens/s", tokens, seconds, latencies, documents=len(documents), chunks=chunks)
+
+
+def run_query(args):
+    import api
+
+    questions = [f"How was the hull of canoe {i} designed and what mix did it use?" for i in range(args.queries)]
+
+    def ask(question):
+        start = time.perf_counter()
+        response = api.app.test_client().post("/query", json={"question": question})
+        ok = response.status_code == 200 and response.get_json().get("status") == "success"
+        return time.perf_counter() - start, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(ask, questions))
+    seconds = time.perf_counter() - started
+    latencies = [latency for latency, ok in outcomes if ok]
+    return _result("requests/s", len(latencies), seconds, latencies,
+                   errors=len(outcomes) - len(latencies), concurrency=args.concurrency)
+
+
+RUNNERS = {"ingest": run_ingest, "save_vectors": run_save_vectors, "chunking": run_chunking, "query": run_query}
+
+
+# Orchestration
+
+def _scenario_environment(environment, data_dir):
+    return {
+        **os.environ,
+        **environment,
+        "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])),
+        "VECTOR_BACKEND": "pinecone",
+        "ANSWER_CACHE_ENABLED": "false",
+        "EMBEDDING_CACHE_ENABLED": "false",
+        "INGEST_MANIFEST_PATH": os.path.join(data_dir, "ingest_manifest.json"),
+        "LEXICAL_INDEX_DIR": os.path.join(data_dir, "lexical_index"),
+        "SESSION_STORE_PATH": os.path.join(data_dir, "sessions.sqlite"),
+    }
+
+
+def run_scenario(name, args, env, cwd):
+    command = [sys.executable, "-m", "benchmarks.suite", "--scenario", name,
+               "--folder", os.path.abspath(args.folder), "--files", str(args.files),
+               "--queries", str(args.queries), "--concurrency", str(args.concurrency),
+               "--upsert-rounds", str(args.upsert_rounds), "--upsert-vectors", str(args.upsert_vectors)]
+    completed = subprocess.run(command, cwd=cwd, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr[-4000:])
+        raise RuntimeError(f"scenario {name} failed with exit code {completed.returncode}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against ``baseline``; return the scenarios that regressed."""
+    regressions = []
+    for name, result in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        throughput = (result["throughput"] / before["throughput"] - 1) if before["throughput"] else 0.0
+        p95, p95_before = result["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        latency = (p95 / p95_before - 1) if p95 and p95_before else 0.0
+        regressed = throughput < -tolerance or latency > tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:>12}: throughput {throughput:+7.1%}  p95 {latency:+7.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--folder", default=os.path.join(ROOT, "pdfs"))
+    parser.add_argument("--files", type=int, default=10, help="PDFs used by ingest and chunking")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--upsert-rounds", type=int, default=20)
+    parser.add_argument("--upsert-vectors", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds added to every upstream request")
+    parser.add_argument("--token-latency", type=float, default=0.01,
+                        help="seconds per generated chat token")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of upstream requests that fail with a 429")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/suite-<time>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="relative throughput drop or p95 growth counted as a regression")
+    parser.add_argument("--scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(RUNNERS[args.scenario](args)))
+        return
+
+    knobs = {"latency": args.latency, "error_rate": args.error_rate}
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("scenario", "output", "baseline", "tolerance")},
+        "scenarios": {},
+    }
+    with standins.openai_standin(token_latency=args.token_latency, **knobs) as openai_server, \
+            standins.pinecone_standin(**knobs) as pinecone_server, \
+            tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "pdfs"))
+        for path in _pdf_paths(args.folder, args.files):
+            os.symlink(os.path.abspath(path), os.path.join(workdir, "pdfs", os.path.basename(path)))
+        env = _scenario_environment(standins.standin_environment(openai_server, pinecone_server),
+                                    os.path.join(workdir, "data"))
+
+        for name in args.scenarios.split(","):
+            if name == "query" and not pinecone_server.vectors:
+                standins.seed_pinecone(pinecone_server, SEED_TEXTS)
+            requests_before = dict(openai_server.counters)
+            vectors_before = set(pinecone_server.vectors)
+            result = run_scenario(name, args, env, workdir)
+            if name == "save_vectors":
+                # The stand-in searches by brute force: its random vectors
+                # would make the query scenario measure the stand-in
+                with pinecone_server.store_lock:
+                    for vector_id in set(pinecone_server.vectors) - vectors_before:
+                        del pinecone_server.vectors[vector_id]
+            result["upstream_requests"] = {
+                route: count - requests_before.get(route, 0)
+                for route, count in openai_server.counters.items() if count != requests_before.get(route, 0)
+            }
+            results["scenarios"][name] = result
+            latency = result["latency_ms"]
+            print(f"{name:>12}: {result['throughput']:10.1f} {result['throughput_unit']:<10}  "
+                  f"p50 {latency['p50']} ms  p95 {latency['p95']} ms  p99 {latency['p99']} ms  "
+                  f"errors {result['errors']}  peak RSS {result['peak_rss_mb']} MB")
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results",
+                                         f"suite-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(f"Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,21 @@ bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
 backlog = 2048
 
 workers = int(os.environ.get('GUNICORN_WORKERS', 4))
-worker_class = "sync"
+
+# "sync": Flask app (wsgi.py) on threaded workers, blocking calls per request.
+# "async": ASGI app (asgi.py) on uvicorn workers, many requests per worker.
+# Either way src/admission.py bounds the questions a worker runs and queues;
+# sync workers get threads for those plus a few spare to answer 429s and
+# /health, so a spike is shed instead of waiting unseen in the backlog.
+serving_mode = os.environ.get('SERVING_MODE', 'sync').lower()
+if serving_mode == "async":
+    worker_class = "uvicorn_worker.UvicornWorker"
+    wsgi_app = "asgi:app"
+else:
+    from src import config
+    worker_class = "gthread"
+    threads = int(os.environ.get('GUNICORN_THREADS', config.ADMISSION_MAX_CONCURRENCY + config.ADMISSION_MAX_QUEUE + 4))
+    wsgi_app = "wsgi:app"
 worker_connections = 1000
 timeout = 30
 keepalive = 2
@@ -29,6 +43,12 @@ preload_app = True
 
 graceful_timeout = 30
 
+def on_starting(server):
+    """Called just before the master process is initialized."""
+    # Per-worker metrics files from a previous run would be counted again
+    from src import metrics
+    metrics.clear()
+
 def when_ready(server):
     """Called just after the server is started."""
     server.log.info("PaddlePrompt API server is ready. Listening on: %s", server.address)
@@ -43,4 +63,22 @@ def pre_fork(server, worker):
 
 def post_fork(server, worker):
     """Called just after a worker has been forked."""
-    pass 
\ No newline at end of file
+    # Build the chains and open pooled upstream connections once per worker,
+    # so requests reuse them instead of paying setup and TLS handshakes. It
+    # runs in the background: /health answers at once, /ready once warmed.
+    try:
+        from src import readiness, registry
+        registry.reset()
+        readiness.start_warm_up()
+        worker.log.info("Worker %s warming QA chains", worker.pid)
+    except Exception as e:
+        worker.log.warning("Worker %s could not start warming QA chains: %s", worker.pid, e)
+
+def child_exit(server, worker):
+    """Called in the master just after a worker has exited."""
+    # Keep the exited worker's counts in /metrics without keeping its file
+    try:
+        from src import metrics
+        metrics.retire(worker.pid)
+    except Exception as e:
+        server.log.warning("Could not retire metrics of worker %s: %s", worker.pid, e)
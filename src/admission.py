@@ -0,0 +1,220 @@
+"""Admission control for the query endpoints: a bounded concurrency limit and wait queue per worker.
+
+Without it, a traffic spike piles up in the listen backlog until requests
+time out or their worker is killed, and users see generic errors. Each
+worker now admits at most ``ADMISSION_MAX_CONCURRENCY`` questions at once.
+Up to ``ADMISSION_MAX_QUEUE`` more wait in line, and the rest are rejected
+at once with :class:`Rejected`, which the handlers turn into a 429 with
+``Retry-After``:
+
+* ``queue_full``: the wait queue is full;
+* ``deadline``: the estimated queue wait plus service time (an
+  exponentially weighted average of recent questions) exceeds the
+  request's timeout, so the answer would come too late to be used;
+* ``expired``: the request waited in line past its timeout.
+
+The timeout is ``ADMISSION_TIMEOUT`` seconds, or less if the client sends
+an ``X-Request-Timeout`` header. With ``ADMISSION_PRIORITIZE_SHORT``,
+questions of at most ``ADMISSION_SHORT_QUESTION_WORDS`` words are served
+first; otherwise the queue is FIFO.
+
+``/query/stream`` is admitted like ``/query``. A ``/query/batch`` request
+holds one slot per question it answers at once (up to
+``BATCH_MAX_CONCURRENCY``, and never more than the whole limit), so a batch
+cannot bypass the limit but still fits in it.
+
+Sync and async handlers share one :class:`AdmissionController`. Sync waiters
+block on an event, async ones await a future, and slots freed by either
+go to the head of the queue. Queue depth and questions in flight are
+exported as worker gauges, rejections as
+``paddleprompt_admission_rejections_total{reason}``, and the wait as the
+``admission_wait`` stage.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from src import config, metrics, registry
+
+TIMEOUT_HEADER = "X-Request-Timeout"
+_SMOOTHING = 0.2
+
+
+class Rejected(Exception):
+    """A request turned away before it ran; answer 429 with ``Retry-After``."""
+
+    def __init__(self, reason, retry_after):
+        self.reason = reason
+        self.retry_after = retry_after
+        self.message = {
+            "queue_full": "Server is busy, please retry shortly",
+            "deadline": "Server is too busy to answer within the request timeout",
+            "expired": "Request timed out waiting to be served",
+        }[reason]
+        super().__init__(self.message)
+
+
+def request_timeout(headers):
+    """Seconds the client will wait: ``X-Request-Timeout`` capped at ``ADMISSION_TIMEOUT``."""
+    try:
+        timeout = float(headers.get(TIMEOUT_HEADER) or config.ADMISSION_TIMEOUT)
+    except ValueError:
+        return config.ADMISSION_TIMEOUT
+    return min(timeout, config.ADMISSION_TIMEOUT) if timeout > 0 else config.ADMISSION_TIMEOUT
+
+
+class _Waiter:
+    def __init__(self, priority, sequence, weight, wake):
+        self.key = (priority, sequence)
+        self.weight = weight
+        self.wake = wake
+        self.granted = False
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded, optionally prioritized wait queue."""
+
+    def __init__(self, max_concurrency=config.ADMISSION_MAX_CONCURRENCY, max_queue=config.ADMISSION_MAX_QUEUE,
+                 prioritize_short=config.ADMISSION_PRIORITIZE_SHORT,
+                 short_words=config.ADMISSION_SHORT_QUESTION_WORDS,
+                 service_seconds=config.ADMISSION_INITIAL_SERVICE_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.prioritize_short = prioritize_short
+        self.short_words = short_words
+        self.service_seconds = service_seconds
+        self.in_flight = 0  # slots taken
+        self._waiting = []  # heap of _Waiter
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def priority(self, question):
+        if self.prioritize_short and len(question.split()) > self.short_words:
+            return 1
+        return 0
+
+    def estimated_wait(self, ahead, weight=1):
+        """Seconds until a request needing ``weight`` slots, with waiters holding
+        ``ahead`` slots before it, gets them."""
+        if self.in_flight + weight <= self.max_concurrency:
+            return 0.0
+        return (ahead + weight) / self.max_concurrency * self.service_seconds
+
+    def retry_after(self):
+        """Whole seconds until the queue has room again, at least 1."""
+        return max(1, math.ceil(self.estimated_wait(sum(waiter.weight for waiter in self._waiting))))
+
+    def _enter(self, question, timeout, weight, wake):
+        """Take the slots (``None``), join the queue (the waiter) or raise :class:`Rejected`."""
+        with self._lock:
+            if self.in_flight + weight <= self.max_concurrency and not self._waiting:
+                self.in_flight += weight
+                self._publish()
+                return None
+            if len(self._waiting) >= self.max_queue:
+                self._reject("queue_full")
+            waiter = _Waiter(self.priority(question), next(self._sequence), weight, wake)
+            ahead = sum(other.weight for other in self._waiting if other < waiter)
+            if self.estimated_wait(ahead, weight) + self.service_seconds > timeout:
+                self._reject("deadline")
+            heapq.heappush(self._waiting, waiter)
+            self._publish()
+            return waiter
+
+    def _settle(self, waiter):
+        """After a wait ends: whether the waiter got a slot; if not, leave the queue."""
+        with self._lock:
+            if not waiter.granted:
+                self._waiting.remove(waiter)
+                heapq.heapify(self._waiting)
+                self._publish()
+            return waiter.granted
+
+    def _release(self, weight, seconds=None):
+        with self._lock:
+            if seconds is not None:
+                self.service_seconds += _SMOOTHING * (seconds - self.service_seconds)
+            self.in_flight -= weight
+            # Strictly in order: a batch at the head is not overtaken by single questions
+            while self._waiting and self.in_flight + self._waiting[0].weight <= self.max_concurrency:
+                waiter = heapq.heappop(self._waiting)
+                waiter.granted = True
+                self.in_flight += waiter.weight
+                waiter.wake()
+            self._publish()
+            idle = not self.in_flight and not self._waiting
+        if idle:
+            # An idle worker may not finish another request for a while
+            metrics.flush(force=True)
+
+    def _reject(self, reason):
+        metrics.count("paddleprompt_admission_rejections_total", reason=reason)
+        raise Rejected(reason, self.retry_after())
+
+    def _publish(self):
+        metrics.set_gauge("paddleprompt_admission_queue_depth", len(self._waiting))
+        metrics.set_gauge("paddleprompt_admission_in_flight", self.in_flight)
+
+    @contextmanager
+    def admit(self, question, timeout=config.ADMISSION_TIMEOUT, weight=1):
+        """Hold ``weight`` slots for the enclosed block, waiting in line for them if needed.
+
+        Only single questions (``weight`` 1) update the service time estimate.
+        """
+        weight = max(1, min(weight, self.max_concurrency))
+        started = time.monotonic()
+        event = threading.Event()
+        waiter = self._enter(question, timeout, weight, event.set)
+        if waiter is not None:
+            with metrics.stage("admission_wait"):
+                event.wait(timeout)
+            if not self._settle(waiter):
+                self._reject("expired")
+        admitted = time.monotonic()
+        try:
+            yield admitted - started
+        finally:
+            self._release(weight, time.monotonic() - admitted if weight == 1 else None)
+
+    @asynccontextmanager
+    async def aadmit(self, question, timeout=config.ADMISSION_TIMEOUT, weight=1):
+        """Async :meth:`admit`."""
+        weight = max(1, min(weight, self.max_concurrency))
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enter(question, timeout, weight, wake)
+        if waiter is not None:
+            try:
+                with metrics.stage("admission_wait"):
+                    await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                pass
+            except BaseException:
+                # Cancelled (the client went away): give back a slot granted meanwhile
+                if self._settle(waiter):
+                    self._release(weight)
+                raise
+            if not self._settle(waiter):
+                self._reject("expired")
+        admitted = time.monotonic()
+        try:
+            yield admitted - started
+        finally:
+            self._release(weight, time.monotonic() - admitted if weight == 1 else None)
+
+
+def get_admission_controller():
+    """This process's admission controller."""
+    return registry.get_or_create("admission_controller", AdmissionController)
@@ -0,0 +1,156 @@
+"""In-process cache of answers to previously asked questions.
+
+Two tiers sit in front of the RAG chain:
+
+* exact: keyed on the normalized question plus a digest of the conversation
+  history, so the same follow-up in the same conversation is a hit but the
+  same words after a different conversation are not;
+* semantic: for questions asked without history only, a new question whose
+  embedding is within ``similarity`` cosine of a cached question reuses
+  that answer. Follow-ups are never matched semantically because their
+  meaning depends on the conversation.
+
+Entries expire after ``ttl`` seconds and the least recently used entry is
+dropped once ``max_entries`` is reached (``ANSWER_CACHE_*`` in
+``src/config.py``).
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from src import config
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+
+
+def normalize_question(question):
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return _TRAILING_PUNCTUATION.sub("", _WHITESPACE.sub(" ", question.strip().lower()))
+
+
+def history_key(conversation_history):
+    """Digest of a conversation history; empty string when there is none."""
+    if not conversation_history:
+        return ""
+    digest = hashlib.sha256()
+    for message in conversation_history:
+        digest.update(message["role"].encode("utf-8") + b"\0")
+        digest.update(_WHITESPACE.sub(" ", message["content"].strip()).encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, max_entries=config.ANSWER_CACHE_MAX_ENTRIES, ttl=config.ANSWER_CACHE_TTL,
+                 similarity=config.ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (answer, created_at, embedding or None)
+        self._lock = threading.Lock()
+
+    def _expired(self, created_at, now):
+        return now - created_at > self.ttl
+
+    def get(self, question, conversation_history, embed=None):
+        """Return ``(answer, tier)`` for a hit or ``(None, None)`` for a miss.
+
+        ``embed`` is called with the question to get its embedding, and only
+        when the exact tier misses on a question without history.
+        """
+        key, now = self._key(question, conversation_history), time.time()
+        hit = self._get_exact(key, now)
+        if hit is not None:
+            return hit
+        if not self._wants_embedding(key, embed):
+            return self._miss()
+        return self._get_semantic(embed(question), now)
+
+    async def aget(self, question, conversation_history, embed=None):
+        """:meth:`get` with an async ``embed``."""
+        key, now = self._key(question, conversation_history), time.time()
+        hit = self._get_exact(key, now)
+        if hit is not None:
+            return hit
+        if not self._wants_embedding(key, embed):
+            return self._miss()
+        return self._get_semantic(await embed(question), now)
+
+    def _key(self, question, conversation_history):
+        return normalize_question(question), history_key(conversation_history)
+
+    def _get_exact(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._entries.move_to_end(key)
+                    self.exact_hits += 1
+                    return entry[0], "exact"
+                del self._entries[key]
+        return None
+
+    def _wants_embedding(self, key, embed):
+        return not key[1] and embed is not None and self._has_semantic_entries()
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    def _get_semantic(self, embedding, now):
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        with self._lock:
+            candidates = [(k, entry) for k, entry in self._entries.items()
+                          if entry[2] is not None and not self._expired(entry[1], now)]
+            if candidates:
+                matrix = np.stack([entry[2] for _, entry in candidates])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity:
+                    best_key, best_entry = candidates[best]
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return best_entry[0], "semantic"
+            self.misses += 1
+        return None, None
+
+    def _has_semantic_entries(self):
+        with self._lock:
+            return any(entry[2] is not None for entry in self._entries.values())
+
+    def put(self, question, conversation_history, answer, embedding=None):
+        """Cache an answer; ``embedding`` enables semantic matches for history-less questions."""
+        key = self._key(question, conversation_history)
+        vector = None
+        if embedding is not None and not key[1]:
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+        with self._lock:
+            self._entries[key] = (answer, time.time(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            }
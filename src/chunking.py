@@ -0,0 +1,192 @@
+"""Token-bounded, structure-aware chunking shared by ingestion and ``EmbeddingGenerator``.
+
+A document is split at the section headings of a design paper or proposal
+(the ones ``notebooks/training_script.ipynb`` extracts: "Executive
+Summary", "Hull Design and Structural Analysis", "Construction", ...) and
+then at paragraph boundaries (blank lines). Paragraphs are packed into
+chunks of at most ``chunk_size`` tokens; a paragraph that does not fit on its own is split by
+line and, failing that, by token window. Each chunk after the first in a
+section starts with the last ``overlap`` tokens of the one before, so a
+sentence cut at a chunk boundary is still retrievable. Chunks never span a
+section heading, except that a section too short to stand alone is kept
+with what follows.
+
+The tokenizer is built once per process (:func:`get_encoding`) and all
+paragraphs of a batch of documents are encoded in one threaded
+``encode_ordinary_batch`` call. Chunk ids are ``<file stem>_chunk_<n>``,
+so rechunking the same text with the same settings yields the same ids.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+import tiktoken
+from src import config
+
+ENCODING_NAME = "cl100k_base"
+# Bump when the splitting rules change so the ingest manifest re-chunks
+CHUNKER_VERSION = 1
+
+SECTION_HEADINGS = {
+    "Executive Summary": r"executive summary",
+    "Project and Quality Management": r"project (?:and quality )?management|quality management",
+    "Hull Design and Structural Analysis": r"hull design(?: and structural analysis)?|structural analysis",
+    "Development and Testing": r"development and testing|mix(?:ture)? development|testing",
+    "Construction": r"construction",
+}
+# A short line that starts with a capitalized heading, optionally numbered
+# ("2.0 Hull Design"); a lowercase word after it means running text
+_HEADING = re.compile(
+    r"^(?:\d+(?:\.\d+)*\.?\s+)?(?i:"
+    + "|".join(f"(?P<h{i}>{pattern})" for i, pattern in enumerate(SECTION_HEADINGS.values()))
+    + r")\b(?:\s*$|\s*[:&(\-\u2013]|\s+[A-Z0-9])"
+)
+_TABLE_OF_CONTENTS = re.compile(r"\.{3,}|\s\d+$")
+_SECTION_NAMES = list(SECTION_HEADINGS)
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name=ENCODING_NAME):
+    """The process-wide ``tiktoken`` encoder for ``name``."""
+    return tiktoken.get_encoding(name)
+
+
+def chunk_id(source, index):
+    return f"{os.path.splitext(os.path.basename(source))[0]}_chunk_{index}"
+
+
+def section_of(line):
+    """Canonical section name if ``line`` is a section heading, else ``None``."""
+    line = line.strip()
+    if len(line) > 80 or _TABLE_OF_CONTENTS.search(line):
+        return None
+    match = _HEADING.match(line)
+    if match is None:
+        return None
+    group, value = next((group, value) for group, value in match.groupdict().items() if value)
+    if not value[0].isupper():
+        return None
+    return _SECTION_NAMES[int(group[1:])]
+
+
+@dataclass
+class Chunk:
+    id: str
+    index: int
+    text: str
+    section: str
+    tokens: int
+
+
+def _paragraphs(text):
+    """Split ``text`` into ``(section, paragraph)`` pairs; headings start a new section."""
+    section = None
+    paragraphs = []
+    for block in _PARAGRAPH_BREAK.split(text):
+        lines = []
+        for line in block.split("\n"):
+            heading = section_of(line)
+            if heading is None:
+                lines.append(line)
+                continue
+            if "\n".join(lines).strip():
+                paragraphs.append((section, "\n".join(lines).strip()))
+            section, lines = heading, [line]
+        if "\n".join(lines).strip():
+            paragraphs.append((section, "\n".join(lines).strip()))
+    return paragraphs
+
+
+class Chunker:
+    """Split documents into overlapping chunks of at most ``chunk_size`` tokens."""
+
+    def __init__(self, chunk_size=config.CHUNK_SIZE_TOKENS, overlap=config.CHUNK_OVERLAP_TOKENS,
+                 encoding_name=ENCODING_NAME, encode_threads=config.ENCODE_THREADS):
+        if not 0 <= overlap < chunk_size:
+            raise ValueError("overlap must be at least 0 and smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.encoding_name = encoding_name
+        self.encoding = get_encoding(encoding_name)
+        self.encode_threads = encode_threads
+
+    @property
+    def params(self):
+        """Everything that changes the chunks produced, for the ingest manifest."""
+        return {"chunk_size": self.chunk_size, "chunk_overlap": self.overlap,
+                "chunker": CHUNKER_VERSION, "encoding": self.encoding_name}
+
+    def _encode(self, texts):
+        return self.encoding.encode_ordinary_batch(texts, num_threads=self.encode_threads)
+
+    def chunk(self, text, source="document"):
+        """Chunks of one document."""
+        return self.chunk_many([(source, text)])[0]
+
+    def chunk_many(self, documents):
+        """Chunk ``[(source, text), ...]``, encoding every paragraph in one batch."""
+        split = [_paragraphs(text) for _, text in documents]
+        flat = [paragraph for paragraphs in split for _, paragraph in paragraphs]
+        encoded = iter(self._encode(flat))
+        return [
+            self._pack(source, [(section, paragraph, next(encoded)) for section, paragraph in paragraphs])
+            for (source, _), paragraphs in zip(documents, split)
+        ]
+
+    def _pieces(self, paragraph, tokens):
+        """``(text, tokens, separator)`` pieces of one paragraph, each within ``chunk_size``."""
+        if len(tokens) <= self.chunk_size:
+            return [(paragraph, tokens, "\n\n")]
+        lines = [line for line in paragraph.split("\n") if line.strip()]
+        # One paragraph's lines are too few to pay for a thread pool per call
+        encoded = [self.encoding.encode_ordinary(line) for line in lines]
+        if all(len(line_tokens) <= self.chunk_size for line_tokens in encoded):
+            pieces = [(line, line_tokens, "\n") for line, line_tokens in zip(lines, encoded)]
+            pieces[0] = (lines[0], encoded[0], "\n\n")
+            return pieces
+        # Overlapping token windows, which carry their own overlap
+        pieces = []
+        for start in range(0, len(tokens), self.chunk_size - self.overlap):
+            window = tokens[start:start + self.chunk_size]
+            pieces.append((self.encoding.decode(window), window, "\n\n" if not pieces else " "))
+            if start + self.chunk_size >= len(tokens):
+                break
+        return pieces
+
+    def _pack(self, source, paragraphs):
+        chunks = []
+        current, used, carried, section = [], 0, 0, None
+        min_tokens = self.chunk_size // 8
+
+        def emit():
+            text = current[0][0] + "".join(separator + piece for piece, _, separator in current[1:])
+            chunks.append(Chunk(chunk_id(source, len(chunks)), len(chunks), text, section, used))
+
+        def overlap_tail():
+            # The last ``overlap`` tokens of the chunk just emitted, as one piece
+            tokens = [token for _, piece_tokens, _ in current for token in piece_tokens][-self.overlap:]
+            return [(self.encoding.decode(tokens), tokens, "")] if self.overlap else []
+
+        for paragraph_section, paragraph, tokens in paragraphs:
+            if paragraph_section != section:
+                # A new section starts a new chunk, without overlap, unless
+                # the chunk so far is too short to stand alone
+                if len(current) > carried and used >= min_tokens:
+                    emit()
+                if len(current) == carried or used >= min_tokens:
+                    current, used, carried = [], 0, 0
+                section = paragraph_section
+            for piece in self._pieces(paragraph, tokens):
+                if current and used + 1 + len(piece[1]) > self.chunk_size:
+                    emit()
+                    current = overlap_tail()
+                    if current and len(current[0][1]) + 1 + len(piece[1]) > self.chunk_size:
+                        current = []
+                    used, carried = (len(current[0][1]), 1) if current else (0, 0)
+                used += len(piece[1]) + (1 if current else 0)
+                current.append(piece)
+        if len(current) > carried:
+            emit()
+        return chunks
@@ -0,0 +1,230 @@
+"""Single-flight coalescing of identical questions that are in flight at the same time.
+
+When a class gets the same assignment, dozens of identical questions arrive
+within seconds. Without coalescing, each one pays for its own embedding,
+vector search and completion, and none finishes in time to fill the answer
+cache for the others. :class:`SingleFlight` lets the first request for a key
+(the normalized question plus a digest of the history, as in the answer
+cache) run the pipeline. Identical requests arriving while it runs wait for
+it and get its result:
+
+* within a worker, followers wait on the leader's in-process flight;
+* across the gunicorn workers of a host, the leader holds an exclusive
+  ``flock`` on ``COALESCE_DIR/<key>.lock`` and writes its result to
+  ``<key>.json`` before releasing it. Followers in other workers poll for a
+  result that finished after they arrived. If the leader fails they run
+  the pipeline themselves.
+
+A follower waits at most ``COALESCE_WAIT_TIMEOUT`` seconds, or less when
+its request's deadline (``src/resilience.py``) is closer, and then runs
+the pipeline itself, so a stuck leader cannot hold it past the point its
+client gave up. Followers also run it themselves when the leader fails,
+rather than inheriting an error that may have been transient or caused by
+the leader's own deadline. Results the ``share`` predicate rejects
+(degraded answers) are not handed to followers either; they answer for
+themselves.
+
+Coalesced requests are counted in ``paddleprompt_coalesced_requests_total``
+by scope (``worker`` or ``host``), and their wait is timed as the
+``coalesce_wait`` stage.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from src import config, metrics, resilience
+from src.answer_cache import history_key, normalize_question
+
+# Lock files are removed after an hour unused
+_LOCK_TTL = 3600
+_CLEANUP_INTERVAL = 60
+
+
+def flight_key(question, conversation_history):
+    """Key shared by questions that would get the same answer."""
+    digest = hashlib.sha256(normalize_question(question).encode("utf-8"))
+    digest.update(b"\0" + history_key(conversation_history).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Share one run of a function among concurrent calls with the same key.
+
+    ``encode`` and ``decode`` turn a result into JSON-serializable data and
+    back, for followers in other processes. Results for which ``share``
+    returns false are kept by the call that produced them.
+    """
+
+    def __init__(self, encode, decode, share=None, directory=config.COALESCE_DIR,
+                 wait_timeout=config.COALESCE_WAIT_TIMEOUT, poll_interval=config.COALESCE_POLL_INTERVAL,
+                 result_ttl=config.COALESCE_RESULT_TTL):
+        self.encode = encode
+        self.decode = decode
+        self.share = share or (lambda result: True)
+        self.directory = directory
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self._flights = {}  # key -> _Flight
+        self._tasks = {}    # key -> asyncio.Task
+        self._lock = threading.Lock()
+        self._cleaned_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    # Within the process
+
+    def run(self, key, fn):
+        """Return ``fn()``, or the result of an identical call already in flight."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            with metrics.stage("coalesce_wait"):
+                finished = flight.done.wait(self._wait_limit())
+            # A failed leader's error may be transient or its own deadline's; try again
+            if not finished or flight.error is not None or not self.share(flight.result):
+                return fn()
+            metrics.count("paddleprompt_coalesced_requests_total", scope="worker")
+            return flight.result
+
+        try:
+            flight.result = self._run_across_processes(key, fn)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def arun(self, key, afn):
+        """Async :meth:`run`; ``afn`` returns an awaitable.
+
+        The flight runs as its own task, so a leader whose client goes away
+        does not cancel it for the followers.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._arun_across_processes(key, afn))
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._tasks.pop(key, None) if self._tasks.get(key) is done else None)
+            return await asyncio.shield(task)
+        try:
+            with metrics.stage("coalesce_wait"):
+                result = await asyncio.wait_for(asyncio.shield(task), self._wait_limit())
+        except Exception:
+            # Timed out, or the leader failed: answer under our own deadline
+            return await afn()
+        if not self.share(result):
+            return await afn()
+        metrics.count("paddleprompt_coalesced_requests_total", scope="worker")
+        return result
+
+    def _wait_limit(self):
+        """Seconds a follower may wait: ``wait_timeout``, or what is left of its deadline."""
+        left = resilience.remaining()
+        if left is None:
+            return self.wait_timeout
+        return max(0.0, min(self.wait_timeout, left))
+
+    # Across the host's workers
+
+    def _run_across_processes(self, key, fn):
+        arrived, deadline = time.time(), time.monotonic() + self._wait_limit()
+        with open(self._path(key, "lock"), "a+") as lock_file:
+            state, result = self._attempt(lock_file, key, arrived)
+            if state == "wait":
+                with metrics.stage("coalesce_wait"):
+                    while state == "wait" and time.monotonic() < deadline:
+                        time.sleep(self.poll_interval)
+                        state, result = self._attempt(lock_file, key, arrived)
+            if state == "result":
+                return result
+            value = fn()
+            if self.share(value):
+                self._write_result(key, value)
+            return value
+
+    async def _arun_across_processes(self, key, afn):
+        arrived, deadline = time.time(), time.monotonic() + self._wait_limit()
+        with open(self._path(key, "lock"), "a+") as lock_file:
+            state, result = self._attempt(lock_file, key, arrived)
+            if state == "wait":
+                with metrics.stage("coalesce_wait"):
+                    while state == "wait" and time.monotonic() < deadline:
+                        await asyncio.sleep(self.poll_interval)
+                        state, result = self._attempt(lock_file, key, arrived)
+            if state == "result":
+                return result
+            value = await afn()
+            if self.share(value):
+                self._write_result(key, value)
+            return value
+
+    def _attempt(self, lock_file, key, arrived):
+        """``("result", value)`` when another worker answered since we arrived,
+        ``("lead", None)`` once we hold the lock, else ``("wait", None)``."""
+        result = self._read_result(key, arrived)
+        if result is not None:
+            metrics.count("paddleprompt_coalesced_requests_total", scope="host")
+            return "result", result
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return "wait", None
+        # The leader may have finished between the read and the lock
+        result = self._read_result(key, arrived)
+        if result is not None:
+            metrics.count("paddleprompt_coalesced_requests_total", scope="host")
+            return "result", result
+        os.utime(lock_file.fileno())
+        return "lead", None
+
+    def _path(self, key, kind):
+        return os.path.join(self.directory, f"{key}.{kind}")
+
+    def _read_result(self, key, arrived):
+        try:
+            with open(self._path(key, "json"), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if data["finished_at"] < arrived:
+            return None
+        return self.decode(data["result"])
+
+    def _write_result(self, key, value):
+        path = self._path(key, "json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"finished_at": time.time(), "result": self.encode(value)}, f)
+        os.replace(tmp_path, path)
+        self._cleanup()
+
+    def _cleanup(self):
+        now = time.time()
+        if now - self._cleaned_at < _CLEANUP_INTERVAL:
+            return
+        self._cleaned_at = now
+        for entry in os.listdir(self.directory):
+            path = os.path.join(self.directory, entry)
+            ttl = _LOCK_TTL if entry.endswith(".lock") else self.result_ttl
+            try:
+                if now - os.path.getmtime(path) > ttl:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
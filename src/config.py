@@ -0,0 +1,183 @@
+"""Runtime configuration shared by the API and the ingestion scripts."""
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "sync" (Flask on threaded gunicorn workers) or "async" (asgi.py on uvicorn workers)
+SERVING_MODE = os.getenv("SERVING_MODE", "sync").lower()
+
+# Vector store backend: "pinecone" or "local" (see src/local_index.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+
+# Pinecone
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "text-analyzer")
+PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST", "")  # skips describe_index when set
+PINECONE_CONTROLLER_HOST = os.getenv("PINECONE_CONTROLLER_HOST", "")
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", 4))
+PINECONE_POOL_MAXSIZE = int(os.getenv("PINECONE_POOL_MAXSIZE", 20))
+
+# OpenAI
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", 1536))
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-3.5-turbo")
+
+# Pooled HTTP connections for the OpenAI clients; an async worker keeps many
+# more requests in flight than a sync one, so it gets a larger pool
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 200 if SERVING_MODE == "async" else 20))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 100 if SERVING_MODE == "async" else 10))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 120))
+
+# Local vector index backend (see src/local_index.py)
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "./data/local_index")
+
+# Ingestion: PDF text extraction, with OCR of scanned pages (see src/pdf_loader.py)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", os.cpu_count() or 1))
+OCR_ENABLED = os.getenv("OCR_ENABLED", "true").lower() == "true"
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+OCR_DPI = int(os.getenv("OCR_DPI", 300))
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+OCR_MIN_CHARS = int(os.getenv("OCR_MIN_CHARS", 25))  # pages with less text are OCRed
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "./data/ocr_cache")
+
+# Ingestion: chunking (see src/chunking.py)
+CHUNK_SIZE_TOKENS = int(os.getenv("CHUNK_SIZE_TOKENS", 800))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 100))
+ENCODE_THREADS = int(os.getenv("ENCODE_THREADS", 8))
+
+# Ingestion: near-duplicate chunks are not embedded (see src/dedup.py)
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.85))  # estimated Jaccard similarity
+DEDUP_SHINGLE_WORDS = int(os.getenv("DEDUP_SHINGLE_WORDS", 5))
+DEDUP_PERMUTATIONS = int(os.getenv("DEDUP_PERMUTATIONS", 128))
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", 16))
+
+# Ingestion: embedding requests (see src/embedding.py), within the per-request
+# limits of the embeddings endpoint with some headroom
+EMBEDDING_BATCH_ITEMS = int(os.getenv("EMBEDDING_BATCH_ITEMS", 512))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", 200_000))
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_MAX_IN_FLIGHT", 4))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 8))
+# Chunks queued across files before they are embedded together
+EMBED_FLUSH_CHUNKS = int(os.getenv("EMBED_FLUSH_CHUNKS", 256))
+
+# Ingestion: vector upserts (see src/vector_store.py); Pinecone caps upsert
+# requests at 1000 vectors and 2MB, so batches stay well inside both
+UPSERT_BATCH_VECTORS = int(os.getenv("UPSERT_BATCH_VECTORS", 100))
+UPSERT_BATCH_BYTES = int(os.getenv("UPSERT_BATCH_BYTES", 1_800_000))
+UPSERT_WORKERS = int(os.getenv("UPSERT_WORKERS", 8))
+UPSERT_MAX_RETRIES = int(os.getenv("UPSERT_MAX_RETRIES", 5))
+UPSERT_FLUSH_VECTORS = int(os.getenv("UPSERT_FLUSH_VECTORS", 1000))  # buffered before a bulk upsert
+
+# What ingestion has already written (see src/manifest.py)
+INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "./data/ingest_manifest.json")
+
+# Persistent embedding cache shared by the API and ingestion (see src/embedding_cache.py)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "./data/embedding_cache")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 50_000))
+# Seconds before a hit writes its new last-used time back
+EMBEDDING_CACHE_TOUCH_INTERVAL = float(os.getenv("EMBEDDING_CACHE_TOUCH_INTERVAL", 300))
+
+# BM25 index and hybrid lexical + vector retrieval (see src/lexical_index.py)
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "./data/lexical_index")
+HYBRID_RETRIEVAL_ENABLED = os.getenv("HYBRID_RETRIEVAL_ENABLED", "true").lower() == "true"
+# Fast path: top BM25 score must reach this fraction of the query's maximum
+# possible score and be this many times the runner-up's
+LEXICAL_FAST_PATH_ENABLED = os.getenv("LEXICAL_FAST_PATH_ENABLED", "true").lower() == "true"
+LEXICAL_FAST_PATH_COVERAGE = float(os.getenv("LEXICAL_FAST_PATH_COVERAGE", 0.7))
+LEXICAL_FAST_PATH_MARGIN = float(os.getenv("LEXICAL_FAST_PATH_MARGIN", 2.0))
+
+# Retrieved chunks packed into the prompt context (see src/context_packer.py)
+CONTEXT_PACKING_ENABLED = os.getenv("CONTEXT_PACKING_ENABLED", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+CONTEXT_DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", 0.8))  # Jaccard
+
+# Per-stage timings and /metrics (see src/metrics.py)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_DIR = os.getenv("METRICS_DIR", "./data/metrics")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 1.0))  # seconds between writes
+
+# POST /query/batch
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 100))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 8))  # retrievals and completions at once
+
+# Conversation histories by session id (see src/session_store.py): "sqlite"
+# is shared by every worker on the host, "memory" is per process
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "sqlite").lower()
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "./data/sessions.sqlite")
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", 10_000))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", 64 * 1024 * 1024))
+SESSION_TTL = float(os.getenv("SESSION_TTL", 6 * 3600))  # seconds since last use
+# A read only records its time once the stored one is this fraction of the TTL old
+SESSION_TOUCH_FRACTION = float(os.getenv("SESSION_TOUCH_FRACTION", 0.05))
+
+# Conversation history sent to the LLM (see src/history.py): recent messages
+# verbatim within the budget, older ones folded into a rolling summary
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 1000))
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", 50))
+HISTORY_SUMMARY_ENABLED = os.getenv("HISTORY_SUMMARY_ENABLED", "true").lower() == "true"
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", 250))
+# Summaries each process remembers, for clients whose history is not stored in a session
+HISTORY_SUMMARY_CACHE_ENTRIES = int(os.getenv("HISTORY_SUMMARY_CACHE_ENTRIES", 1000))
+
+# Answer cache in front of the RAG chain (see src/answer_cache.py): exact
+# matches, plus semantic matches for questions asked without history
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))  # seconds
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))  # cosine
+
+# Admission control for the query endpoints (see src/admission.py): questions a
+# worker answers at once and how many more may wait in line for a slot
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", 64 if SERVING_MODE == "async" else 4))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 256 if SERVING_MODE == "async" else 16))
+# Longest a request may take, in seconds; below gunicorn's worker timeout so a
+# request is shed rather than killed. Clients may ask for less with X-Request-Timeout
+ADMISSION_TIMEOUT = float(os.getenv("ADMISSION_TIMEOUT", 25))
+ADMISSION_PRIORITIZE_SHORT = os.getenv("ADMISSION_PRIORITIZE_SHORT", "false").lower() == "true"
+ADMISSION_SHORT_QUESTION_WORDS = int(os.getenv("ADMISSION_SHORT_QUESTION_WORDS", 20))
+# Service time assumed until questions have been timed
+ADMISSION_INITIAL_SERVICE_SECONDS = float(os.getenv("ADMISSION_INITIAL_SERVICE_SECONDS", 2.0))
+
+# Deadlines, hedging and circuit breaking of upstream calls (see src/resilience.py)
+RESILIENCE_ENABLED = os.getenv("RESILIENCE_ENABLED", "true").lower() == "true"
+# Answer with a marked degraded answer when an upstream is unavailable, rather than a 503
+RESILIENCE_DEGRADE = os.getenv("RESILIENCE_DEGRADE", "true").lower() == "true"
+# Seconds each call may take, within what is left of the request's deadline
+RESILIENCE_EMBED_TIMEOUT = float(os.getenv("RESILIENCE_EMBED_TIMEOUT", 5))
+RESILIENCE_SEARCH_TIMEOUT = float(os.getenv("RESILIENCE_SEARCH_TIMEOUT", 5))
+RESILIENCE_CHAT_TIMEOUT = float(os.getenv("RESILIENCE_CHAT_TIMEOUT", 20))
+# Hedge embedding and vector search calls slower than this latency percentile,
+# for at most this fraction of calls
+RESILIENCE_HEDGE_ENABLED = os.getenv("RESILIENCE_HEDGE_ENABLED", "true").lower() == "true"
+RESILIENCE_HEDGE_PERCENTILE = float(os.getenv("RESILIENCE_HEDGE_PERCENTILE", 0.95))
+RESILIENCE_HEDGE_BUDGET = float(os.getenv("RESILIENCE_HEDGE_BUDGET", 0.1))
+RESILIENCE_HEDGE_MIN_DELAY = float(os.getenv("RESILIENCE_HEDGE_MIN_DELAY", 0.01))
+# Successful calls kept per upstream, and needed before hedging starts
+RESILIENCE_LATENCY_WINDOW = int(os.getenv("RESILIENCE_LATENCY_WINDOW", 200))
+RESILIENCE_LATENCY_MIN_SAMPLES = int(os.getenv("RESILIENCE_LATENCY_MIN_SAMPLES", 20))
+# Consecutive failures that open an upstream's breaker, and seconds until it lets a probe through
+RESILIENCE_BREAKER_FAILURES = int(os.getenv("RESILIENCE_BREAKER_FAILURES", 5))
+RESILIENCE_BREAKER_COOLDOWN = float(os.getenv("RESILIENCE_BREAKER_COOLDOWN", 10))
+# Threads running sync upstream calls; a timed-out call keeps its thread until it returns
+RESILIENCE_THREADS = int(os.getenv("RESILIENCE_THREADS", 64))
+
+# Identical questions in flight at once share one answer (see src/coalescing.py);
+# a follower waits for the leader at most COALESCE_WAIT_TIMEOUT seconds, kept
+# below ADMISSION_TIMEOUT, and never past its own request's deadline
+COALESCING_ENABLED = os.getenv("COALESCING_ENABLED", "true").lower() == "true"
+COALESCE_DIR = os.getenv("COALESCE_DIR", "./data/coalesce")
+COALESCE_WAIT_TIMEOUT = float(os.getenv("COALESCE_WAIT_TIMEOUT", 20))
+COALESCE_POLL_INTERVAL = float(os.getenv("COALESCE_POLL_INTERVAL", 0.02))
+COALESCE_RESULT_TTL = float(os.getenv("COALESCE_RESULT_TTL", 30))  # seconds a result file is kept
+
+# Threads an async worker uses for blocking calls (the pooled Pinecone client)
+BLOCKING_IO_THREADS = int(os.getenv("BLOCKING_IO_THREADS", PINECONE_POOL_MAXSIZE))
+
+# Open upstream connections when a worker warms up
+WARM_CONNECTIONS = os.getenv("WARM_CONNECTIONS", "true").lower() == "true"
+# Seconds before a worker whose warm-up failed tries again (see src/readiness.py)
+WARM_UP_RETRY_SECONDS = float(os.getenv("WARM_UP_RETRY_SECONDS", 10))
@@ -0,0 +1,149 @@
+"""Assemble retrieved chunks into the prompt context.
+
+Sits between the retriever and the LLM. Retrieved chunks (best first):
+
+1. near-duplicates of a better-ranked chunk are dropped (Jaccard similarity
+   of word shingles at or above ``similarity``);
+2. hits on neighbouring chunks of the same ``source`` (``chunk`` i and i+1)
+   are merged into one passage, with any text the two chunks share at the
+   seam included once;
+3. passages are packed best first into ``token_budget`` tokens. A passage
+   that does not fit is skipped in favour of smaller ones further down; if
+   not even the best one fits, it is truncated.
+
+The result is a list of documents with a ``stats`` attribute describing
+what packing did, which callers report per request.
+"""
+
+import re
+from langchain_core.documents import Document
+from src import config
+from src.history import count_tokens, get_encoding
+
+_SHINGLE_WORDS = 3
+_MAX_SEAM_WORDS = 300
+_WORD = re.compile(r"\w+")
+
+
+class PackedContext(list):
+    """Documents for the prompt, plus ``stats`` about how they were packed."""
+
+    def __init__(self, documents=(), stats=None):
+        super().__init__(documents)
+        self.stats = stats or {}
+
+
+def shingles(text, size=_SHINGLE_WORDS):
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def join_overlapping(first, second):
+    """Concatenate two consecutive chunks, writing text they share at the seam once."""
+    head, tail = first.split(), second.split()
+    for size in range(min(len(head), len(tail), _MAX_SEAM_WORDS), 0, -1):
+        if head[-size:] == tail[:size]:
+            return " ".join(head + tail[size:])
+    return first.rstrip() + "\n" + second.lstrip()
+
+
+def _chunk_number(document):
+    chunk = document.metadata.get("chunk")
+    try:
+        return int(chunk)
+    except (TypeError, ValueError):
+        return None
+
+
+class ContextPacker:
+    def __init__(self, token_budget=config.CONTEXT_TOKEN_BUDGET, similarity=config.CONTEXT_DEDUP_SIMILARITY):
+        self.token_budget = token_budget
+        self.similarity = similarity
+
+    def dedupe(self, documents):
+        """Drop documents that nearly repeat a better-ranked one."""
+        kept, kept_shingles = [], []
+        for document in documents:
+            document_shingles = shingles(document.page_content)
+            if any(jaccard(document_shingles, other) >= self.similarity for other in kept_shingles):
+                continue
+            kept.append(document)
+            kept_shingles.append(document_shingles)
+        return kept
+
+    def merge_adjacent(self, documents):
+        """Merge runs of consecutive chunks from the same source; keeps rank order."""
+        ranked = list(enumerate(documents))
+        by_position = {}
+        for rank, document in ranked:
+            number = _chunk_number(document)
+            if number is not None and document.metadata.get("source") is not None:
+                by_position[(document.metadata["source"], number)] = rank
+
+        merged, used = [], set()
+        for rank, document in ranked:
+            if rank in used:
+                continue
+            number = _chunk_number(document)
+            source = document.metadata.get("source")
+            if number is None or source is None:
+                merged.append(document)
+                used.add(rank)
+                continue
+            # Extend the run in both directions
+            start = number
+            while (source, start - 1) in by_position and by_position[(source, start - 1)] not in used:
+                start -= 1
+            end = number
+            while (source, end + 1) in by_position and by_position[(source, end + 1)] not in used:
+                end += 1
+            run = [by_position[(source, i)] for i in range(start, end + 1)]
+            used.update(run)
+            if len(run) == 1:
+                merged.append(document)
+                continue
+            text = documents[run[0]].page_content
+            for i in run[1:]:
+                text = join_overlapping(text, documents[i].page_content)
+            metadata = {**documents[run[0]].metadata, "chunk": start, "chunks": list(range(start, end + 1))}
+            merged.append(Document(page_content=text, metadata=metadata))
+        return merged
+
+    def truncate(self, document, tokens):
+        encoding = get_encoding()
+        text = encoding.decode(encoding.encode(document.page_content, disallowed_special=())[:tokens])
+        return Document(page_content=text, metadata={**document.metadata, "truncated": True})
+
+    def pack(self, documents):
+        """Return a :class:`PackedContext` for documents ranked best first."""
+        documents = list(documents)
+        tokens_in = sum(count_tokens(document.page_content) for document in documents)
+        deduped = self.dedupe(documents)
+        merged = self.merge_adjacent(deduped)
+
+        packed, used = [], 0
+        for document in merged:
+            tokens = count_tokens(document.page_content)
+            if used + tokens <= self.token_budget:
+                packed.append(document)
+                used += tokens
+        if not packed and merged:
+            packed = [self.truncate(merged[0], self.token_budget)]
+            used = count_tokens(packed[0].page_content)
+
+        return PackedContext(packed, {
+            "context_chunks_retrieved": len(documents),
+            "context_duplicates_dropped": len(documents) - len(deduped),
+            "context_chunks_merged": len(deduped) - len(merged),
+            "context_passages": len(packed),
+            "context_tokens_retrieved": tokens_in,
+            "context_tokens": used,
+        })
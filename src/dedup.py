@@ -0,0 +1,191 @@
+"""Near-duplicate chunk detection for ingestion (MinHash signatures + LSH banding).
+
+The corpus holds several drafts of the same team's paper, and competition
+boilerplate (rules text, ASCE headers) repeats across nearly every paper.
+Before a chunk is embedded, :class:`DedupIndex` looks for an already
+stored chunk whose estimated Jaccard similarity (over word
+``DEDUP_SHINGLE_WORDS``-grams) is at least ``DEDUP_THRESHOLD``. If it
+finds one, the new chunk becomes a duplicate of that *canonical* chunk: it
+gets no vector and no BM25 entry of its own, and the canonical's
+``sources`` metadata lists every file the text appears in.
+
+Signatures are ``DEDUP_PERMUTATIONS`` minimums of seeded multiply-add-shift
+hashes of the shingles' CRC-32s, so they are stable across runs. They are
+split into ``DEDUP_BANDS`` bands. Chunks sharing any band are candidates,
+and candidates are confirmed against the threshold. The index is saved next to the ingest manifest, and
+its settings are part of the manifest ``params``, so changing them re-embeds
+everything.
+"""
+
+import json
+import os
+import re
+import zlib
+import numpy as np
+from src import config
+
+DEDUP_VERSION = 2
+
+_WORD = re.compile(r"\w+")
+_SHIFT = np.uint64(32)
+
+
+def dedup_path(manifest_path):
+    """Where the dedup index of the manifest at ``manifest_path`` lives."""
+    return f"{os.path.splitext(manifest_path)[0]}.dedup.json"
+
+
+class MinHasher:
+    """MinHash signatures over word shingles."""
+
+    def __init__(self, permutations=config.DEDUP_PERMUTATIONS, shingle_words=config.DEDUP_SHINGLE_WORDS, seed=1):
+        rng = np.random.default_rng(seed)
+        # (a * x + b) mod 2**64 >> 32, with odd a, is a universal hash of 32-bit x;
+        # uint64 arithmetic wraps, so the modulus is free
+        self.a = rng.integers(0, 1 << 64, size=permutations, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 1 << 64, size=permutations, dtype=np.uint64)
+        self.shingle_words = shingle_words
+
+    def shingles(self, text):
+        words = _WORD.findall(text.lower())
+        n = min(self.shingle_words, len(words)) or 1
+        return {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+    def signature(self, text):
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in self.shingles(text)),
+                             dtype=np.uint64)
+        return ((np.outer(hashes, self.a) + self.b) >> _SHIFT).min(axis=0)
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(np.asarray(first) == np.asarray(second)))
+
+
+def near_duplicates(texts, threshold=config.DEDUP_THRESHOLD, hasher=None):
+    """For each text, the index of the first earlier text it near-duplicates (or its own)."""
+    index = DedupIndex(path=None, threshold=threshold, hasher=hasher)
+    canonical = []
+    for i, text in enumerate(texts):
+        found = index.assign(str(i), text, source="")
+        canonical.append(i if found is None else int(found))
+    return canonical
+
+
+class DedupIndex:
+    """Canonical chunks with their signatures, and which chunks duplicate them."""
+
+    def __init__(self, path, threshold=config.DEDUP_THRESHOLD, bands=config.DEDUP_BANDS, hasher=None,
+                 enabled=config.DEDUP_ENABLED):
+        self.path = path
+        self.threshold = threshold
+        self.bands = bands
+        self.hasher = hasher or MinHasher()
+        self.enabled = enabled
+        self.canonicals = {}  # id -> {"source": file, "signature": [...] or None}
+        self.duplicates = {}  # id -> {"source": file, "canonical": id}
+        self._members = {}    # canonical id -> duplicate ids
+        self._buckets = {}    # (band, band hash) -> canonical ids
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("params") == self.params:
+                for vector_id, entry in data["canonicals"].items():
+                    self._add_canonical(vector_id, entry["source"], entry["signature"])
+                for vector_id, entry in data["duplicates"].items():
+                    self._add_duplicate(vector_id, entry["source"], entry["canonical"])
+
+    @property
+    def params(self):
+        """Settings that change which chunks are duplicates, for the ingest manifest."""
+        if not self.enabled:
+            return {"enabled": False}
+        return {"version": DEDUP_VERSION, "threshold": self.threshold, "bands": self.bands,
+                "permutations": len(self.hasher.a), "shingle_words": self.hasher.shingle_words}
+
+    def _band_keys(self, signature):
+        rows = len(signature) // self.bands
+        return [(band, hash(tuple(signature[band * rows:(band + 1) * rows]))) for band in range(self.bands)]
+
+    def _add_canonical(self, vector_id, source, signature):
+        self.canonicals[vector_id] = {"source": source, "signature": signature}
+        self._members.setdefault(vector_id, set())
+        if signature is not None:
+            for key in self._band_keys(signature):
+                self._buckets.setdefault(key, set()).add(vector_id)
+
+    def _add_duplicate(self, vector_id, source, canonical_id):
+        self.duplicates[vector_id] = {"source": source, "canonical": canonical_id}
+        self._members.setdefault(canonical_id, set()).add(vector_id)
+
+    def is_duplicate(self, vector_id):
+        return vector_id in self.duplicates
+
+    def has_role(self, vector_id):
+        """Whether ``vector_id`` is stored, as a canonical or as a duplicate."""
+        return vector_id in self.canonicals or vector_id in self.duplicates
+
+    def find(self, signature):
+        """Most similar canonical at or above the threshold, or ``None``."""
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates |= self._buckets.get(key, set())
+        best, best_score = None, self.threshold
+        for candidate in sorted(candidates):
+            score = similarity(signature, self.canonicals[candidate]["signature"])
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    def assign(self, vector_id, text, source):
+        """Register a chunk; returns the canonical id it duplicates, or ``None`` if it is canonical."""
+        if not self.enabled:
+            self._add_canonical(vector_id, source, None)
+            return None
+        signature = [int(value) for value in self.hasher.signature(text)]
+        canonical_id = self.find(signature)
+        if canonical_id is None:
+            self._add_canonical(vector_id, source, signature)
+        else:
+            self._add_duplicate(vector_id, source, canonical_id)
+        return canonical_id
+
+    def release(self, vector_ids):
+        """Forget chunks; returns ``(canonicals whose sources changed, {orphaned id: source})``.
+
+        Duplicates of a released canonical are orphaned: they have no vector
+        until they are assigned again.
+        """
+        touched, orphaned = set(), {}
+        for vector_id in vector_ids:
+            duplicate = self.duplicates.pop(vector_id, None)
+            if duplicate is not None:
+                self._members.get(duplicate["canonical"], set()).discard(vector_id)
+                touched.add(duplicate["canonical"])
+                continue
+            canonical = self.canonicals.pop(vector_id, None)
+            if canonical is None:
+                continue
+            if canonical["signature"] is not None:
+                for key in self._band_keys(canonical["signature"]):
+                    self._buckets.get(key, set()).discard(vector_id)
+            for member in self._members.pop(vector_id, set()):
+                orphaned[member] = self.duplicates.pop(member)["source"]
+        touched -= set(vector_ids)
+        return {vector_id for vector_id in touched if vector_id in self.canonicals}, orphaned
+
+    def sources(self, canonical_id):
+        """Every file the canonical chunk's text appears in, its own first."""
+        own = self.canonicals[canonical_id]["source"]
+        others = sorted({self.duplicates[member]["source"] for member in self._members.get(canonical_id, ())})
+        return [own] + [source for source in others if source != own]
+
+    def save(self):
+        """Write the index atomically, like the manifest it sits next to."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"params": self.params, "canonicals": self.canonicals, "duplicates": self.duplicates}, f)
+        os.replace(tmp_path, self.path)
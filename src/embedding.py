@@ -1,34 +1,186 @@
 """Embedding generation functionality."""
 
 import os
-import tiktoken
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 import openai
-from dotenv import load_dotenv
+from src import config, registry
+from src.chunking import Chunker, ENCODING_NAME, get_encoding
+from src.dedup import near_duplicates
+
+
+_RETRYABLE = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+@dataclass
+class ThroughputReport:
+    """Running totals for an embedding engine."""
+
+    chunks: int = 0
+    cache_hits: int = 0
+    tokens: int = 0
+    requests: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self):
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    @property
+    def tokens_per_second(self):
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"{self.chunks} chunks ({self.cache_hits} from cache) / {self.tokens} tokens "
+                f"in {self.requests} requests "
+                f"({self.retries} retries) over {self.seconds:.1f}s: "
+                f"{self.chunks_per_second:.1f} chunks/s, {self.tokens_per_second:.0f} tokens/s")
+
+
+class BatchEmbeddingEngine:
+    """Embed many texts with few requests.
+
+    Texts are packed into batches bounded by item count and token count, and
+    up to ``max_in_flight`` batches are sent concurrently. A 429 (or other
+    transient error) puts the whole engine into a shared cool-down, honouring
+    ``Retry-After`` when the API sends it, so in-flight workers back off
+    together instead of hammering the rate limiter. Results are returned in
+    input order. Texts already in the embedding cache are never sent.
+    """
+
+    def __init__(self, model=config.EMBEDDING_MODEL, max_batch_items=config.EMBEDDING_BATCH_ITEMS,
+                 max_batch_tokens=config.EMBEDDING_BATCH_TOKENS, max_in_flight=config.EMBEDDING_MAX_IN_FLIGHT,
+                 max_retries=config.EMBEDDING_MAX_RETRIES, encoding_name=ENCODING_NAME, use_cache=True):
+        self.model = model
+        self.max_batch_items = max_batch_items
+        self.max_batch_tokens = max_batch_tokens
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.encoding = get_encoding(encoding_name)
+        self.cache = registry.get_embedding_cache(model) if use_cache else None
+        self.report = ThroughputReport()
+        self._report_lock = threading.Lock()
+        self._cooldown_until = 0.0
+        self._cooldown_lock = threading.Lock()
+
+    def make_batches(self, texts):
+        """Split ``texts`` into ``(start, texts, tokens)`` batches within the limits."""
+        batches = []
+        start, current, current_tokens = 0, [], 0
+        counts = [len(tokens) for tokens in self.encoding.encode_ordinary_batch(texts)]
+        for i, (text, tokens) in enumerate(zip(texts, counts)):
+            if current and (len(current) >= self.max_batch_items
+                            or current_tokens + tokens > self.max_batch_tokens):
+                batches.append((start, current, current_tokens))
+                start, current, current_tokens = i, [], 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            batches.append((start, current, current_tokens))
+        return batches
+
+    def _wait_for_cooldown(self):
+        delay = self._cooldown_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _back_off(self, error, attempt):
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                pass
+        if retry_after is None:
+            retry_after = min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+        with self._cooldown_lock:
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + retry_after)
+
+    def _embed_batch(self, texts):
+        client = registry.get_openai_client().with_options(max_retries=0)
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_cooldown()
+            try:
+                response = client.embeddings.create(input=texts, model=self.model)
+            except _RETRYABLE as e:
+                if attempt == self.max_retries:
+                    raise
+                with self._report_lock:
+                    self.report.retries += 1
+                self._back_off(e, attempt)
+                continue
+            with self._report_lock:
+                self.report.requests += 1
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def embed(self, texts):
+        """Return one embedding per text, in the order given."""
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._embed_uncached(texts)
+
+        embeddings = self.cache.get_many(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        with self._report_lock:
+            self.report.cache_hits += len(texts) - len(missing)
+        if missing:
+            fresh = self._embed_uncached([texts[i] for i in missing])
+            self.cache.put_many([texts[i] for i in missing], fresh)
+            for i, embedding in zip(missing, fresh):
+                embeddings[i] = embedding
+        return embeddings
+
+    def _embed_uncached(self, texts):
+        started = time.perf_counter()
+        batches = self.make_batches(texts)
+        embeddings = [None] * len(texts)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(batches))) as pool:
+            futures = [(start, pool.submit(self._embed_batch, batch)) for start, batch, _ in batches]
+            for start, future in futures:
+                for offset, embedding in enumerate(future.result()):
+                    embeddings[start + offset] = embedding
+
+        with self._report_lock:
+            self.report.chunks += len(texts)
+            self.report.tokens += sum(tokens for _, _, tokens in batches)
+            self.report.seconds += time.perf_counter() - started
+        return embeddings
+
 
 class EmbeddingGenerator:
     def __init__(self):
         openai_api_key = os.getenv("OPENAI_API_KEY")
         if not openai_api_key:
             raise ValueError("OPENAI_API_KEY not set")
-        
-    def chunk_text_by_tokens(self, text, chunk_size, encoding_name="cl100k_base"):
-        encoding = tiktoken.get_encoding(encoding_name)
-        tokens = encoding.encode(text)
-        return [encoding.decode(tokens[i:i + chunk_size]) for i in range(0, len(tokens), chunk_size)]
+        self.engine = BatchEmbeddingEngine()
+
+    def chunk_text_by_tokens(self, text, chunk_size, encoding_name=ENCODING_NAME):
+        chunker = Chunker(chunk_size=chunk_size, overlap=min(config.CHUNK_OVERLAP_TOKENS, chunk_size // 2),
+                          encoding_name=encoding_name)
+        return [chunk.text for chunk in chunker.chunk(text)]
 
     def generate_embeddings(self, chunks):
-        embeddings = []
-        for chunk in chunks:
-            response = openai.embeddings.create(
-                input=chunk,
-                model="text-embedding-ada-002"
-            )
-            embeddings.append(response.data[0].embedding)
-        return embeddings
-    
-    def process_text(self, text, chunk_size=1500):
+        return self.engine.embed(chunks)
+
+    def process_text(self, text, chunk_size=config.CHUNK_SIZE_TOKENS):
         if not isinstance(text, str) or len(text) == 0:
             raise ValueError("Input text must be a non-empty string")
         chunks = self.chunk_text_by_tokens(text, chunk_size)
-        embeddings = self.generate_embeddings(chunks)
-        return chunks, embeddings 
\ No newline at end of file
+        # Near-duplicate chunks reuse the embedding of the first copy
+        canonical = near_duplicates(chunks)
+        unique = sorted(set(canonical))
+        embedded = dict(zip(unique, self.generate_embeddings([chunks[i] for i in unique])))
+        embeddings = [embedded[i] for i in canonical]
+        return chunks, embeddings
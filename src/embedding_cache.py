@@ -0,0 +1,238 @@
+"""Persistent, content-addressed cache of embedding vectors.
+
+Vectors live in a fixed-capacity float32 matrix in a memory-mapped file;
+a small SQLite index (WAL mode, so every gunicorn worker and the ingestion
+script can share it) maps ``sha256(model, dimension, text)`` to a row of
+that matrix and tracks when each row was last used. When the cache is full
+the least recently used rows are reused. A hit only writes its new
+``last_used`` back once the stored one is ``EMBEDDING_CACHE_TOUCH_INTERVAL``
+seconds old, so repeated hits stay read-only and do not queue up behind
+SQLite's write lock; recency is that coarse, which is plenty for LRU.
+
+Each row also stores the 16-byte key digest it currently holds, and reads
+check it before and after copying the vector, so a row that another
+process is overwriting is treated as a miss rather than returned.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from src import config, metrics, registry
+
+# Fraction of the capacity freed at once when the cache is full
+_EVICT_FRACTION = 0.05
+_DIGEST_BYTES = 16
+
+
+def cache_key(text, model, dimension):
+    return hashlib.sha256(f"{model}\0{dimension}\0{text}".encode("utf-8")).digest()[:_DIGEST_BYTES]
+
+
+class EmbeddingCache:
+    def __init__(self, model, dimension, directory=config.EMBEDDING_CACHE_DIR,
+                 max_entries=config.EMBEDDING_CACHE_MAX_ENTRIES, touch_interval=config.EMBEDDING_CACHE_TOUCH_INTERVAL):
+        self.model = model
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"{dimension}d_{max_entries}")
+        self._db = sqlite3.connect(f"{stem}.sqlite", timeout=30, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key BLOB PRIMARY KEY, slot INTEGER UNIQUE NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._vectors = self._open_matrix(f"{stem}.f32", np.float32, (max_entries, dimension))
+        self._digests = self._open_matrix(f"{stem}.keys", np.uint8, (max_entries, _DIGEST_BYTES))
+
+    @staticmethod
+    def _open_matrix(path, dtype, shape):
+        if not os.path.exists(path):
+            # Sparse file; pages are only allocated as rows are written
+            with open(path, "wb") as f:
+                f.truncate(int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def get_many(self, texts):
+        """Return a vector (list of floats) or ``None`` for each text."""
+        keys = [cache_key(text, self.model, self.dimension) for text in texts]
+        results = [None] * len(texts)
+        now = time.time()
+        with self._lock:
+            rows = self._lookup(set(keys))
+            stale = set()
+            for i, key in enumerate(keys):
+                if key not in rows:
+                    continue
+                slot, last_used = rows[key]
+                if bytes(self._digests[slot]) != key:
+                    continue
+                vector = np.array(self._vectors[slot])
+                if bytes(self._digests[slot]) != key:
+                    continue
+                results[i] = vector.tolist()
+                if now - last_used >= self.touch_interval:
+                    stale.add(key)
+
+            if stale:
+                self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                     [(now, key) for key in stale])
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(texts) - hits
+        return results
+
+    def _lookup(self, keys):
+        """Map each known key to its ``(slot, last_used)``."""
+        keys = list(keys)
+        rows = {}
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows.update((key, (slot, last_used)) for key, slot, last_used in self._db.execute(
+                f"SELECT key, slot, last_used FROM entries WHERE key IN ({placeholders})", batch
+            ))
+        return rows
+
+    def put_many(self, texts, vectors):
+        """Store vectors for texts, evicting least recently used rows if full."""
+        entries = {}
+        for text, vector in zip(texts, vectors):
+            entries[cache_key(text, self.model, self.dimension)] = vector
+        if not entries:
+            return
+        if len(entries) > self.max_entries:
+            entries = dict(list(entries.items())[-self.max_entries:])
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._lookup(entries)
+                new_keys = [key for key in entries if key not in existing]
+                slots = self._free_slots(len(new_keys))
+                now = time.time()
+                assignments = [(key, slot) for key, (slot, _) in existing.items()] + list(zip(new_keys, slots))
+                for key, slot in assignments:
+                    self._digests[slot] = 0
+                    self._vectors[slot] = np.asarray(entries[key], dtype=np.float32)
+                    self._digests[slot] = np.frombuffer(key, dtype=np.uint8)
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                    [(key, slot, now) for key, slot in assignments],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _free_slots(self, count):
+        """Pick ``count`` unused rows, evicting the least recently used if needed."""
+        if count == 0:
+            return []
+        count = min(count, self.max_entries)
+        used = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        shortfall = used + count - self.max_entries
+        if shortfall > 0:
+            evict = max(shortfall, int(self.max_entries * _EVICT_FRACTION))
+            self._db.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY last_used LIMIT ?)", (evict,)
+            )
+            self.evictions += evict
+        # Fast path while the file is still filling up: take the next rows
+        highest = self._db.execute("SELECT MAX(slot) FROM entries").fetchone()[0]
+        next_slot = 0 if highest is None else highest + 1
+        if next_slot + count <= self.max_entries:
+            return list(range(next_slot, next_slot + count))
+        taken = {slot for (slot,) in self._db.execute("SELECT slot FROM entries")}
+        slots = []
+        for slot in range(self.max_entries):
+            if slot not in taken:
+                slots.append(slot)
+                if len(slots) == count:
+                    break
+        return slots
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def flush(self):
+        self._vectors.flush()
+        self._digests.flush()
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain embeddings wrapper that consults an :class:`EmbeddingCache` first."""
+
+    def __init__(self, embeddings, cache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def _count(self, texts, missing):
+        metrics.count("paddleprompt_cache_requests_total", len(texts) - missing, cache="embedding", result="hit")
+        metrics.count("paddleprompt_cache_requests_total", missing, cache="embedding", result="miss")
+
+    def embed_documents(self, texts):
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        self._count(texts, len(missing))
+        if missing:
+            fresh = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.cache.put_many([texts[i] for i in missing], fresh)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text):
+        vector = self.cache.get_many([text])[0]
+        self._count([text], int(vector is None))
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many([text], [vector])
+        return vector
+
+    # The async methods use the cache from the blocking executor: a write
+    # can wait on SQLite's lock, which must not stall the event loop
+
+    async def aembed_documents(self, texts):
+        vectors = await registry.run_blocking(self.cache.get_many, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        self._count(texts, len(missing))
+        if missing:
+            fresh = await self.embeddings.aembed_documents([texts[i] for i in missing])
+            await registry.run_blocking(self.cache.put_many, [texts[i] for i in missing], fresh)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+        return vectors
+
+    async def aembed_query(self, text):
+        vector = (await registry.run_blocking(self.cache.get_many, [text]))[0]
+        self._count([text], int(vector is None))
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            await registry.run_blocking(self.cache.put_many, [text], [vector])
+        return vector
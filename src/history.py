@@ -0,0 +1,245 @@
+"""Token-budgeted conversation history.
+
+The history sent to the LLM is kept within ``HISTORY_TOKEN_BUDGET`` tokens
+(see ``src/config.py``): the most recent messages are kept verbatim and
+older ones are folded into a rolling summary. The summary travels with the
+history as its first message::
+
+    {"role": "summary", "content": "...", "messages": 8, "digest": "<prefix_digest of those 8>"}
+
+so the session store keeps it, and the next fold only summarizes the
+messages that have since fallen out of the budget, together with the
+previous summary, instead of regenerating it from the whole conversation.
+``messages`` and ``digest`` always describe a prefix of the client's full
+message list (messages dropped past ``HISTORY_MAX_MESSAGES`` included), so
+a client-sent history can be matched against the stored summary. Each
+process also keeps the summaries it made in a small LRU keyed by that
+digest, so a client that keeps no session, and so has no stored summary,
+still only has the newly aged-out messages summarized on each turn.
+
+Token counts are cached per message text, so a long conversation is only
+tokenized once however many turns it is carried through.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from src import chunking, config
+
+logger = logging.getLogger(__name__)
+
+ENCODING_NAME = chunking.ENCODING_NAME
+# Role label, separators and newline around each formatted message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant about "
+    "concrete canoe engineering documents. Update the summary with the new messages. Keep the "
+    "facts, names, numbers and open questions later turns may refer back to. Reply with the "
+    "updated summary only, in under {max_words} words."
+)
+
+
+def get_encoding():
+    return chunking.get_encoding(ENCODING_NAME)
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text):
+    """Number of tokens in ``text`` (cached per distinct text)."""
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+def message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def history_tokens(conversation_history):
+    return sum(message_tokens(message) for message in conversation_history)
+
+
+def prefix_digest(messages, start=""):
+    """Rolling digest of ``messages``, continuing from the digest ``start``."""
+    digest = start
+    for message in messages:
+        digest = hashlib.sha256(
+            f"{digest}\0{message['role']}\0{message['content']}".encode("utf-8")
+        ).hexdigest()
+    return digest
+
+
+def is_summary(message):
+    return message.get("role") == "summary"
+
+
+def split_summary(conversation_history):
+    """Return ``(summary message or None, remaining messages)``."""
+    if conversation_history and is_summary(conversation_history[0]):
+        return conversation_history[0], list(conversation_history[1:])
+    return None, list(conversation_history)
+
+
+def attach_summary(conversation_history, stored_history):
+    """Prefix a client-sent history with the stored summary when it still applies.
+
+    Clients send their full message list. If the stored session has a
+    summary of the first ``n`` of those messages (same digest), those
+    messages are replaced by the summary so it is not rebuilt.
+    """
+    summary, _ = split_summary(stored_history or [])
+    if summary is None or split_summary(conversation_history)[0] is not None:
+        return conversation_history
+    covered = summary["messages"]
+    if len(conversation_history) >= covered and prefix_digest(conversation_history[:covered]) == summary["digest"]:
+        return [summary] + conversation_history[covered:]
+    return conversation_history
+
+
+@dataclass
+class FittedHistory:
+    """History ready for the prompt, plus what fitting it did."""
+    history: list
+    tokens: int = 0
+    verbatim_tokens: int = 0
+    summarized_messages: int = 0
+    dropped_messages: int = 0
+    # Set while a fold is pending: the summary to extend and the messages to add
+    previous_summary: dict = None
+    pending: list = field(default_factory=list)
+    # Count and digest of the client messages before ``pending``
+    anchor: tuple = (0, "")
+
+    @property
+    def stats(self):
+        return {
+            "history_tokens": self.tokens,
+            "history_tokens_verbatim": self.verbatim_tokens,
+            "summarized_messages": self.summarized_messages,
+            "dropped_messages": self.dropped_messages,
+        }
+
+
+class HistoryManager:
+    """Fit conversation histories into a token budget."""
+
+    def __init__(self, token_budget=config.HISTORY_TOKEN_BUDGET, max_messages=config.HISTORY_MAX_MESSAGES,
+                 summarize=config.HISTORY_SUMMARY_ENABLED, summary_max_tokens=config.SUMMARY_MAX_TOKENS,
+                 summary_cache_entries=config.HISTORY_SUMMARY_CACHE_ENTRIES):
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self.summarize = summarize
+        self.summary_max_tokens = summary_max_tokens
+        self.summary_cache_entries = summary_cache_entries
+        self._summaries = OrderedDict()  # digest -> summary message
+        self._lock = threading.Lock()
+
+    def _with_cached_summary(self, conversation_history):
+        """Replace the longest prefix this process already summarized with that summary."""
+        summary, messages = split_summary(conversation_history)
+        digest = summary["digest"] if summary else ""
+        digests = []
+        for message in messages:
+            digest = prefix_digest([message], start=digest)
+            digests.append(digest)
+        with self._lock:
+            for covered in range(len(digests), 0, -1):
+                cached = self._summaries.get(digests[covered - 1])
+                if cached is not None:
+                    self._summaries.move_to_end(digests[covered - 1])
+                    return [cached] + messages[covered:]
+        return conversation_history
+
+    def _remember(self, summary):
+        with self._lock:
+            self._summaries[summary["digest"]] = summary
+            self._summaries.move_to_end(summary["digest"])
+            while len(self._summaries) > self.summary_cache_entries:
+                self._summaries.popitem(last=False)
+
+    def _plan(self, conversation_history):
+        verbatim = history_tokens(conversation_history)
+        if self.summarize:
+            conversation_history = self._with_cached_summary(conversation_history)
+        summary, messages = split_summary(conversation_history)
+        anchor = (summary["messages"], summary["digest"]) if summary else (0, "")
+
+        # Messages beyond the hard cap are dropped without being summarized;
+        # the summary no longer lines up with what is left, so it goes too.
+        # The next summary still counts them, so it matches the client's history
+        dropped = max(0, len(messages) - self.max_messages)
+        if dropped:
+            anchor = (anchor[0] + dropped, prefix_digest(messages[:dropped], start=anchor[1]))
+            summary, messages = None, messages[dropped:]
+
+        # Recent messages get whatever the summary may not use
+        budget = self.token_budget
+        if self.summarize:
+            budget -= self.summary_max_tokens + MESSAGE_OVERHEAD_TOKENS
+        keep, used = len(messages), 0
+        while keep > 0 and used + message_tokens(messages[keep - 1]) <= budget:
+            keep -= 1
+            used += message_tokens(messages[keep])
+        older, recent = messages[:keep], messages[keep:]
+
+        fitted = FittedHistory(history=recent, verbatim_tokens=verbatim, dropped_messages=dropped,
+                               previous_summary=summary, anchor=anchor)
+        if older and self.summarize:
+            fitted.pending = older
+        else:
+            fitted.dropped_messages += len(older)
+        return fitted
+
+    def _prompt(self, previous_summary, messages):
+        lines = []
+        if previous_summary is not None:
+            lines.append(f"Summary so far: {previous_summary['content']}")
+        lines.append("New messages:")
+        lines.extend(f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages)
+        return [
+            ("system", SUMMARY_PROMPT.format(max_words=int(self.summary_max_tokens * 0.75))),
+            ("human", "\n".join(lines)),
+        ]
+
+    def _finish(self, fitted, summary_text):
+        previous = fitted.previous_summary
+        if fitted.pending and summary_text:
+            covered, start = fitted.anchor
+            summary = {"role": "summary", "content": summary_text.strip(),
+                       "messages": covered + len(fitted.pending),
+                       "digest": prefix_digest(fitted.pending, start=start)}
+            self._remember(summary)
+            fitted.history = [summary] + fitted.history
+            fitted.summarized_messages = len(fitted.pending)
+        elif fitted.pending:
+            # Summarizing failed; drop the old messages, which also orphans the old summary
+            fitted.dropped_messages += len(fitted.pending)
+        elif previous is not None:
+            fitted.history = [previous] + fitted.history
+        fitted.previous_summary, fitted.pending = None, []
+        fitted.tokens = history_tokens(fitted.history)
+        return fitted
+
+    def fit(self, conversation_history, llm=None):
+        """Fit a history into the budget, folding old messages into the summary with ``llm``."""
+        fitted = self._plan(conversation_history)
+        text = None
+        if fitted.pending and llm is not None:
+            try:
+                text = llm.invoke(self._prompt(fitted.previous_summary, fitted.pending)).content
+            except Exception as e:
+                logger.warning("Could not summarize conversation history: %s", e)
+        return self._finish(fitted, text)
+
+    async def afit(self, conversation_history, llm=None):
+        """Async :meth:`fit`."""
+        fitted = self._plan(conversation_history)
+        text = None
+        if fitted.pending and llm is not None:
+            try:
+                text = (await llm.ainvoke(self._prompt(fitted.previous_summary, fitted.pending))).content
+            except Exception as e:
+                logger.warning("Could not summarize conversation history: %s", e)
+        return self._finish(fitted, text)
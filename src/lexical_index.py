@@ -0,0 +1,346 @@
+"""On-disk BM25 index over chunk texts, and hybrid lexical + vector retrieval.
+
+Ingestion keeps a :class:`LexicalIndex` next to the vector store, one per
+backend, under ``LEXICAL_INDEX_DIR/<backend>``. It is stored like
+``src/local_index.py``: immutable snapshot directories plus a ``CURRENT``
+pointer swapped atomically, each holding a compact inverted index::
+
+    terms.json        vocabulary, in posting-list order
+    offsets.npy       int64 (terms + 1,) start of each term's postings
+    postings.npy      uint32 chunk rows, grouped by term
+    frequencies.npy   uint16 term frequency per posting
+    lengths.npy       uint32 tokens per chunk
+    records.json      chunk ids and metadata (including the text), in row order
+
+The arrays are memory-mapped read-only, so workers share them through the
+page cache. :class:`LexicalIndex` implements the same ``upsert``/``delete``/``update``
+subset of the Pinecone ``Index`` interface as ``LocalVectorIndex``.
+
+:class:`HybridRetriever` runs BM25 and vector search concurrently and fuses
+the two rankings with reciprocal-rank fusion. When the BM25 ranking is
+decisive (the top chunk matches most of the query's weight and clearly
+beats the runner-up, as with team, canoe or mix names), it answers from
+the lexical hits alone and skips the embedding call.
+"""
+
+import asyncio
+import contextvars
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from src import config, metrics, resilience
+
+RRF_K = 60
+BM25_K1 = 1.2
+BM25_B = 0.75
+_KEEP_SNAPSHOTS = 2
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the their there these "
+    "this to was were what when where which who why will with".split()
+)
+
+
+def lexical_index_dir(backend):
+    return os.path.join(config.LEXICAL_INDEX_DIR, backend)
+
+
+def tokenize(text):
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+class LexicalIndex:
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._terms = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._postings = np.zeros(0, dtype=np.uint32)
+        self._frequencies = np.zeros(0, dtype=np.uint16)
+        self._lengths = np.zeros(0, dtype=np.uint32)
+        self._ids = []
+        self._id_set = set()
+        self._metadata = []
+        self._pending = None  # id -> metadata while writing
+        self.reload()
+
+    # Reading
+
+    def _current_snapshot(self):
+        try:
+            with open(os.path.join(self.directory, "CURRENT"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        """Map the live snapshot if it changed since the last load."""
+        snapshot = self._current_snapshot()
+        if snapshot is None or snapshot == self._snapshot:
+            return
+        path = os.path.join(self.directory, snapshot)
+        with open(os.path.join(path, "terms.json"), "r", encoding="utf-8") as f:
+            terms = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(path, "records.json"), "r", encoding="utf-8") as f:
+            records = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        arrays = [load(name) for name in ("offsets.npy", "postings.npy", "frequencies.npy", "lengths.npy")]
+        with self._lock:
+            self._terms = terms
+            self._offsets, self._postings, self._frequencies, self._lengths = arrays
+            self._ids = records["ids"]
+            self._id_set = set(records["ids"])
+            self._metadata = records["metadata"]
+            self._snapshot = snapshot
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, vector_id):
+        if self._pending is not None:
+            return vector_id in self._pending
+        return vector_id in self._id_set
+
+    def search(self, query, k=8):
+        """Top-``k`` ``(id, score, metadata)`` by BM25, plus the query's maximum score.
+
+        The maximum is what a chunk containing every query term would score
+        at saturation, used to judge how decisive the top hit is.
+        """
+        self.reload()
+        with self._lock:
+            terms, offsets, postings = self._terms, self._offsets, self._postings
+            frequencies, lengths, ids, metadata = self._frequencies, self._lengths, self._ids, self._metadata
+        count = len(ids)
+        if not count:
+            return [], 0.0
+
+        average_length = float(lengths.mean()) or 1.0
+        norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)
+        scores = np.zeros(count, dtype=np.float32)
+        max_score = 0.0
+        for term, weight in Counter(tokenize(query)).items():
+            row = terms.get(term)
+            if row is None:
+                continue
+            start, end = offsets[row], offsets[row + 1]
+            docs = postings[start:end]
+            tf = frequencies[start:end].astype(np.float32)
+            idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += weight * idf * tf * (BM25_K1 + 1) / (tf + norms[docs])
+            max_score += weight * idf * (BM25_K1 + 1)
+
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return [], max_score
+        k = min(k, len(hits))
+        top = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[row], float(scores[row]), metadata[row]) for row in top], max_score
+
+    # Writing (Pinecone Index compatible)
+
+    def _load_pending(self):
+        if self._pending is None:
+            self.reload()
+            self._pending = dict(zip(self._ids, self._metadata))
+        return self._pending
+
+    def upsert(self, vectors, **kwargs):
+        """Add ``(id, values, metadata)`` tuples; only ``metadata["text"]`` is indexed."""
+        with self._lock:
+            pending = self._load_pending()
+            for vector_id, _, metadata in vectors:
+                pending[vector_id] = metadata
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids=None, delete_all=False, **kwargs):
+        with self._lock:
+            pending = self._load_pending()
+            if delete_all:
+                pending.clear()
+            for vector_id in ids or []:
+                pending.pop(vector_id, None)
+        return {}
+
+    def update(self, id, set_metadata=None, **kwargs):
+        """Merge ``set_metadata`` into a stored chunk's metadata."""
+        with self._lock:
+            pending = self._load_pending()
+            if id in pending and set_metadata:
+                pending[id] = {**pending[id], **set_metadata}
+        return {}
+
+    def save(self):
+        """Build the inverted index from pending records as a new live snapshot."""
+        with self._lock:
+            if self._pending is None:
+                return
+            ids = sorted(self._pending)
+            postings = {}
+            lengths = np.zeros(len(ids), dtype=np.uint32)
+            for row, vector_id in enumerate(ids):
+                tokens = tokenize(self._pending[vector_id].get("text", ""))
+                lengths[row] = len(tokens)
+                for term, tf in Counter(tokens).items():
+                    postings.setdefault(term, []).append((row, min(tf, 65535)))
+
+            terms = sorted(postings)
+            offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+            for i, term in enumerate(terms):
+                offsets[i + 1] = offsets[i] + len(postings[term])
+            flat = [posting for term in terms for posting in postings[term]]
+            rows = np.array([row for row, _ in flat], dtype=np.uint32)
+            frequencies = np.array([tf for _, tf in flat], dtype=np.uint16)
+
+            snapshot = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{time.perf_counter_ns()}"
+            path = os.path.join(self.directory, snapshot)
+            os.makedirs(path)
+            for name, array in (("offsets.npy", offsets), ("postings.npy", rows),
+                                ("frequencies.npy", frequencies), ("lengths.npy", lengths)):
+                np.save(os.path.join(path, name), array)
+            with open(os.path.join(path, "terms.json"), "w", encoding="utf-8") as f:
+                json.dump(terms, f)
+            with open(os.path.join(path, "records.json"), "w", encoding="utf-8") as f:
+                json.dump({"ids": ids, "metadata": [self._pending[i] for i in ids]}, f)
+
+            tmp_path = os.path.join(self.directory, "CURRENT.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+            os.replace(tmp_path, os.path.join(self.directory, "CURRENT"))
+            self._prune(keep=snapshot)
+            self._pending = None
+        self.reload()
+
+    def _prune(self, keep):
+        snapshots = sorted(
+            (entry for entry in os.listdir(self.directory)
+             if os.path.isdir(os.path.join(self.directory, entry))),
+            key=lambda entry: os.path.getmtime(os.path.join(self.directory, entry)),
+        )
+        for entry in snapshots[:-_KEEP_SNAPSHOTS]:
+            if entry != keep:
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse rankings of ``(key, document)`` pairs; returns documents best first."""
+    scores, documents = {}, {}
+    for ranking in rankings:
+        for rank, (key, document) in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            documents.setdefault(key, document)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 plus vector retrieval fused with reciprocal-rank fusion.
+
+    ``vector_retriever`` must provide ``get_documents_by_vector`` and
+    ``aget_documents_by_vector`` (``PineconeRetriever``, ``LocalIndexRetriever``).
+    With the fast path on, BM25 (well under a millisecond for this corpus)
+    runs first and the embedding is only requested when its ranking is not
+    decisive; with it off, both searches run concurrently. When the
+    embedding or vector search is unavailable (``src/resilience.py``), the
+    BM25 ranking is used alone.
+    """
+
+    vector_retriever: BaseRetriever
+    lexical_index: LexicalIndex
+    embeddings: object
+    executor: ThreadPoolExecutor
+    k: int = 8
+    text_key: str = "text"
+    fast_path: bool = config.LEXICAL_FAST_PATH_ENABLED
+    fast_path_coverage: float = config.LEXICAL_FAST_PATH_COVERAGE
+    fast_path_margin: float = config.LEXICAL_FAST_PATH_MARGIN
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def lexical_search(self, query):
+        """Return ``(ranking of (id, document), decisive)`` for BM25 over ``query``."""
+        with metrics.stage("lexical_search"):
+            matches, max_score = self.lexical_index.search(query, self.k)
+        ranking = []
+        for vector_id, score, metadata in matches:
+            metadata = dict(metadata)
+            text = metadata.pop(self.text_key, "")
+            ranking.append((vector_id, Document(page_content=text, metadata={**metadata, "bm25": score})))
+        return ranking, self.is_decisive(matches, max_score)
+
+    def is_decisive(self, matches, max_score):
+        if not matches or max_score <= 0:
+            return False
+        top = matches[0][1]
+        runner_up = matches[1][1] if len(matches) > 1 else 0.0
+        return top >= self.fast_path_coverage * max_score and top >= self.fast_path_margin * runner_up
+
+    def fuse(self, lexical_ranking, vector_documents):
+        vector_ranking = [(document.metadata.get("id") or document.id or document.page_content, document)
+                          for document in vector_documents]
+        return reciprocal_rank_fusion([vector_ranking, lexical_ranking])[:self.k]
+
+    def get_documents_by_vector(self, vector, query=None):
+        """Hybrid results when the query embedding is already known (batch path)."""
+        vector_documents = self.vector_retriever.get_documents_by_vector(vector)
+        if query is None:
+            return vector_documents
+        return self.fuse(self.lexical_search(query)[0], vector_documents)
+
+    async def aget_documents_by_vector(self, vector, query=None):
+        vector_documents = await self.vector_retriever.aget_documents_by_vector(vector)
+        if query is None:
+            return vector_documents
+        return self.fuse(self.lexical_search(query)[0], vector_documents)
+
+    def _vector_search(self, query):
+        try:
+            with metrics.stage("embed"):
+                vector = self.embeddings.embed_query(query)
+            return self.vector_retriever.get_documents_by_vector(vector)
+        except resilience.Unavailable as e:
+            metrics.count("paddleprompt_degraded_answers_total", upstream=e.upstream)
+            return []
+
+    async def _avector_search(self, query):
+        try:
+            with metrics.stage("embed"):
+                vector = await self.embeddings.aembed_query(query)
+            return await self.vector_retriever.aget_documents_by_vector(vector)
+        except resilience.Unavailable as e:
+            metrics.count("paddleprompt_degraded_answers_total", upstream=e.upstream)
+            return []
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        if self.fast_path:
+            ranking, decisive = self.lexical_search(query)
+            if decisive:
+                return [document for _, document in ranking]
+            return self.fuse(ranking, self._vector_search(query))
+        # Copy the context so the pool thread's stage timings reach this request
+        vector_search = self.executor.submit(contextvars.copy_context().run, self._vector_search, query)
+        ranking, _ = self.lexical_search(query)
+        return self.fuse(ranking, vector_search.result())
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        if self.fast_path:
+            ranking, decisive = self.lexical_search(query)
+            if decisive:
+                return [document for _, document in ranking]
+            return self.fuse(ranking, await self._avector_search(query))
+        vector_search = asyncio.ensure_future(self._avector_search(query))
+        ranking, _ = self.lexical_search(query)
+        return self.fuse(ranking, await vector_search)
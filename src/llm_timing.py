@@ -0,0 +1,41 @@
+"""LangChain callback handler timing chat model calls for :mod:`src.metrics`."""
+
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from src import metrics
+
+
+class LLMTimingHandler(BaseCallbackHandler):
+    """Times chat model calls as the ``llm`` stage (and ``llm_first_token`` when streaming)."""
+
+    run_inline = True
+
+    def __init__(self, timings):
+        self.timings = timings
+        self._started = {}
+        self._first_token = set()
+
+    def _record(self, name, seconds):
+        metrics.observe("paddleprompt_stage_seconds", seconds, stage=name)
+        if self.timings is not None:
+            self.timings.add(name, seconds)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        started = self._started.get(run_id)
+        if started is not None and run_id not in self._first_token:
+            self._first_token.add(run_id)
+            self._record("llm_first_token", time.perf_counter() - started)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self._record("llm", time.perf_counter() - started)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
@@ -1,18 +1,25 @@
 """Script for loading PDFs into the vector database."""
 
+import argparse
 import os
 from dotenv import load_dotenv
-import fitz
-import tiktoken
-import openai
 from pinecone import Pinecone, ServerlessSpec
+from src.chunking import Chunker
+from src.dedup import DedupIndex, dedup_path
+from src.embedding import BatchEmbeddingEngine
+from src.vector_store import bulk_upsert, delete_vectors, update_metadata, UpsertReport
+from src.manifest import IngestManifest, file_sha256, text_sha256
+from src.pdf_loader import iter_pdf_texts
+from src.local_index import LocalVectorIndex
+from src.lexical_index import LexicalIndex, lexical_index_dir
+from src import config
 
-def load_pdfs_to_vectordb():
-    """Load PDFs from the pdfs directory into Pinecone."""
-    load_dotenv()
 
-    folder_path = "./pdfs"
-    
+def open_vector_index(backend):
+    """Return a writable index for ``backend``, creating the Pinecone index if needed."""
+    if backend == "local":
+        return LocalVectorIndex(dimension=config.EMBEDDING_DIMENSION)
+
     # Initialize Pinecone
     pinecone_api_key = os.getenv("PINECONE_API_KEY")
     if not pinecone_api_key:
@@ -29,48 +36,202 @@ def load_pdfs_to_vectordb():
             spec=ServerlessSpec(cloud='aws', region='us-east-1')
         )
     
-    index = pc.Index(index_name)
+    return pc.Index(index_name)
+
+def chunk_metadata(file, chunk, sources=None):
+    return {
+        "id": chunk.id,
+        "source": file,
+        "sources": sources or [file],
+        "chunk": chunk.index,
+        "section": chunk.section or "",
+        "text": chunk.text
+    }
+
+def load_pdfs_to_vectordb(incremental=True, manifest_path=None, backend=config.VECTOR_BACKEND):
+    """Load PDFs from the pdfs directory into the vector store.
+
+    ``backend`` is "pinecone" or "local" (a memory-mapped index under
+    ``LOCAL_INDEX_DIR`` that the API can serve from without network calls);
+    each backend keeps its own manifest. A BM25 index over the same chunks
+    is kept alongside under ``LEXICAL_INDEX_DIR/<backend>``.
+
+    In incremental mode, files whose content hash and chunking/embedding
+    settings match the manifest are skipped, changed files only re-embed
+    chunks whose text changed, and vectors of files that disappeared from
+    ``./pdfs`` are deleted. ``incremental=False`` re-embeds everything.
+
+    Chunks that nearly duplicate a stored chunk (see ``src/dedup.py``) are
+    not embedded or indexed; the stored chunk's ``sources`` lists every
+    file the text appears in. When a stored chunk goes away, the files
+    holding its duplicates are processed again so one of them takes over.
+    """
+    load_dotenv()
+
+    folder_path = "./pdfs"
+    if manifest_path is None:
+        manifest_path = (os.path.join(config.LOCAL_INDEX_DIR, "ingest_manifest.json")
+                         if backend == "local" else config.INGEST_MANIFEST_PATH)
+
+    index = open_vector_index(backend)
+    lexical = LexicalIndex(lexical_index_dir(backend))
+    engine = BatchEmbeddingEngine()
+    chunker = Chunker()
+    records = []
+    upserts = UpsertReport()
+
+    manifest = IngestManifest(manifest_path)
+    dedup = DedupIndex(dedup_path(manifest_path))
+    params = {**chunker.params, "embedding_model": engine.model, "dedup": dedup.params}
+    pending_entries = []
+    pending_chunks = []
+    touched = set()  # stored chunks whose list of sources changed
+    orphaned = {}    # duplicate id -> file, for duplicates whose stored chunk went away
+    stats = {"skipped_files": 0, "embedded_chunks": 0, "reused_chunks": 0, "deleted_vectors": 0,
+             "duplicate_chunks": 0}
 
-    # Process each PDF
-    for file in os.listdir(folder_path):
-        if file.endswith(".pdf"):
+    def release(vector_ids):
+        changed_sources, orphans = dedup.release(vector_ids)
+        touched.update(changed_sources)
+        orphaned.update(orphans)
+
+    def embed_pending():
+        # One batched embedding pass over chunks queued from several files
+        pending = [(file, chunk) for file, chunk in pending_chunks if chunk.id in dedup.canonicals]
+        embeddings = engine.embed([chunk.text for _, chunk in pending])
+        for (file, chunk), vector in zip(pending, embeddings):
+            records.append((chunk.id, vector, chunk_metadata(file, chunk, dedup.sources(chunk.id))))
+        pending_chunks.clear()
+
+    def flush():
+        # Only record files in the manifest once their vectors are stored
+        nonlocal records, upserts
+        embed_pending()
+        upserts += bulk_upsert(index, records, show_progress=backend != "local")
+        records = []
+        updates = {vector_id: {"sources": dedup.sources(vector_id)}
+                   for vector_id in touched if vector_id in dedup.canonicals}
+        update_metadata(index, updates)
+        for vector_id, fields in updates.items():
+            lexical.update(id=vector_id, set_metadata=fields)
+        touched.clear()
+        if backend == "local":
+            index.save()
+        lexical.save()
+        for entry in pending_entries:
+            manifest.record(*entry)
+        pending_entries.clear()
+        manifest.save()
+        dedup.save()
+
+    pdf_files = sorted(file for file in os.listdir(folder_path) if file.endswith(".pdf"))
+
+    # Drop vectors of files that were removed from the folder
+    for file in sorted(set(manifest.files) - set(pdf_files)):
+        removed_ids = manifest.vector_ids(file)
+        stored_ids = [vector_id for vector_id in removed_ids if not dedup.is_duplicate(vector_id)]
+        release(removed_ids)
+        delete_vectors(index, stored_ids)
+        lexical.delete(stored_ids)
+        stats["deleted_vectors"] += len(stored_ids)
+        manifest.remove(file)
+        print(f"Removed: {file} ({len(stored_ids)} vectors)")
+    if backend == "local":
+        index.save()
+    lexical.save()
+    manifest.save()
+
+    candidates, first_round = pdf_files, True
+    while candidates:
+        # Hashing is cheap; only files that changed are extracted
+        to_process = {}
+        for file in candidates:
             pdf_path = os.path.join(folder_path, file)
-            print(f"Processing: {file}")
-
-            # Extract text
-            doc = fitz.open(pdf_path)
-            text = ""
-            for page in doc:
-                text += page.get_text()  # type: ignore
-
-            # Chunk text
-            encoding = tiktoken.get_encoding("cl100k_base")
-            tokens = encoding.encode(text)
-            chunk_size = 800
-            chunks = [encoding.decode(tokens[i:i + chunk_size]) 
-                     for i in range(0, len(tokens), chunk_size)]
-
-            # Generate embeddings
-            embeddings = []
+            content_hash = file_sha256(pdf_path)
+            # A file missing from the lexical index (e.g. the first run after it
+            # was added) is re-extracted; its unchanged chunks are not re-embedded.
+            # So is one holding duplicates whose stored chunk went away.
+            if (incremental and manifest.is_unchanged(file, content_hash, params)
+                    and all(vector_id in lexical or dedup.is_duplicate(vector_id)
+                            for vector_id in manifest.vector_ids(file))):
+                stats["skipped_files"] += first_round
+                continue
+            to_process[pdf_path] = (file, content_hash)
+
+        # Extraction runs ahead on a process pool while chunks are embedded here
+        for pdf_path, text in iter_pdf_texts(to_process):
+            file, content_hash = to_process[pdf_path]
+
+            # Section- and paragraph-aware chunks with deterministic ids
+            chunks = chunker.chunk(text, source=file)
+
+            # Only chunks whose text changed need a new embedding, unless
+            # they duplicated a stored chunk that went away
+            old_ids = manifest.vector_ids(file)
+            stored = manifest.reusable_chunks(file, params) if incremental else {}
+            unchanged = {chunk.id for chunk in chunks
+                         if stored.get(chunk.id) == text_sha256(chunk.text) and dedup.has_role(chunk.id)}
+            released = [vector_id for vector_id in old_ids if vector_id not in unchanged]
+            # The BM25 index holds exactly the chunks that have vectors, also
+            # from before deduplication (or with its settings changed)
+            had_vectors = {vector_id for vector_id in released
+                           if vector_id in dedup.canonicals or vector_id in lexical}
+            release(released)
+            for vector_id in [vector_id for vector_id, source in orphaned.items() if source == file]:
+                unchanged.discard(vector_id)
+                del orphaned[vector_id]
+
+            changed, duplicates = [], 0
             for chunk in chunks:
-                response = openai.embeddings.create(
-                    input=chunk,
-                    model="text-embedding-ada-002"
-                )
-                embeddings.append(response.data[0].embedding)
-
-            # Save to Pinecone
-            for i, vector in enumerate(embeddings):
-                vector_id = f"{file.split('.')[0]}_chunk_{i}"
-                chunk_metadata = {
-                    "id": vector_id,
-                    "source": file,
-                    "chunk": i,
-                    "text": chunks[i]
-                }
-                index.upsert(vectors=[(vector_id, vector, chunk_metadata)])
-
-            print(f"Completed processing: {file}")
+                if chunk.id in unchanged:
+                    continue
+                canonical_id = dedup.assign(chunk.id, chunk.text, file)
+                if canonical_id is None:
+                    changed.append(chunk)
+                else:
+                    touched.add(canonical_id)
+                    duplicates += 1
+            stats["reused_chunks"] += len(unchanged)
+            stats["embedded_chunks"] += len(changed)
+            stats["duplicate_chunks"] += duplicates
+            pending_chunks.extend((file, chunk) for chunk in changed)
+            lexical.upsert([(chunk.id, None, chunk_metadata(file, chunk, dedup.sources(chunk.id)))
+                            for chunk in chunks if chunk.id in dedup.canonicals])
+
+            # The file got shorter, or chunks became duplicates: drop their vectors
+            stale_ids = sorted(vector_id for vector_id in had_vectors if vector_id not in dedup.canonicals)
+            delete_vectors(index, stale_ids)
+            lexical.delete(stale_ids)
+            stats["deleted_vectors"] += len(stale_ids)
+
+            pending_entries.append((file, content_hash, params, [(chunk.id, chunk.text) for chunk in chunks]))
+            if len(pending_chunks) >= config.EMBED_FLUSH_CHUNKS:
+                embed_pending()
+            if len(records) >= config.UPSERT_FLUSH_VECTORS:
+                flush()
+
+            print(f"Processed: {file} ({len(changed)}/{len(chunks)} chunks to embed, "
+                  f"{duplicates} near-duplicates)")
+
+        # Files holding duplicates orphaned this round get another pass
+        flush()
+        candidates = sorted(set(orphaned.values()) & set(pdf_files))
+        orphaned.clear()
+        first_round = False
+
+    print(f"Skipped {stats['skipped_files']} unchanged files, embedded {stats['embedded_chunks']} chunks, "
+          f"reused {stats['reused_chunks']} chunks, deleted {stats['deleted_vectors']} vectors")
+    print(f"Near-duplicates: {stats['duplicate_chunks']} chunks matched a stored chunk "
+          f"({stats['duplicate_chunks']} embedding calls saved); the index holds {len(dedup.canonicals)} vectors "
+          f"for {len(dedup.canonicals) + len(dedup.duplicates)} chunks ({len(dedup.duplicates)} entries saved)")
+    print(f"Embedding throughput: {engine.report}")
+    print(f"Upsert throughput: {upserts}")
 
 if __name__ == "__main__":
-    load_pdfs_to_vectordb() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load PDFs into the vector database.")
+    parser.add_argument("--full", action="store_true",
+                        help="re-embed every file instead of only what changed since the last run")
+    parser.add_argument("--backend", choices=["pinecone", "local"], default=config.VECTOR_BACKEND,
+                        help="vector store to build (default: VECTOR_BACKEND)")
+    args = parser.parse_args()
+    load_pdfs_to_vectordb(incremental=not args.full, backend=args.backend)
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""Local, in-process vector index used as an alternative to Pinecone.
+
+The index is a directory of immutable snapshots::
+
+    <directory>/CURRENT              name of the live snapshot
+    <directory>/<snapshot>/vectors.f32   (count, dimension) float32, unit rows
+    <directory>/<snapshot>/records.json  ids and metadata, in row order
+
+Readers memory-map ``vectors.f32`` read-only, so every gunicorn worker on a
+host shares one copy of the matrix through the page cache. Writers build a
+new snapshot and swap ``CURRENT`` atomically; readers notice the swap on
+their next search.
+
+:class:`LocalVectorIndex` implements the subset of the Pinecone ``Index``
+interface ingestion uses (``upsert``, ``delete``, ``update``), so ``bulk_upsert``,
+``delete_vectors`` and ``update_metadata`` work against it unchanged.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from src import config, metrics
+
+_KEEP_SNAPSHOTS = 2
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class LocalVectorIndex:
+    def __init__(self, directory=config.LOCAL_INDEX_DIR, dimension=1536):
+        self.directory = directory
+        self.dimension = dimension
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._vectors = np.zeros((0, dimension), dtype=np.float32)
+        self._ids = []
+        self._metadata = []
+        self._pending = None  # id -> (vector, metadata) while writing
+        self.reload()
+
+    # Reading
+
+    def _current_snapshot(self):
+        try:
+            with open(os.path.join(self.directory, "CURRENT"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        """Map the live snapshot if it changed since the last load."""
+        snapshot = self._current_snapshot()
+        if snapshot is None or snapshot == self._snapshot:
+            return
+        path = os.path.join(self.directory, snapshot)
+        with open(os.path.join(path, "records.json"), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        count = len(records["ids"])
+        vectors = (np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r",
+                             shape=(count, records["dimension"]))
+                   if count else np.zeros((0, records["dimension"]), dtype=np.float32))
+        with self._lock:
+            self._vectors = vectors
+            self._ids = records["ids"]
+            self._metadata = records["metadata"]
+            self.dimension = records["dimension"]
+            self._snapshot = snapshot
+
+    def __len__(self):
+        return len(self._ids)
+
+    def search(self, query_vector, k=8, score_threshold=None):
+        """Top-``k`` ``(id, score, metadata)`` by cosine similarity, best first."""
+        self.reload()
+        with self._lock:
+            vectors, ids, metadata = self._vectors, self._ids, self._metadata
+        if not ids:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = vectors @ query
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for row in top:
+            score = float(scores[row])
+            if score_threshold is not None and score < score_threshold:
+                break
+            results.append((ids[row], score, metadata[row]))
+        return results
+
+    # Writing (Pinecone Index compatible)
+
+    def _load_pending(self):
+        if self._pending is None:
+            self.reload()
+            self._pending = {
+                vector_id: (np.array(self._vectors[row]), self._metadata[row])
+                for row, vector_id in enumerate(self._ids)
+            }
+        return self._pending
+
+    def upsert(self, vectors, **kwargs):
+        with self._lock:
+            pending = self._load_pending()
+            for vector_id, values, metadata in vectors:
+                pending[vector_id] = (np.asarray(values, dtype=np.float32), metadata)
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids=None, delete_all=False, **kwargs):
+        with self._lock:
+            pending = self._load_pending()
+            if delete_all:
+                pending.clear()
+            for vector_id in ids or []:
+                pending.pop(vector_id, None)
+        return {}
+
+    def update(self, id, set_metadata=None, **kwargs):
+        """Merge ``set_metadata`` into a stored vector's metadata."""
+        with self._lock:
+            pending = self._load_pending()
+            if id in pending and set_metadata:
+                values, metadata = pending[id]
+                pending[id] = (values, {**metadata, **set_metadata})
+        return {}
+
+    def save(self):
+        """Write pending changes as a new snapshot and make it live."""
+        with self._lock:
+            if self._pending is None:
+                return
+            ids = sorted(self._pending)
+            snapshot = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{time.perf_counter_ns()}"
+            path = os.path.join(self.directory, snapshot)
+            os.makedirs(path)
+            matrix = (np.stack([self._pending[i][0] for i in ids])
+                      if ids else np.zeros((0, self.dimension), dtype=np.float32))
+            _normalize(matrix.astype(np.float32)).tofile(os.path.join(path, "vectors.f32"))
+            with open(os.path.join(path, "records.json"), "w", encoding="utf-8") as f:
+                json.dump({"dimension": self.dimension, "ids": ids,
+                           "metadata": [self._pending[i][1] for i in ids]}, f)
+
+            tmp_path = os.path.join(self.directory, "CURRENT.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+            os.replace(tmp_path, os.path.join(self.directory, "CURRENT"))
+            self._prune(keep=snapshot)
+        self.reload()
+
+    def _prune(self, keep):
+        snapshots = sorted(
+            (entry for entry in os.listdir(self.directory)
+             if os.path.isdir(os.path.join(self.directory, entry))),
+            key=lambda entry: os.path.getmtime(os.path.join(self.directory, entry)),
+        )
+        for entry in snapshots[:-_KEEP_SNAPSHOTS]:
+            if entry != keep:
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+
+class LocalIndexRetriever(BaseRetriever):
+    """Retriever over a :class:`LocalVectorIndex` with Pinecone-like results."""
+
+    index: LocalVectorIndex
+    embeddings: object
+    k: int = 8
+    score_threshold: float = 0.6
+    text_key: str = "text"
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _to_documents(self, matches):
+        documents = []
+        for _, score, metadata in matches:
+            metadata = dict(metadata)
+            text = metadata.pop(self.text_key, "")
+            documents.append(Document(page_content=text, metadata={**metadata, "score": score}))
+        return documents
+
+    def get_documents_by_vector(self, vector, query=None):
+        with metrics.stage("vector_search"):
+            return self._to_documents(self.index.search(vector, self.k, self.score_threshold))
+
+    async def aget_documents_by_vector(self, vector, query=None):
+        return self.get_documents_by_vector(vector)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        with metrics.stage("embed"):
+            vector = self.embeddings.embed_query(query)
+        return self.get_documents_by_vector(vector)
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        with metrics.stage("embed"):
+            vector = await self.embeddings.aembed_query(query)
+        return self.get_documents_by_vector(vector)
@@ -0,0 +1,82 @@
+"""Local manifest of what ingestion has already written to the vector store."""
+
+import hashlib
+import json
+import os
+from src import config
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Hex SHA-256 of a file's contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """Per-file record of content hash, chunking/embedding settings and vector ids.
+
+    Each entry looks like::
+
+        {"sha256": ..., "params": {"chunk_size": 800, ...},
+         "chunks": [{"id": "<name>_chunk_0", "sha256": <chunk text hash>}, ...]}
+
+    ``params`` holds everything that changes the vectors a file produces; an
+    entry whose params differ from the current run is treated as stale.
+    """
+
+    def __init__(self, path=config.INGEST_MANIFEST_PATH):
+        self.path = path
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.files = data.get("files", {})
+
+    def get(self, name):
+        return self.files.get(name)
+
+    def is_unchanged(self, name, sha256, params):
+        entry = self.files.get(name)
+        return entry is not None and entry["sha256"] == sha256 and entry["params"] == params
+
+    def reusable_chunks(self, name, params):
+        """Map ``vector id -> chunk text hash`` for vectors still valid under ``params``."""
+        entry = self.files.get(name)
+        if entry is None or entry["params"] != params:
+            return {}
+        return {chunk["id"]: chunk["sha256"] for chunk in entry["chunks"]}
+
+    def vector_ids(self, name):
+        entry = self.files.get(name)
+        return [chunk["id"] for chunk in entry["chunks"]] if entry else []
+
+    def record(self, name, sha256, params, chunks):
+        """Record ``chunks`` as ``[(vector_id, chunk_text), ...]`` for a file."""
+        self.files[name] = {
+            "sha256": sha256,
+            "params": params,
+            "chunks": [{"id": vector_id, "sha256": text_sha256(text)} for vector_id, text in chunks],
+        }
+
+    def remove(self, name):
+        self.files.pop(name, None)
+
+    def save(self):
+        """Write the manifest atomically so an interrupted run never corrupts it."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
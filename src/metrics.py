@@ -0,0 +1,331 @@
+"""Per-stage latency timers and Prometheus-style metrics shared across workers.
+
+Code under a request wraps each stage in :func:`stage`::
+
+    with metrics.stage("vector_search"):
+        documents = index.query(...)
+
+which observes the duration in the ``paddleprompt_stage_seconds`` histogram
+and, inside a request started with :func:`start_request`, adds it to that
+request's timings so :func:`finish_request` can return them as a
+``Server-Timing`` header. LLM calls are timed by the callback handler from
+:func:`llm_timer` (in ``src/llm_timing.py``), since they happen inside the
+LangChain chains.
+
+Each worker keeps its counters, histograms and gauges in memory and writes them to
+``METRICS_DIR/<pid>.json`` (atomically, at most every
+``METRICS_FLUSH_INTERVAL`` seconds). :func:`render` merges every worker's
+file, so ``/metrics`` reports the same totals whichever worker serves the
+scrape; worker gauges (:func:`set_gauge`) are summed over the live
+workers. gunicorn clears the directory on start and folds the file of each
+worker that exits into ``retired.json`` (:func:`retire`), so totals survive
+worker recycling without the directory growing.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from src import config
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RETIRED_FILE = "retired.json"
+
+HELP = {
+    "paddleprompt_stage_seconds": ("histogram", "Time spent in each stage of answering a query."),
+    "paddleprompt_request_seconds": ("histogram", "Time to produce a response, by endpoint and status."),
+    "paddleprompt_tokens_total": ("counter", "Tokens sent to and generated by the LLM, and fitted into prompts."),
+    "paddleprompt_cache_requests_total": ("counter", "Answer and embedding cache lookups by result."),
+    "paddleprompt_coalesced_requests_total": ("counter", "Queries answered by an identical query already in flight, by scope (worker or host)."),
+    "paddleprompt_sessions": ("gauge", "Conversation sessions in the session store."),
+    "paddleprompt_admission_queue_depth": ("gauge", "Queries waiting for an admission slot, summed over workers."),
+    "paddleprompt_admission_in_flight": ("gauge", "Queries holding an admission slot, summed over workers."),
+    "paddleprompt_admission_rejections_total": ("counter", "Queries rejected with 429 by admission control, by reason."),
+    "paddleprompt_upstream_calls_total": ("counter", "Embedding, vector search and chat calls by outcome (ok, error, timeout, rejected)."),
+    "paddleprompt_hedged_calls_total": ("counter", "Hedged upstream calls by the attempt that answered first."),
+    "paddleprompt_circuit_open": ("gauge", "Workers whose circuit breaker for the upstream is open."),
+    "paddleprompt_degraded_answers_total": ("counter", "Answers or retrievals degraded because an upstream was unavailable."),
+    "paddleprompt_session_evictions_total": ("counter", "Sessions evicted from the session store, by reason."),
+}
+
+_request = contextvars.ContextVar("paddleprompt_request_timings", default=None)
+
+
+class RequestTimings:
+    """Stage durations of one request, in the order stages first finished."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self, total):
+        with self._lock:
+            entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        return ", ".join(entries + [f"total;dur={total * 1000:.1f}"])
+
+
+class _Metrics:
+    """This process's counters, histograms and gauges."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self.gauges = {}      # (name, labels) -> value
+        self.lock = threading.Lock()
+        self.flushed_at = 0.0
+        self.dirty = False
+
+
+_state = _Metrics()
+_state_lock = threading.Lock()
+
+
+def _metrics():
+    global _state
+    if _state.pid != os.getpid():
+        # Inherited from the gunicorn master; each worker counts its own
+        with _state_lock:
+            if _state.pid != os.getpid():
+                _state = _Metrics()
+    return _state
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def count(name, amount=1, **labels):
+    """Add ``amount`` to a counter."""
+    if not config.METRICS_ENABLED or not amount:
+        return
+    state = _metrics()
+    key = (name, _labels(labels))
+    with state.lock:
+        state.counters[key] = state.counters.get(key, 0) + amount
+        state.dirty = True
+
+
+def set_gauge(name, value, **labels):
+    """Set this worker's value of a gauge; ``/metrics`` sums it over live workers."""
+    if not config.METRICS_ENABLED:
+        return
+    state = _metrics()
+    key = (name, _labels(labels))
+    with state.lock:
+        if state.gauges.get(key) != value:
+            state.gauges[key] = value
+            state.dirty = True
+
+
+def observe(name, seconds, **labels):
+    """Record one observation in a histogram."""
+    if not config.METRICS_ENABLED:
+        return
+    state = _metrics()
+    key = (name, _labels(labels))
+    with state.lock:
+        histogram = state.histograms.get(key)
+        if histogram is None:
+            histogram = state.histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+                break
+        else:
+            histogram[len(BUCKETS)] += 1
+        histogram[-1] += seconds
+        state.dirty = True
+
+
+def record_stage(name, seconds):
+    observe("paddleprompt_stage_seconds", seconds, stage=name)
+    timings = _request.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as stage ``name``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def timed(name, fn):
+    """Wrap ``fn`` so each call is timed as stage ``name``."""
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def llm_timer():
+    """Callback handler timing the LLM calls of the current request."""
+    # Imported here so serving /health and /metrics does not load LangChain
+    from src.llm_timing import LLMTimingHandler
+    return LLMTimingHandler(_request.get())
+
+
+def start_request():
+    """Start collecting stage timings for the current request; returns a reset token."""
+    return _request.set(RequestTimings())
+
+
+def finish_request(token, endpoint, status):
+    """Record the request's duration; returns its ``Server-Timing`` header value."""
+    timings = _request.get()
+    try:
+        _request.reset(token)
+    except ValueError:
+        # Finished from a copy of the request's context (e.g. a streaming task)
+        _request.set(None)
+    if timings is None:
+        return None
+    total = time.perf_counter() - timings.started
+    observe("paddleprompt_request_seconds", total, endpoint=endpoint, status=status)
+    flush()
+    return timings.server_timing(total)
+
+
+# Sharing across workers
+
+def _snapshot(state):
+    with state.lock:
+        state.dirty = False
+        return {
+            "counters": [[name, dict(labels), value] for (name, labels), value in state.counters.items()],
+            "histograms": [[name, dict(labels), list(values)] for (name, labels), values in state.histograms.items()],
+            "gauges": [[name, dict(labels), value] for (name, labels), value in state.gauges.items()],
+        }
+
+
+def _write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def flush(force=False):
+    """Write this worker's metrics for other workers to read (throttled unless ``force``)."""
+    if not config.METRICS_ENABLED:
+        return
+    state = _metrics()
+    now = time.monotonic()
+    if not state.dirty or (not force and now - state.flushed_at < config.METRICS_FLUSH_INTERVAL):
+        return
+    state.flushed_at = now
+    os.makedirs(config.METRICS_DIR, exist_ok=True)
+    _write(os.path.join(config.METRICS_DIR, f"{os.getpid()}.json"), _snapshot(state))
+
+
+def _merge(into, data):
+    counters, histograms, gauges = into
+    for name, labels, value in data.get("counters", []):
+        key = (name, _labels(labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, values in data.get("histograms", []):
+        key = (name, _labels(labels))
+        current = histograms.get(key)
+        histograms[key] = list(values) if current is None else [a + b for a, b in zip(current, values)]
+    for name, labels, value in data.get("gauges", []):
+        key = (name, _labels(labels))
+        gauges[key] = gauges.get(key, 0) + value
+
+
+def _read(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def collect():
+    """Counters and histograms summed over every worker, live and retired, and
+    gauges summed over the live ones."""
+    flush(force=True)
+    merged = ({}, {}, {})
+    if os.path.isdir(config.METRICS_DIR):
+        for entry in os.listdir(config.METRICS_DIR):
+            if entry.endswith(".json"):
+                _merge(merged, _read(os.path.join(config.METRICS_DIR, entry)))
+    return merged
+
+
+def retire(pid):
+    """Fold an exited worker's metrics into ``retired.json`` (run by the gunicorn master)."""
+    path = os.path.join(config.METRICS_DIR, f"{pid}.json")
+    data = _read(path)
+    if not data:
+        return
+    retired_path = os.path.join(config.METRICS_DIR, RETIRED_FILE)
+    merged = ({}, {}, {})
+    _merge(merged, _read(retired_path))
+    _merge(merged, data)
+    _write(retired_path, {
+        "counters": [[name, dict(labels), value] for (name, labels), value in merged[0].items()],
+        "histograms": [[name, dict(labels), values] for (name, labels), values in merged[1].items()],
+    })
+    os.remove(path)
+
+
+def clear():
+    """Remove every worker's metrics (run by the gunicorn master on start)."""
+    if os.path.isdir(config.METRICS_DIR):
+        for entry in os.listdir(config.METRICS_DIR):
+            if entry.endswith(".json") or entry.endswith(".tmp"):
+                os.remove(os.path.join(config.METRICS_DIR, entry))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def render(gauges=()):
+    """Prometheus text exposition of the merged metrics plus ``gauges``.
+
+    ``gauges`` are ``(name, labels, value)`` read at scrape time from state
+    every worker shares (e.g. the SQLite session store).
+    """
+    counters, histograms, worker_gauges = collect()
+    families = {}
+    for (name, labels), value in counters.items():
+        families.setdefault(name, []).append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), value in sorted(worker_gauges.items()):
+        families.setdefault(name, []).append(f"{name}{_format_labels(labels)} {value}")
+    for name, labels, value in gauges:
+        families.setdefault(name, []).append(f"{name}{_format_labels(_labels(labels))} {value}")
+    for (name, labels), values in sorted(histograms.items()):
+        lines = families.setdefault(name, [])
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS, values):
+            cumulative += bucket
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', repr(bound))])} {cumulative}")
+        cumulative += values[len(BUCKETS)]
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {values[-1]}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    output = []
+    for name in sorted(families):
+        kind, description = HELP.get(name, ("untyped", name))
+        output.append(f"# HELP {name} {description}")
+        output.append(f"# TYPE {name} {kind}")
+        output.extend(families[name])
+    return "\n".join(output) + "\n"
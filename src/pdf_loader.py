@@ -1,15 +1,171 @@
-"""PDF loading functionality."""
+"""PDF loading functionality.
 
+Text comes from each page's text layer. Scanned pages have none, so a
+page with fewer than ``OCR_MIN_CHARS`` characters of text that does
+contain an image is OCRed instead. OCR runs only on those pages, one page
+per task on a process pool of ``OCR_WORKERS``. Each page is rendered at
+``OCR_DPI`` and passed to Tesseract (``pytesseract``, which needs the
+``tesseract-ocr`` binary). The result is cached under ``OCR_CACHE_DIR`` by
+a hash of the rendered page, so re-ingesting a file never OCRs the same
+page twice.
+"""
+
+import hashlib
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import fitz
+from src import config
+
 
 class PDFLoader:
     def __init__(self, pdf_path):
         self.pdf_path = pdf_path
 
+    def iter_pages(self):
+        """Yield the text of each page, closing the document when done."""
+        with fitz.open(self.pdf_path) as doc:
+            for page in doc:
+                yield page.get_text()  # type: ignore
+
     def extract_text(self):
-        doc = fitz.open(self.pdf_path)
-        text = ""
+        return "".join(self.iter_pages())
+
+
+def _call(worker, pdf_path):
+    try:
+        return pdf_path, worker(pdf_path), None
+    except Exception as e:
+        return pdf_path, None, e
+
+
+def map_pdfs(worker, pdf_paths, max_workers=config.EXTRACT_WORKERS, prefetch=2):
+    """Run ``worker(pdf_path)`` on a process pool, yielding ``(pdf_path, result)``.
+
+    Results come back in the order given. At most ``max_workers * prefetch``
+    documents are processed ahead of the consumer, so memory stays bounded
+    however large the corpus is and the work overlaps whatever the consumer
+    does with the results. ``worker`` must be a module-level function.
+    Files it raises on are reported and skipped.
+    """
+    pdf_paths = iter(pdf_paths)
+    window = max(1, max_workers * prefetch)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = deque()
+        for pdf_path in pdf_paths:
+            in_flight.append(pool.submit(_call, worker, pdf_path))
+            if len(in_flight) >= window:
+                break
+        while in_flight:
+            pdf_path, result, error = in_flight.popleft().result()
+            next_path = next(pdf_paths, None)
+            if next_path is not None:
+                in_flight.append(pool.submit(_call, worker, next_path))
+            if error is not None:
+                print(f"Error processing {os.path.basename(pdf_path)}: {error}")
+                continue
+            yield pdf_path, result
+            del result
+
+
+def needs_ocr(page, text):
+    """Whether ``page`` has no usable text layer but something to read."""
+    return len(text.strip()) < config.OCR_MIN_CHARS and bool(page.get_images())
+
+
+def _extract_pages(pdf_path):
+    """Worker: ``(page texts, page numbers to OCR)`` for one document."""
+    texts, scanned = [], []
+    with fitz.open(pdf_path) as doc:
+        for page_number, page in enumerate(doc):
+            text = page.get_text()  # type: ignore
+            if needs_ocr(page, text):
+                scanned.append(page_number)
+            texts.append(text)
+    return texts, scanned
+
+
+def _ocr_cache_path(key):
+    return os.path.join(config.OCR_CACHE_DIR, key[:2], f"{key}.txt")
+
+
+def ocr_page(pdf_path, page_number, dpi=config.OCR_DPI, language=config.OCR_LANGUAGE):
+    """Worker: ``(text, cached)`` for one page, from the OCR cache or Tesseract."""
+    with fitz.open(pdf_path) as doc:
+        pixmap = doc[page_number].get_pixmap(dpi=dpi)
+    digest = hashlib.sha256(pixmap.samples)
+    digest.update(f"{pixmap.width}x{pixmap.height}x{pixmap.n}:{dpi}:{language}".encode("utf-8"))
+    path = _ocr_cache_path(digest.hexdigest())
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read(), True
+    except FileNotFoundError:
+        pass
+
+    import pytesseract
+    from PIL import Image
+    mode = {1: "L", 3: "RGB", 4: "RGBA"}[pixmap.n]
+    text = pytesseract.image_to_string(Image.frombytes(mode, (pixmap.width, pixmap.height), pixmap.samples),
+                                       lang=language)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return text, False
+
+
+def ocr_pages(pool, pdf_path, texts, scanned):
+    """Replace the text of the ``scanned`` pages with their OCR output, in parallel on ``pool``."""
+    started = time.perf_counter()
+    futures = [(page_number, pool.submit(ocr_page, pdf_path, page_number)) for page_number in scanned]
+    cached, failed = 0, 0
+    for page_number, future in futures:
+        try:
+            text, hit = future.result()
+        except Exception as e:
+            failed += 1
+            last_error = e
+            continue
+        texts[page_number] = text
+        cached += hit
+    print(f"OCR: {os.path.basename(pdf_path)}: {len(scanned)} pages ({cached} cached"
+          + (f", {failed} failed: {last_error}" if failed else "")
+          + f") in {time.perf_counter() - started:.1f}s")
+    return texts
+
+
+def iter_pdf_pages(pdf_paths, max_workers=config.EXTRACT_WORKERS, prefetch=2, ocr=config.OCR_ENABLED):
+    """Extract documents on a process pool, yielding ``(pdf_path, page_number, text)``.
+
+    Documents come back in the order given, page by page, extracted ahead
+    of the consumer as in :func:`map_pdfs`. With ``ocr``, pages without a
+    text layer are OCRed on a second pool while later documents keep
+    extracting. Unreadable files are reported and skipped.
+    """
+    ocr_pool = None
+    try:
+        for pdf_path, (texts, scanned) in map_pdfs(_extract_pages, pdf_paths, max_workers, prefetch):
+            if ocr and scanned:
+                if ocr_pool is None:
+                    ocr_pool = ProcessPoolExecutor(max_workers=config.OCR_WORKERS)
+                texts = ocr_pages(ocr_pool, pdf_path, texts, scanned)
+            for page_number, text in enumerate(texts):
+                yield pdf_path, page_number, text
+    finally:
+        if ocr_pool is not None:
+            ocr_pool.shutdown()
+
 
-        for page in doc:
-            text += page.get_text()  # type: ignore
-        return text 
\ No newline at end of file
+def iter_pdf_texts(pdf_paths, max_workers=config.EXTRACT_WORKERS, prefetch=2, ocr=config.OCR_ENABLED):
+    """Like :func:`iter_pdf_pages` but yields ``(pdf_path, full_text)`` per document."""
+    current_path, pages = None, []
+    for pdf_path, _, text in iter_pdf_pages(pdf_paths, max_workers, prefetch, ocr):
+        if pdf_path != current_path:
+            if current_path is not None:
+                yield current_path, "".join(pages)
+            current_path, pages = pdf_path, []
+        pages.append(text)
+    if current_path is not None:
+        yield current_path, "".join(pages)
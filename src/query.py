@@ -1,48 +1,136 @@
 """Script for querying the vector database."""
 
-import os
-from dotenv import load_dotenv
-from pinecone import Pinecone
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from langchain_pinecone import PineconeVectorStore
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.callbacks import UsageMetadataCallbackHandler
 from langchain_core.prompts import ChatPromptTemplate
-from pydantic import SecretStr
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import RunnableLambda
+from dataclasses import asdict, dataclass, field
+from src import config, metrics, registry, resilience
+from src.answer_cache import AnswerCache
+from src.chunking import get_encoding
+from src.coalescing import SingleFlight, flight_key
+from src.context_packer import ContextPacker
+from src.history import HistoryManager, is_summary
+from src.lexical_index import HybridRetriever
+from src.local_index import LocalIndexRetriever
 
-def setup_qa_chain():
-    """Set up the QA chain with Pinecone and OpenAI."""
-    load_dotenv()
+logger = logging.getLogger(__name__)
 
-    # Get API keys
-    pinecone_api_key = os.getenv("PINECONE_API_KEY")
-    openai_api_key = os.getenv("OPENAI_API_KEY")
+FALLBACK_ANSWER = (
+    "I don't have specific information about that in the available documents, but I can help with "
+    "questions about concrete canoe projects, engineering design, construction materials, and related "
+    "technical topics. Could you rephrase your question or ask about something more specific to the "
+    "concrete canoe domain?"
+)
 
-    if not pinecone_api_key or not openai_api_key:
-        raise ValueError("API keys not set in .env file")
+# Served when an upstream is unavailable (see src/resilience.py)
+DEGRADED_ANSWER = (
+    "I can't reach the document search or the language model right now, so I can't give you a "
+    "reliable answer. Please try again in a few moments."
+)
 
-    # Initialize Pinecone
-    pc = Pinecone(api_key=pinecone_api_key)
-    index = pc.Index("text-analyzer")
+@dataclass
+class QueryResult:
+    """An answer plus how it was produced."""
+    answer: str
+    cache_hit: bool = False
+    cache_tier: str = None
+    stats: dict = field(default_factory=dict)
+    history: list = None  # history the answer was produced with, summary first
+    degraded: str = None  # unavailable upstream, when the answer is DEGRADED_ANSWER
 
-    # Set up OpenAI components
-    embedding_model = OpenAIEmbeddings(api_key=SecretStr(openai_api_key))
-    llm = ChatOpenAI(
-        temperature=0.5, 
-        api_key=SecretStr(openai_api_key),
-        model="gpt-3.5-turbo"  # Faster and cheaper than GPT-4
-    )
+class PineconeRetriever(BaseRetriever):
+    """Similarity retriever over a Pinecone vector store.
+
+    Same results as ``vector_store.as_retriever()``, but the async path
+    embeds the query with the async OpenAI client and runs the Pinecone
+    query on the shared, pooled sync index in a bounded thread pool.
+    ``PineconeVectorStore``'s own async methods open a fresh async index
+    client (and connections) for every query. Queries go through the
+    hedged ``vector_search`` upstream of ``src/resilience.py``.
+    """
+
+    vector_store: PineconeVectorStore
+    search_kwargs: dict = {}
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        with metrics.stage("embed"):
+            vector = self.vector_store.embeddings.embed_query(query)
+        return self.get_documents_by_vector(vector)
 
-    # Create vector store and retriever
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        with metrics.stage("embed"):
+            vector = await self.vector_store.embeddings.aembed_query(query)
+        return await self.aget_documents_by_vector(vector)
+
+    def _search(self, vector):
+        # PineconeVectorStore only implements the scored variant; like
+        # similarity_search, it takes ``k`` and ignores ``score_threshold``
+        k = self.search_kwargs.get("k", 4)
+        return [document for document, _ in self.vector_store.similarity_search_by_vector_with_score(vector, k=k)]
+
+    def get_documents_by_vector(self, vector, query=None):
+        search = partial(self._search, vector)
+        with metrics.stage("vector_search"):
+            return resilience.call("vector_search", search, hedge=True)
+
+    async def aget_documents_by_vector(self, vector, query=None):
+        # Timed here rather than in the pool thread, which has no request context
+        search = partial(self._search, vector)
+        loop = asyncio.get_running_loop()
+        with metrics.stage("vector_search"):
+            return await resilience.acall(
+                "vector_search", lambda: loop.run_in_executor(registry.get_blocking_executor(), search), hedge=True)
+
+def build_vector_retriever():
+    """Create a vector retriever for the configured backend over the shared clients."""
+    if config.VECTOR_BACKEND == "local":
+        return LocalIndexRetriever(
+            index=registry.get_local_index(),
+            embeddings=registry.get_embedding_model(),
+            k=8,
+            score_threshold=0.6
+        )
     vector_store = PineconeVectorStore(
-        index=index,
-        embedding=embedding_model,
+        index=registry.get_pinecone_index(),
+        embedding=registry.get_embedding_model(),
         text_key="text"
     )
-    retriever = vector_store.as_retriever(
+    return PineconeRetriever(
+        vector_store=vector_store,
         search_kwargs={"k": 8, "score_threshold": 0.6}
     )
 
+def build_retriever():
+    """Create the retriever: vector search, fused with BM25 when hybrid retrieval is on."""
+    vector_retriever = build_vector_retriever()
+    if not config.HYBRID_RETRIEVAL_ENABLED:
+        return vector_retriever
+    return HybridRetriever(
+        vector_retriever=vector_retriever,
+        lexical_index=registry.get_lexical_index(),
+        embeddings=registry.get_embedding_model(),
+        executor=registry.get_blocking_executor(),
+        k=8
+    )
+
+def setup_qa_chain():
+    """Set up the QA chain with Pinecone and OpenAI."""
+    registry.get_api_keys()
+
+    # Shared clients; only the chain itself is assembled here
+    llm = registry.get_chat_model(temperature=0.5)
+    retriever = build_context_step()
+
     # Create system prompt
     system_prompt = (
         "**You are an AI assistant that answers questions based on the provided context from documents. **"
@@ -72,41 +160,22 @@ def setup_qa_chain():
     
     return rag_chain
 
-def setup_qa_chain_with_history():
-    """Set up the QA chain with conversation history support."""
-    load_dotenv()
-
-    # Get API keys
-    pinecone_api_key = os.getenv("PINECONE_API_KEY")
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-
-    if not pinecone_api_key or not openai_api_key:
-        raise ValueError("API keys not set in .env file")
+def setup_answer_chain_with_history():
+    """Set up the answering half of the history-aware QA chain.
 
-    # Initialize Pinecone
-    pc = Pinecone(api_key=pinecone_api_key)
-    index = pc.Index("text-analyzer")
+    Takes ``input``, ``conversation_history`` and already retrieved
+    ``context`` documents; :func:`setup_qa_chain_with_history` puts the
+    retriever in front of it.
+    """
+    registry.get_api_keys()
 
-    # Set up OpenAI components
-    embedding_model = OpenAIEmbeddings(api_key=SecretStr(openai_api_key))
-    llm = ChatOpenAI(
-        temperature=0.3, 
-        api_key=SecretStr(openai_api_key),
-        model="gpt-3.5-turbo",
+    # Shared clients; only the chain itself is assembled here
+    llm = registry.get_chat_model(
+        temperature=0.3,
         frequency_penalty=0.3,
         presence_penalty=0.1
     )
 
-    # Create vector store and retriever
-    vector_store = PineconeVectorStore(
-        index=index,
-        embedding=embedding_model,
-        text_key="text"
-    )
-    retriever = vector_store.as_retriever(
-        search_kwargs={"k": 8, "score_threshold": 0.6}
-    )
-
     # Create system prompt with conversation history support
     system_prompt = (
         "**You are an AI assistant that answers questions based on the provided context from documents. **"
@@ -133,43 +202,517 @@ def setup_qa_chain_with_history():
         ("human", "{input}"),
     ])
 
-    # Create document chain and retrieval chain
-    question_answer_chain = create_stuff_documents_chain(llm, prompt)
-    rag_chain = create_retrieval_chain(retriever, question_answer_chain)
-    
-    return rag_chain
+    return create_stuff_documents_chain(llm, prompt)
+
+def setup_qa_chain_with_history():
+    """Set up the QA chain with conversation history support."""
+    return create_retrieval_chain(build_context_step(), get_answer_chain_with_history())
+
+def get_retriever():
+    """Return this process's retriever, building it on first use."""
+    return registry.get_or_create("retriever", build_retriever)
+
+def get_context_packer():
+    """Return this process's context packer, or ``None`` when disabled."""
+    if not config.CONTEXT_PACKING_ENABLED:
+        return None
+    return registry.get_or_create("context_packer", ContextPacker)
+
+def build_context_step():
+    """Retrieval for ``create_retrieval_chain``: the retriever, then the context packer."""
+    retriever = get_retriever()
+    packer = get_context_packer()
+    if packer is None:
+        return retriever
+    return ((lambda x: x["input"]) | retriever | RunnableLambda(metrics.timed("pack", packer.pack))).with_config(
+        run_name="retrieve_and_pack_documents")
+
+def pack_context(documents):
+    """Apply the context packer (if enabled) to documents retrieved outside a chain."""
+    packer = get_context_packer()
+    if packer is None:
+        return documents
+    with metrics.stage("pack"):
+        return packer.pack(documents)
+
+def get_answer_chain_with_history():
+    """Return this process's history-aware answer chain (no retrieval)."""
+    return registry.get_or_create("answer_chain_with_history",
+                                  metrics.timed("chain_setup", setup_answer_chain_with_history))
+
+def get_qa_chain():
+    """Return this process's QA chain, building it on first use."""
+    return registry.get_or_create("qa_chain", metrics.timed("chain_setup", setup_qa_chain))
+
+def get_qa_chain_with_history():
+    """Return this process's history-aware QA chain, building it on first use."""
+    return registry.get_or_create("qa_chain_with_history",
+                                  metrics.timed("chain_setup", setup_qa_chain_with_history))
+
+def warm_up():
+    """Build the chains and open upstream connections ahead of the first request."""
+    get_qa_chain()
+    get_qa_chain_with_history()
+    get_answer_cache()
+    # Loading the tokenizer's vocabulary takes a while; history fitting needs it
+    get_encoding()
+    if config.WARM_CONNECTIONS:
+        registry.warm_connections()
 
 def query_documents(question: str) -> str:
     """Query the vector database with a question."""
-    qa_chain = setup_qa_chain()
+    qa_chain = get_qa_chain()
     response = qa_chain.invoke({"input": question})
 
     # If the answer is empty or very short, try to provide a more helpful response
     if len(response['answer']) == 0 or len(response['answer'].strip()) < 10:
-        return "I don't have specific information about that in the available documents, but I can help with questions about concrete canoe projects, engineering design, construction materials, and related technical topics. Could you rephrase your question or ask about something more specific to the concrete canoe domain?"
+        return FALLBACK_ANSWER
     return response['answer']
 
-def query_documents_with_history(question: str, conversation_history: list) -> str:
-    """Query the vector database with a question and conversation history."""
-    qa_chain = setup_qa_chain_with_history()
-    
-    # Format conversation history for the prompt
-    formatted_history = ""
+def get_answer_cache():
+    """Return this process's answer cache, or ``None`` when disabled."""
+    if not config.ANSWER_CACHE_ENABLED:
+        return None
+    return registry.get_or_create("answer_cache", AnswerCache)
+
+def get_history_manager():
+    """Return this process's history manager."""
+    return registry.get_or_create("history_manager", HistoryManager)
+
+def get_summary_model():
+    """Chat model used to fold old turns into the conversation summary."""
+    return registry.get_chat_model(temperature=0, max_tokens=config.SUMMARY_MAX_TOKENS)
+
+def format_history(conversation_history: list) -> str:
+    """Format conversation history for the prompt."""
+    if not conversation_history:
+        return ""
+    return "\n".join([
+        f"Summary of earlier conversation: {msg['content']}" if is_summary(msg)
+        else f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}"
+        for msg in conversation_history
+    ])
+
+def usage_stats(fitted, usage_handler=None, context=None) -> dict:
+    """Per-request token counts: history fitting, context packing and the LLM's reported usage."""
+    stats = {**fitted.stats, **getattr(context, "stats", {})}
+    if usage_handler is not None and usage_handler.usage_metadata:
+        usage = list(usage_handler.usage_metadata.values())
+        stats["prompt_tokens"] = sum(u.get("input_tokens", 0) for u in usage)
+        stats["completion_tokens"] = sum(u.get("output_tokens", 0) for u in usage)
+    for kind in ("prompt", "completion", "history", "context"):
+        metrics.count("paddleprompt_tokens_total", stats.get(f"{kind}_tokens", 0), kind=kind)
+    return stats
+
+def count_cache_lookup(tier):
+    """Count an answer cache lookup; ``tier`` is the hit tier or ``None`` for a miss."""
+    metrics.count("paddleprompt_cache_requests_total", cache="answer", result=tier or "miss")
+
+def lookup_answer(cache, question, conversation_history, embed):
+    """``cache.get`` timed as the ``cache_lookup`` stage and counted.
+
+    A question that cannot be embedded right now misses the semantic tier.
+    """
+    with metrics.stage("cache_lookup"):
+        try:
+            answer, tier = cache.get(question, conversation_history, embed=embed)
+        except resilience.Unavailable:
+            answer, tier = None, None
+    count_cache_lookup(tier)
+    return answer, tier
+
+async def alookup_answer(cache, question, conversation_history, embed):
+    """Async :func:`lookup_answer`."""
+    with metrics.stage("cache_lookup"):
+        try:
+            answer, tier = await cache.aget(question, conversation_history, embed=embed)
+        except resilience.Unavailable:
+            answer, tier = None, None
+    count_cache_lookup(tier)
+    return answer, tier
+
+def cache_embedding(embed, question, conversation_history):
+    """Embedding to cache a fresh answer under, or ``None`` (with history, or when unavailable)."""
     if conversation_history:
-        formatted_history = "\n".join([
-            f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}" 
-            for msg in conversation_history
-        ])
-    
-    response = qa_chain.invoke({
-        "input": question,
-        "conversation_history": formatted_history
-    })
+        return None
+    try:
+        return embed(question)
+    except resilience.Unavailable:
+        return None
+
+async def acache_embedding(embed, question, conversation_history):
+    """Async :func:`cache_embedding`."""
+    if conversation_history:
+        return None
+    try:
+        return await embed(question)
+    except resilience.Unavailable:
+        return None
+
+def degraded_result(error, history):
+    """The answer served when an upstream is unavailable, or ``error`` re-raised
+    when degraded answers are off."""
+    if not config.RESILIENCE_DEGRADE:
+        raise error
+    logger.debug("Serving a degraded answer: %s", error.message)
+    metrics.count("paddleprompt_degraded_answers_total", upstream=error.upstream)
+    return QueryResult(answer=DEGRADED_ANSWER, history=history, degraded=error.upstream)
+
+def fit_history(conversation_history):
+    """Fit the history into its token budget, timed as the ``history`` stage."""
+    with metrics.stage("history"):
+        return get_history_manager().fit(conversation_history, llm=get_summary_model())
+
+async def afit_history(conversation_history):
+    """Async :func:`fit_history`."""
+    with metrics.stage("history"):
+        return await get_history_manager().afit(conversation_history, llm=get_summary_model())
+
+def get_single_flight():
+    # A degraded answer is not shared: followers try the upstreams themselves
+    return registry.get_or_create("single_flight", lambda: SingleFlight(
+        encode=asdict, decode=lambda data: QueryResult(**data), share=lambda result: not result.degraded))
+
+def answer_question(question: str, conversation_history: list) -> QueryResult:
+    """Answer a question with conversation history.
+
+    Identical questions (same normalized text and history) in flight at the
+    same time, in this worker or another on the host, share one answer.
+    """
+    if not config.COALESCING_ENABLED:
+        return _answer_question(question, conversation_history)
+    return get_single_flight().run(flight_key(question, conversation_history),
+                                   lambda: _answer_question(question, conversation_history))
+
+async def aanswer_question(question: str, conversation_history: list) -> QueryResult:
+    """Async :func:`answer_question`; upstream waits yield to the event loop."""
+    if not config.COALESCING_ENABLED:
+        return await _aanswer_question(question, conversation_history)
+    return await get_single_flight().arun(flight_key(question, conversation_history),
+                                          lambda: _aanswer_question(question, conversation_history))
+
+def _answer_question(question: str, conversation_history: list) -> QueryResult:
+    """Answer a question with conversation history, consulting the answer cache first."""
+    cache = get_answer_cache()
+    embedding = []
+
+    def embed(text):
+        # Goes through the embedding cache, so the retriever reuses this vector
+        if not embedding:
+            with metrics.stage("embed"):
+                embedding.append(registry.get_embedding_model().embed_query(text))
+        return embedding[0]
+
+    if cache is not None:
+        answer, tier = lookup_answer(cache, question, conversation_history, embed)
+        if answer is not None:
+            return QueryResult(answer=answer, cache_hit=True, cache_tier=tier, history=conversation_history)
+
+    try:
+        fitted = fit_history(conversation_history)
+        usage = UsageMetadataCallbackHandler()
+        qa_chain = get_qa_chain_with_history()
+        response = qa_chain.invoke({
+            "input": question,
+            "conversation_history": format_history(fitted.history)
+        }, config={"callbacks": [usage, metrics.llm_timer()]})
+    except resilience.Unavailable as e:
+        return degraded_result(e, conversation_history)
+    stats = usage_stats(fitted, usage, response.get('context'))
 
     # If the answer is empty or very short, try to provide a more helpful response
     if len(response['answer']) == 0 or len(response['answer'].strip()) < 10:
-        return "I don't have specific information about that in the available documents, but I can help with questions about concrete canoe projects, engineering design, construction materials, and related technical topics. Could you rephrase your question or ask about something more specific to the concrete canoe domain?"
-    return response['answer']
+        return QueryResult(answer=FALLBACK_ANSWER, stats=stats, history=fitted.history)
+
+    if cache is not None:
+        cache.put(question, conversation_history, response['answer'],
+                  embedding=cache_embedding(embed, question, conversation_history))
+    return QueryResult(answer=response['answer'], stats=stats, history=fitted.history)
+
+async def _aanswer_question(question: str, conversation_history: list) -> QueryResult:
+    """Async :func:`_answer_question`."""
+    cache = get_answer_cache()
+    embedding = []
+
+    async def embed(text):
+        if not embedding:
+            with metrics.stage("embed"):
+                embedding.append(await registry.get_embedding_model().aembed_query(text))
+        return embedding[0]
+
+    if cache is not None:
+        answer, tier = await alookup_answer(cache, question, conversation_history, embed)
+        if answer is not None:
+            return QueryResult(answer=answer, cache_hit=True, cache_tier=tier, history=conversation_history)
+
+    try:
+        fitted = await afit_history(conversation_history)
+        usage = UsageMetadataCallbackHandler()
+        qa_chain = get_qa_chain_with_history()
+        response = await qa_chain.ainvoke({
+            "input": question,
+            "conversation_history": format_history(fitted.history)
+        }, config={"callbacks": [usage, metrics.llm_timer()]})
+    except resilience.Unavailable as e:
+        return degraded_result(e, conversation_history)
+    stats = usage_stats(fitted, usage, response.get('context'))
+
+    # If the answer is empty or very short, try to provide a more helpful response
+    if len(response['answer']) == 0 or len(response['answer'].strip()) < 10:
+        return QueryResult(answer=FALLBACK_ANSWER, stats=stats, history=fitted.history)
+
+    if cache is not None:
+        cache.put(question, conversation_history, response['answer'],
+                  embedding=await acache_embedding(embed, question, conversation_history))
+    return QueryResult(answer=response['answer'], stats=stats, history=fitted.history)
+
+def describe_sources(documents: list) -> list:
+    """Compact, JSON-serializable description of retrieved documents."""
+    return [
+        {
+            "source": doc.metadata.get("source"),
+            "chunk": int(doc.metadata["chunk"]) if doc.metadata.get("chunk") is not None else None,
+            # Every file a deduplicated chunk appears in (see src/dedup.py)
+            "sources": list(doc.metadata.get("sources") or [doc.metadata.get("source")])
+        }
+        for doc in documents
+    ]
+
+def stream_answer(question: str, conversation_history: list):
+    """Stream an answer as ``(event, data)`` pairs.
+
+    Yields one ``("metadata", {...})`` event with the retrieved sources as
+    soon as retrieval finishes, then ``("token", text)`` events as the LLM
+    produces them, then a final ``("done", QueryResult)``. When an upstream
+    is unavailable, a ``("replace", DEGRADED_ANSWER)`` event supersedes any
+    streamed tokens and the result is marked ``degraded``.
+    """
+    cache = get_answer_cache()
+    embedding = []
+
+    def embed(text):
+        if not embedding:
+            with metrics.stage("embed"):
+                embedding.append(registry.get_embedding_model().embed_query(text))
+        return embedding[0]
+
+    if cache is not None:
+        answer, tier = lookup_answer(cache, question, conversation_history, embed)
+        if answer is not None:
+            yield "metadata", {"sources": [], "cache_hit": True}
+            yield "token", answer
+            yield "done", QueryResult(answer=answer, cache_hit=True, cache_tier=tier, history=conversation_history)
+            return
+
+    usage = UsageMetadataCallbackHandler()
+    qa_chain = get_qa_chain_with_history()
+    parts, context = [], None
+    try:
+        fitted = fit_history(conversation_history)
+        for chunk in qa_chain.stream({
+            "input": question,
+            "conversation_history": format_history(fitted.history)
+        }, config={"callbacks": [usage, metrics.llm_timer()]}):
+            if "context" in chunk:
+                context = chunk["context"]
+                yield "metadata", {"sources": describe_sources(context), "cache_hit": False}
+            if chunk.get("answer"):
+                parts.append(chunk["answer"])
+                yield "token", chunk["answer"]
+    except resilience.Unavailable as e:
+        result = degraded_result(e, conversation_history)
+        yield "replace", result.answer
+        yield "done", result
+        return
+
+    answer = "".join(parts)
+    if len(answer.strip()) < 10:
+        # Replace whatever was streamed with the usual fallback
+        yield "replace", FALLBACK_ANSWER
+        yield "done", QueryResult(answer=FALLBACK_ANSWER, stats=usage_stats(fitted, usage, context), history=fitted.history)
+        return
+
+    if cache is not None:
+        cache.put(question, conversation_history, answer,
+                  embedding=cache_embedding(embed, question, conversation_history))
+    yield "done", QueryResult(answer=answer, stats=usage_stats(fitted, usage, context), history=fitted.history)
+
+async def astream_answer(question: str, conversation_history: list):
+    """Async :func:`stream_answer`, yielding the same ``(event, data)`` pairs."""
+    cache = get_answer_cache()
+    embedding = []
+
+    async def embed(text):
+        if not embedding:
+            with metrics.stage("embed"):
+                embedding.append(await registry.get_embedding_model().aembed_query(text))
+        return embedding[0]
+
+    if cache is not None:
+        answer, tier = await alookup_answer(cache, question, conversation_history, embed)
+        if answer is not None:
+            yield "metadata", {"sources": [], "cache_hit": True}
+            yield "token", answer
+            yield "done", QueryResult(answer=answer, cache_hit=True, cache_tier=tier, history=conversation_history)
+            return
+
+    usage = UsageMetadataCallbackHandler()
+    qa_chain = get_qa_chain_with_history()
+    parts, context = [], None
+    try:
+        fitted = await afit_history(conversation_history)
+        async for chunk in qa_chain.astream({
+            "input": question,
+            "conversation_history": format_history(fitted.history)
+        }, config={"callbacks": [usage, metrics.llm_timer()]}):
+            if "context" in chunk:
+                context = chunk["context"]
+                yield "metadata", {"sources": describe_sources(context), "cache_hit": False}
+            if chunk.get("answer"):
+                parts.append(chunk["answer"])
+                yield "token", chunk["answer"]
+    except resilience.Unavailable as e:
+        result = degraded_result(e, conversation_history)
+        yield "replace", result.answer
+        yield "done", result
+        return
+
+    answer = "".join(parts)
+    if len(answer.strip()) < 10:
+        # Replace whatever was streamed with the usual fallback
+        yield "replace", FALLBACK_ANSWER
+        yield "done", QueryResult(answer=FALLBACK_ANSWER, stats=usage_stats(fitted, usage, context), history=fitted.history)
+        return
+
+    if cache is not None:
+        cache.put(question, conversation_history, answer,
+                  embedding=await acache_embedding(embed, question, conversation_history))
+    yield "done", QueryResult(answer=answer, stats=usage_stats(fitted, usage, context), history=fitted.history)
+
+def _batch_lookup(items, vectors):
+    """Answer-cache pass of a batch: ``(results, indices still to answer)``."""
+    cache = get_answer_cache()
+    results = [None] * len(items)
+    misses = []
+    for i, ((question, history), vector) in enumerate(zip(items, vectors)):
+        if cache is not None:
+            answer, tier = cache.get(question, history, embed=lambda _, vector=vector: vector)
+            count_cache_lookup(tier)
+            if answer is not None:
+                results[i] = QueryResult(answer=answer, cache_hit=True, cache_tier=tier, history=history)
+                continue
+        misses.append(i)
+    return results, misses
+
+def _batch_error(error, history):
+    """A batch item's failure: a degraded answer when an upstream is unavailable, else ``error``."""
+    if isinstance(error, resilience.Unavailable) and config.RESILIENCE_DEGRADE:
+        return degraded_result(error, history)
+    return error
+
+def _batch_result(item, vector, fitted, response, usage, context):
+    """Turn one answer-chain output into a ``QueryResult``, caching it."""
+    question, history = item
+    if isinstance(response, Exception):
+        return _batch_error(response, history)
+    stats = usage_stats(fitted, usage, context)
+    if len(response.strip()) < 10:
+        return QueryResult(answer=FALLBACK_ANSWER, stats=stats, history=fitted.history)
+    cache = get_answer_cache()
+    if cache is not None:
+        cache.put(question, history, response, embedding=None if history else vector)
+    return QueryResult(answer=response, stats=stats, history=fitted.history)
+
+def answer_batch(items: list) -> list:
+    """Answer many ``(question, conversation_history)`` pairs together.
+
+    All questions are embedded in one call, retrievals run concurrently
+    and completions go through the same answer chain as
+    :func:`answer_question`, ``config.BATCH_MAX_CONCURRENCY`` at a time.
+    Returns, in order, a ``QueryResult`` or the exception raised for each item;
+    items whose upstream is unavailable get degraded results. Raises
+    ``resilience.Unavailable`` when the batch cannot be embedded.
+    """
+    if not items:
+        return []
+    with metrics.stage("embed"):
+        vectors = registry.get_embedding_model().embed_documents([question for question, _ in items])
+    results, misses = _batch_lookup(items, vectors)
+    if not misses:
+        return results
+
+    retriever = get_retriever()
+    with ThreadPoolExecutor(max_workers=min(config.BATCH_MAX_CONCURRENCY, len(misses))) as pool:
+        retrievals = [pool.submit(retriever.get_documents_by_vector, vectors[i], items[i][0]) for i in misses]
+        fitted = list(pool.map(lambda i: fit_history(items[i][1]), misses))
+
+    inputs, configs, usages, answerable = [], [], [], []
+    for i, fit, retrieval in zip(misses, fitted, retrievals):
+        try:
+            context = pack_context(retrieval.result())
+        except Exception as e:
+            results[i] = _batch_error(e, items[i][1])
+            continue
+        usage = UsageMetadataCallbackHandler()
+        inputs.append({
+            "input": items[i][0],
+            "conversation_history": format_history(fit.history),
+            "context": context
+        })
+        configs.append({"callbacks": [usage, metrics.llm_timer()], "max_concurrency": config.BATCH_MAX_CONCURRENCY})
+        usages.append(usage)
+        answerable.append((i, fit, context))
+
+    responses = get_answer_chain_with_history().batch(inputs, config=configs, return_exceptions=True)
+    for (i, fit, context), response, usage in zip(answerable, responses, usages):
+        results[i] = _batch_result(items[i], vectors[i], fit, response, usage, context)
+    return results
+
+async def aanswer_batch(items: list) -> list:
+    """Async :func:`answer_batch`."""
+    if not items:
+        return []
+    with metrics.stage("embed"):
+        vectors = await registry.get_embedding_model().aembed_documents([question for question, _ in items])
+    results, misses = _batch_lookup(items, vectors)
+    if not misses:
+        return results
+
+    retriever = get_retriever()
+    semaphore = asyncio.Semaphore(config.BATCH_MAX_CONCURRENCY)
+
+    async def fit(i):
+        async with semaphore:
+            return await afit_history(items[i][1])
+
+    fitted = await asyncio.gather(*(fit(i) for i in misses))
+    retrievals = await asyncio.gather(
+        *(retriever.aget_documents_by_vector(vectors[i], items[i][0]) for i in misses), return_exceptions=True)
+
+    inputs, configs, usages, answerable = [], [], [], []
+    for i, fit, context in zip(misses, fitted, retrievals):
+        if isinstance(context, Exception):
+            results[i] = _batch_error(context, items[i][1])
+            continue
+        context = pack_context(context)
+        usage = UsageMetadataCallbackHandler()
+        inputs.append({
+            "input": items[i][0],
+            "conversation_history": format_history(fit.history),
+            "context": context
+        })
+        configs.append({"callbacks": [usage, metrics.llm_timer()], "max_concurrency": config.BATCH_MAX_CONCURRENCY})
+        usages.append(usage)
+        answerable.append((i, fit, context))
+
+    responses = await get_answer_chain_with_history().abatch(inputs, config=configs, return_exceptions=True)
+    for (i, fit, context), response, usage in zip(answerable, responses, usages):
+        results[i] = _batch_result(items[i], vectors[i], fit, response, usage, context)
+    return results
+
+def query_documents_with_history(question: str, conversation_history: list) -> str:
+    """Query the vector database with a question and conversation history."""
+    return answer_question(question, conversation_history).answer
 
 if __name__ == "__main__":
     question = "How do I make a canoe?"
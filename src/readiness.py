@@ -0,0 +1,85 @@
+"""Per-worker warm-up and the ``/ready`` readiness state.
+
+``/health`` is liveness: it answers as soon as the worker can serve HTTP.
+``/ready`` only turns green once this worker has imported the query path,
+built its chains and opened its upstream connections (``src.query.warm_up``),
+so a load balancer pointed at it does not send the first questions to a
+worker that would spend seconds importing LangChain and handshaking with
+OpenAI and Pinecone.
+
+Warm-up runs on a background thread, started by the gunicorn ``post_fork``
+hook, by the ASGI app's startup, or by the first ``/ready`` probe when the
+app is run some other way. A failed warm-up is retried after
+``WARM_UP_RETRY_SECONDS``, when the next probe arrives.
+"""
+
+import os
+import threading
+import time
+from src import config, metrics, registry
+
+
+class WarmUp:
+    """Warm-up state of this process: ``pending``, ``warming``, ``ready`` or ``failed``."""
+
+    def __init__(self):
+        self.state = "pending"
+        self.error = None
+        self.seconds = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start warming up in the background unless it is running or done."""
+        with self._lock:
+            if self.state in ("warming", "ready"):
+                return
+            if self.state == "failed" and time.monotonic() - self.finished_at < config.WARM_UP_RETRY_SECONDS:
+                return
+            self.state, self.error = "warming", None
+        threading.Thread(target=self._run, name="warm-up", daemon=True).start()
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            # The first import of the query path (LangChain, the OpenAI and
+            # Pinecone clients) is most of a cold start, so it happens here
+            from src.query import warm_up
+            warm_up()
+        except Exception as e:
+            state, error = "failed", str(e)
+        else:
+            state, error = "ready", None
+        seconds = time.perf_counter() - started
+        print(f"Worker {os.getpid()} warm-up {state} after {seconds:.1f}s" + (f": {error}" if error else ""))
+        metrics.observe("paddleprompt_stage_seconds", seconds, stage="warm_up")
+        with self._lock:
+            self.state, self.error, self.seconds = state, error, seconds
+            self.finished_at = time.monotonic()
+
+    def status(self):
+        with self._lock:
+            status = {"status": self.state}
+            if self.seconds is not None:
+                status["warm_up_seconds"] = round(self.seconds, 3)
+            if self.error:
+                status["error"] = self.error
+            return status
+
+
+def get_warm_up():
+    """This process's warm-up state."""
+    return registry.get_or_create("warm_up", WarmUp)
+
+
+def start_warm_up():
+    """Start warming this worker up in the background."""
+    get_warm_up().start()
+
+
+def readiness():
+    """Return ``(ready, body)`` for ``/ready``, starting or retrying warm-up if needed."""
+    warm_up = get_warm_up()
+    warm_up.start()
+    status = warm_up.status()
+    return status["status"] == "ready", status
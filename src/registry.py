@@ -0,0 +1,211 @@
+"""Process-wide registry of long-lived clients and chains.
+
+Everything in here is built lazily on first use and then reused by every
+request the process serves. Objects are keyed by the pid that created them,
+so a registry populated before gunicorn forks is rebuilt in each worker
+instead of sharing sockets with the master.
+
+The client libraries (``httpx``, ``openai``, ``pinecone``, LangChain) and
+the indexes are imported inside the builders that need them, so a process
+that only serves ``/health``, ``/ready`` or the session endpoints never
+pays for importing them. The OpenAI clients and models are wrapped by
+``src/resilient_clients.py``, so their calls honour the request's deadline
+and the upstream circuit breakers.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from src import config
+from src.session_store import create_session_store
+
+_lock = threading.RLock()
+_instances = {}
+_owner_pid = os.getpid()
+
+
+def get_or_create(key, factory):
+    """Return the object registered under ``key``, building it once if needed."""
+    global _owner_pid
+
+    if _owner_pid == os.getpid() and key in _instances:
+        return _instances[key]
+
+    with _lock:
+        if _owner_pid != os.getpid():
+            # Inherited from a parent process; its connections are not ours.
+            _instances.clear()
+            _owner_pid = os.getpid()
+        if key not in _instances:
+            _instances[key] = factory()
+        return _instances[key]
+
+
+def reset():
+    """Drop every registered object so the next access rebuilds it."""
+    global _owner_pid
+    with _lock:
+        if _owner_pid == os.getpid():
+            http_client = _instances.get("http_client")
+            if http_client is not None:
+                http_client.close()
+        _instances.clear()
+        _owner_pid = os.getpid()
+
+
+def get_api_keys():
+    """Return ``(pinecone_api_key, openai_api_key)`` or raise if a needed one is missing."""
+    pinecone_api_key = os.getenv("PINECONE_API_KEY")
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+
+    if not openai_api_key or (config.VECTOR_BACKEND == "pinecone" and not pinecone_api_key):
+        raise ValueError("API keys not set in .env file")
+    return pinecone_api_key, openai_api_key
+
+
+def _http_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_http_client():
+    """Shared keep-alive HTTP client used by every OpenAI model in this process."""
+    import httpx
+    from src.resilient_clients import DeadlineTransport
+    return get_or_create("http_client", lambda: httpx.Client(
+        transport=DeadlineTransport(httpx.HTTPTransport(limits=_http_limits()))))
+
+
+def get_async_http_client():
+    """Async counterpart of :func:`get_http_client`."""
+    import httpx
+    from src.resilient_clients import AsyncDeadlineTransport
+    return get_or_create("http_async_client", lambda: httpx.AsyncClient(
+        transport=AsyncDeadlineTransport(httpx.AsyncHTTPTransport(limits=_http_limits()))))
+
+
+def get_openai_client():
+    """Shared raw OpenAI client; only needs ``OPENAI_API_KEY``."""
+    def build():
+        import openai
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+        if not openai_api_key:
+            raise ValueError("OPENAI_API_KEY not set")
+        return openai.OpenAI(api_key=openai_api_key, http_client=get_http_client())
+
+    return get_or_create("openai_client", build)
+
+
+def get_pinecone_client():
+    def build():
+        from pinecone import Pinecone
+        pinecone_api_key, _ = get_api_keys()
+        kwargs = {"api_key": pinecone_api_key, "pool_threads": config.PINECONE_POOL_THREADS}
+        if config.PINECONE_CONTROLLER_HOST:
+            kwargs["host"] = config.PINECONE_CONTROLLER_HOST
+        return Pinecone(**kwargs)
+
+    return get_or_create("pinecone_client", build)
+
+
+def get_pinecone_index():
+    """Shared Pinecone index handle with its own urllib3 connection pool."""
+    def build():
+        return get_pinecone_client().Index(
+            name=config.PINECONE_INDEX_NAME,
+            host=config.PINECONE_INDEX_HOST,
+            connection_pool_maxsize=config.PINECONE_POOL_MAXSIZE,
+        )
+
+    return get_or_create("pinecone_index", build)
+
+
+def get_blocking_executor():
+    """Thread pool the async app runs blocking client calls on."""
+    return get_or_create("blocking_executor", lambda: ThreadPoolExecutor(
+        max_workers=config.BLOCKING_IO_THREADS, thread_name_prefix="blocking-io"))
+
+
+async def run_blocking(fn, *args):
+    """Await ``fn(*args)`` on the blocking executor, so the event loop keeps serving."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_blocking_executor(), partial(fn, *args))
+
+
+def get_local_index():
+    """Memory-mapped local vector index shared (via the page cache) by all workers."""
+    from src.local_index import LocalVectorIndex
+    return get_or_create("local_index", lambda: LocalVectorIndex(dimension=config.EMBEDDING_DIMENSION))
+
+
+def get_lexical_index():
+    """Memory-mapped BM25 index built alongside the configured vector backend."""
+    from src.lexical_index import LexicalIndex, lexical_index_dir
+    return get_or_create("lexical_index", lambda: LexicalIndex(lexical_index_dir(config.VECTOR_BACKEND)))
+
+
+def get_session_store():
+    """Conversation session store (shared by every worker with the sqlite backend)."""
+    return get_or_create("session_store", create_session_store)
+
+
+def get_embedding_cache(model=config.EMBEDDING_MODEL):
+    """Shared on-disk embedding cache for ``model``, or ``None`` when disabled."""
+    from src.embedding_cache import EmbeddingCache
+    if not config.EMBEDDING_CACHE_ENABLED:
+        return None
+    return get_or_create(("embedding_cache", model),
+                         lambda: EmbeddingCache(model, config.EMBEDDING_DIMENSION))
+
+
+def get_embedding_model():
+    """Query-time embedding model, backed by the embedding cache when enabled."""
+    def build():
+        from langchain_openai import OpenAIEmbeddings
+        from pydantic import SecretStr
+        from src.embedding_cache import CachedEmbeddings
+        from src.resilient_clients import ResilientEmbeddings
+        _, openai_api_key = get_api_keys()
+        embeddings = ResilientEmbeddings(OpenAIEmbeddings(
+            model=config.EMBEDDING_MODEL,
+            api_key=SecretStr(openai_api_key),
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+        ))
+        cache = get_embedding_cache()
+        return CachedEmbeddings(embeddings, cache) if cache is not None else embeddings
+
+    return get_or_create("embedding_model", build)
+
+
+def get_chat_model(**params):
+    """Shared chat model for a given set of sampling parameters."""
+    key = ("chat_model",) + tuple(sorted(params.items()))
+
+    def build():
+        from langchain_openai import ChatOpenAI
+        from pydantic import SecretStr
+        from src.resilient_clients import ResilientChatModel
+        _, openai_api_key = get_api_keys()
+        return ResilientChatModel(ChatOpenAI(
+            api_key=SecretStr(openai_api_key),
+            model=config.CHAT_MODEL,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+            **params
+        ))
+
+    return get_or_create(key, build)
+
+
+def warm_connections():
+    """Open the upstream connections so the first request skips the handshakes."""
+    if config.VECTOR_BACKEND == "pinecone":
+        get_pinecone_index().describe_index_stats()
+    get_openai_client().models.list()
@@ -0,0 +1,385 @@
+"""Deadlines, hedging and circuit breaking for the upstream calls of a query.
+
+One slow Pinecone query or OpenAI completion used to hold a request (and,
+in sync mode, a worker thread) until gunicorn gave up on it. Every
+embedding, vector search and chat call now goes through :func:`call` or
+:func:`acall` for its upstream (``embed``, ``vector_search``, ``chat``):
+
+* **Deadlines.** ``/query`` opens a :func:`deadline` for the request's
+  timeout (``X-Request-Timeout``, capped at ``ADMISSION_TIMEOUT``). Each call
+  gets the smaller of its upstream's own timeout (``RESILIENCE_*_TIMEOUT``)
+  and what is left of that budget, so later stages get only what earlier
+  ones left. A call that runs out raises :class:`DeadlineExceeded`.
+  :mod:`src.resilient_clients` also caps the HTTP timeouts of the OpenAI
+  requests to the budget, so abandoned requests do not linger.
+* **Hedging.** Embedding and vector search calls are idempotent. When one
+  has not returned within the recent ``RESILIENCE_HEDGE_PERCENTILE``
+  latency of its upstream, a second identical call starts and the first
+  answer wins. Hedges are capped at ``RESILIENCE_HEDGE_BUDGET`` of calls, so
+  a slow upstream does not get twice the load.
+* **Circuit breaking.** After ``RESILIENCE_BREAKER_FAILURES`` consecutive
+  failures or timeouts, an upstream's breaker opens. Calls then fail at once
+  with :class:`CircuitOpen` for ``RESILIENCE_BREAKER_COOLDOWN`` seconds, and
+  then a single probe call decides whether to close it again. Only
+  transport errors, timeouts and 5xx or 429 answers count as failures
+  (:func:`is_failure`); other errors are re-raised without a verdict.
+
+Both exceptions are :class:`Unavailable`. ``src.query`` answers with a
+degraded answer when it catches one (``RESILIENCE_DEGRADE``); otherwise
+the handlers answer 503. Hybrid retrieval falls back to BM25 alone when
+only the vector side is unavailable.
+
+The ``RESILIENCE_*`` settings are in ``src/config.py``. Breakers and
+latency windows are per worker; an opening breaker is logged. Calls are
+counted in ``paddleprompt_upstream_calls_total{upstream,outcome}`` and
+hedges in ``paddleprompt_hedged_calls_total{upstream,winner}``. The number
+of workers with an open breaker is the ``paddleprompt_circuit_open{upstream}``
+gauge.
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from src import config, metrics, registry
+
+logger = logging.getLogger(__name__)
+
+TIMEOUTS = {
+    "embed": config.RESILIENCE_EMBED_TIMEOUT,
+    "vector_search": config.RESILIENCE_SEARCH_TIMEOUT,
+    "chat": config.RESILIENCE_CHAT_TIMEOUT,
+}
+
+_deadline = contextvars.ContextVar("paddleprompt_deadline", default=None)
+
+
+class Unavailable(Exception):
+    """An upstream cannot answer in time; ``retry_after`` is a hint in seconds."""
+
+    def __init__(self, message, upstream, retry_after=1):
+        super().__init__(message)
+        self.message = message
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Unavailable):
+    def __init__(self, upstream, seconds):
+        super().__init__(f"{upstream} did not answer within {seconds:.2f}s", upstream)
+
+
+class CircuitOpen(Unavailable):
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"{upstream} is unavailable", upstream, max(1, round(retry_after)))
+
+
+@contextmanager
+def deadline(seconds):
+    """Give the enclosed block (a request) ``seconds`` for all its upstream calls."""
+    # Restored by value rather than with a token: a streamed response may end
+    # the block in another task's copy of the context
+    previous = _deadline.get()
+    _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.set(previous)
+
+
+def remaining():
+    """Seconds left in the current deadline, or ``None`` outside one."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+@functools.cache
+def _client_errors():
+    """``(transport, status)``: the upstream clients' exceptions for a request that
+    got no answer, and for one answered with an HTTP error status."""
+    # Imported on first use, so the handlers can import this module cheaply
+    import httpx
+    import openai
+    import urllib3
+    from pinecone.exceptions import PineconeApiException, PineconeProtocolError
+    transport = (TimeoutError, ConnectionError, httpx.TransportError, openai.APIConnectionError,
+                 urllib3.exceptions.HTTPError, PineconeProtocolError)
+    status = (httpx.HTTPStatusError, openai.APIStatusError, PineconeApiException)
+    return transport, status
+
+
+def http_status(error):
+    """The HTTP status an upstream answered ``error`` with, or ``None``."""
+    if not isinstance(error, _client_errors()[1]):
+        return None
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(error, "status", None) \
+        or getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_failure(error):
+    """Whether ``error`` says the upstream is unhealthy: no answer (a transport
+    error or timeout), or a 5xx or 429. Refusals of a bad request and errors
+    raised by our own code are not."""
+    if isinstance(error, _client_errors()[0]):
+        return True
+    status = http_status(error)
+    return status is not None and (status >= 500 or status == 429)
+
+
+class LatencyWindow:
+    """Latencies of an upstream's recent successful calls."""
+
+    def __init__(self, size=config.RESILIENCE_LATENCY_WINDOW, min_samples=config.RESILIENCE_LATENCY_MIN_SAMPLES):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        """The ``fraction`` quantile, or ``None`` until there are enough samples."""
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class CircuitBreaker:
+    """``closed``, ``open`` (failing fast) or ``half_open`` (one probe call allowed)."""
+
+    def __init__(self, name, failures=config.RESILIENCE_BREAKER_FAILURES, cooldown=config.RESILIENCE_BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Raise :class:`CircuitOpen` unless a call may go through now."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open":
+                wait_for = self.opened_at + self.cooldown - time.monotonic()
+                if wait_for > 0:
+                    raise CircuitOpen(self.name, wait_for)
+                self.state, self._probing = "half_open", False
+            if self._probing:
+                raise CircuitOpen(self.name, 1)
+            self._probing = True
+
+    def release(self):
+        """Give back the probe slot of a call that ended without a verdict."""
+        with self._lock:
+            self._probing = False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state != "closed":
+                self.state, self._probing = "closed", False
+                metrics.set_gauge("paddleprompt_circuit_open", 0, upstream=self.name)
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    logger.warning("Circuit for %s opened after %d failures", self.name, self.failures)
+                self.state, self._probing = "open", False
+                self.opened_at = time.monotonic()
+                metrics.set_gauge("paddleprompt_circuit_open", 1, upstream=self.name)
+
+
+class Upstream:
+    """Timeout, latency window, breaker and hedge budget of one kind of upstream call."""
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+        self.latency = LatencyWindow()
+        self.breaker = CircuitBreaker(name)
+        self.calls = 0
+        self.hedges = 0
+
+    def start(self):
+        """Check the deadline and breaker; returns the seconds this call may take."""
+        left = remaining()
+        if left is not None and left <= 0:
+            # Earlier stages used up the budget; not this upstream's fault
+            metrics.count("paddleprompt_upstream_calls_total", upstream=self.name, outcome="timeout")
+            raise DeadlineExceeded(self.name, 0.0)
+        try:
+            self.breaker.allow()
+        except CircuitOpen:
+            metrics.count("paddleprompt_upstream_calls_total", upstream=self.name, outcome="rejected")
+            raise
+        self.calls += 1
+        return self.timeout if left is None else min(self.timeout, left)
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or ``None`` to not hedge this call."""
+        if not config.RESILIENCE_HEDGE_ENABLED or self.hedges >= config.RESILIENCE_HEDGE_BUDGET * self.calls:
+            return None
+        delay = self.latency.percentile(config.RESILIENCE_HEDGE_PERCENTILE)
+        return None if delay is None else max(delay, config.RESILIENCE_HEDGE_MIN_DELAY)
+
+    def hedge(self):
+        self.hedges += 1
+
+    def succeeded(self, seconds, hedged, winner):
+        self.latency.record(seconds)
+        self.breaker.success()
+        metrics.count("paddleprompt_upstream_calls_total", upstream=self.name, outcome="ok")
+        if hedged:
+            metrics.count("paddleprompt_hedged_calls_total", upstream=self.name, winner=winner)
+
+    def failed(self, error):
+        if is_failure(error):
+            self.breaker.failure()
+        elif http_status(error) is not None:
+            # It answered, if only to refuse the request
+            self.breaker.success()
+        else:
+            # Not the upstream's doing: no verdict on its health
+            self.breaker.release()
+        metrics.count("paddleprompt_upstream_calls_total", upstream=self.name, outcome="error")
+
+    def timed_out(self, timeout):
+        self.breaker.failure()
+        metrics.count("paddleprompt_upstream_calls_total", upstream=self.name, outcome="timeout")
+        return DeadlineExceeded(self.name, timeout)
+
+
+def get_upstream(name):
+    """This process's state for upstream ``name``."""
+    return registry.get_or_create(("upstream", name), lambda: Upstream(name, TIMEOUTS[name]))
+
+
+def get_executor():
+    """Thread pool sync upstream calls run on, so their caller can stop waiting."""
+    return registry.get_or_create("upstream_executor", lambda: ThreadPoolExecutor(
+        max_workers=config.RESILIENCE_THREADS, thread_name_prefix="upstream"))
+
+
+def _timed(fn):
+    started = time.monotonic()
+    return fn(), time.monotonic() - started
+
+
+def call(name, fn, hedge=False):
+    """Run ``fn()`` against upstream ``name`` within its timeout and the request's deadline.
+
+    With ``hedge``, ``fn`` must be safe to run twice at once.
+    """
+    if not config.RESILIENCE_ENABLED:
+        return fn()
+    upstream = get_upstream(name)
+    timeout = upstream.start()
+    executor = get_executor()
+    started = time.monotonic()
+    delay = upstream.hedge_delay() if hedge else None
+
+    def submit():
+        # A fresh copy per attempt: one context cannot be entered by two threads
+        return executor.submit(contextvars.copy_context().run, _timed, fn)
+
+    attempts = {submit(): "primary"}
+    pending, error, settled = set(attempts), None, False
+    try:
+        while pending:
+            now = time.monotonic()
+            wait_for = started + timeout - now
+            if delay is not None and len(attempts) == 1:
+                wait_for = min(wait_for, started + delay - now)
+            done, pending = wait(pending, timeout=max(wait_for, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    result, seconds = future.result()
+                    settled = True
+                    upstream.succeeded(seconds, len(attempts) > 1, attempts[future])
+                    return result
+                error = future.exception()
+            if not pending:
+                break
+            now = time.monotonic()
+            if now >= started + timeout:
+                settled = True
+                raise upstream.timed_out(timeout)
+            if delay is not None and len(attempts) == 1 and now >= started + delay:
+                upstream.hedge()
+                hedge_future = submit()
+                attempts[hedge_future] = "hedge"
+                pending.add(hedge_future)
+        settled = True
+        upstream.failed(error)
+        raise error
+    finally:
+        for future in pending:
+            future.cancel()
+        if not settled:
+            upstream.breaker.release()
+
+
+async def acall(name, make, hedge=False):
+    """Async :func:`call`; ``make()`` returns a fresh awaitable for each attempt."""
+    if not config.RESILIENCE_ENABLED:
+        return await make()
+    upstream = get_upstream(name)
+    timeout = upstream.start()
+    started = time.monotonic()
+    delay = upstream.hedge_delay() if hedge else None
+
+    async def timed():
+        attempt_started = time.monotonic()
+        return await make(), time.monotonic() - attempt_started
+
+    attempts = {asyncio.ensure_future(timed()): "primary"}
+    pending, error, settled = set(attempts), None, False
+    try:
+        while pending:
+            now = time.monotonic()
+            wait_for = started + timeout - now
+            if delay is not None and len(attempts) == 1:
+                wait_for = min(wait_for, started + delay - now)
+            done, pending = await asyncio.wait(pending, timeout=max(wait_for, 0), return_when=FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    result, seconds = task.result()
+                    settled = True
+                    upstream.succeeded(seconds, len(attempts) > 1, attempts[task])
+                    return result
+                error = task.exception()
+            if not pending:
+                break
+            now = time.monotonic()
+            if now >= started + timeout:
+                settled = True
+                raise upstream.timed_out(timeout)
+            if delay is not None and len(attempts) == 1 and now >= started + delay:
+                upstream.hedge()
+                hedge_task = asyncio.ensure_future(timed())
+                attempts[hedge_task] = "hedge"
+                pending.add(hedge_task)
+        settled = True
+        upstream.failed(error)
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+        if not settled:
+            # Cancelled, e.g. the client went away
+            upstream.breaker.release()
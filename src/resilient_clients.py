@@ -0,0 +1,143 @@
+"""Model and HTTP wrappers that route upstream calls through :mod:`src.resilience`.
+
+Kept apart from ``src/resilience.py`` so the request handlers can open a
+deadline without importing LangChain or httpx (see ``src/readiness.py``).
+``src.registry`` applies these when it builds the shared clients:
+
+- :class:`ResilientEmbeddings` hedges and times out the ``embed`` calls of
+  the wrapped embeddings (under the embedding cache, so hits skip it);
+- :class:`ResilientChatModel` times out ``chat`` calls and fails fast while
+  the breaker is open. Streamed completions are only checked against the
+  breaker, since their tokens already show progress;
+- :class:`DeadlineTransport` (and its async twin) lowers the timeouts of
+  each HTTP request to what is left of the request's deadline, so an OpenAI
+  call abandoned at the deadline does not hold its connection much longer.
+"""
+
+import time
+import httpx
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable
+from src import config, resilience
+
+
+class ResilientEmbeddings(Embeddings):
+    """Embeddings whose calls go through the ``embed`` upstream, hedged."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts):
+        return resilience.call("embed", lambda: self.embeddings.embed_documents(texts), hedge=True)
+
+    def embed_query(self, text):
+        return resilience.call("embed", lambda: self.embeddings.embed_query(text), hedge=True)
+
+    async def aembed_documents(self, texts):
+        return await resilience.acall("embed", lambda: self.embeddings.aembed_documents(texts), hedge=True)
+
+    async def aembed_query(self, text):
+        return await resilience.acall("embed", lambda: self.embeddings.aembed_query(text), hedge=True)
+
+
+class ResilientChatModel(Runnable):
+    """A chat model whose calls go through the ``chat`` upstream (never hedged)."""
+
+    def __init__(self, model):
+        self.model = model
+
+    @property
+    def InputType(self):
+        return self.model.InputType
+
+    @property
+    def OutputType(self):
+        return self.model.OutputType
+
+    def invoke(self, input, config=None, **kwargs):
+        return resilience.call("chat", lambda: self.model.invoke(input, config, **kwargs))
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await resilience.acall("chat", lambda: self.model.ainvoke(input, config, **kwargs))
+
+    def stream(self, input, config=None, **kwargs):
+        upstream = self._start()
+        if upstream is None:
+            yield from self.model.stream(input, config, **kwargs)
+            return
+        started = time.monotonic()
+        try:
+            yield from self.model.stream(input, config, **kwargs)
+        except Exception as e:
+            upstream.failed(e)
+            raise
+        except BaseException:
+            # Closed early (the client went away)
+            upstream.breaker.release()
+            raise
+        upstream.succeeded(time.monotonic() - started, False, None)
+
+    async def astream(self, input, config=None, **kwargs):
+        upstream = self._start()
+        if upstream is None:
+            async for chunk in self.model.astream(input, config, **kwargs):
+                yield chunk
+            return
+        started = time.monotonic()
+        try:
+            async for chunk in self.model.astream(input, config, **kwargs):
+                yield chunk
+        except Exception as e:
+            upstream.failed(e)
+            raise
+        except BaseException:
+            upstream.breaker.release()
+            raise
+        upstream.succeeded(time.monotonic() - started, False, None)
+
+    def _start(self):
+        if not config.RESILIENCE_ENABLED:
+            return None
+        upstream = resilience.get_upstream("chat")
+        upstream.start()
+        return upstream
+
+
+def _cap_timeouts(request):
+    left = resilience.remaining()
+    if left is None:
+        return
+    left = max(left, 0.001)
+    timeouts = dict(request.extensions.get("timeout", {}))
+    for key in ("connect", "read", "write", "pool"):
+        value = timeouts.get(key)
+        timeouts[key] = left if value is None else min(value, left)
+    request.extensions["timeout"] = timeouts
+
+
+class DeadlineTransport(httpx.BaseTransport):
+    """HTTP transport that caps each request's timeouts at the remaining deadline."""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def handle_request(self, request):
+        _cap_timeouts(request)
+        return self.transport.handle_request(request)
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncDeadlineTransport(httpx.AsyncBaseTransport):
+    """Async :class:`DeadlineTransport`."""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        _cap_timeouts(request)
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,345 @@
+"""Framework-neutral request handling shared by the WSGI and ASGI apps."""
+
+import json
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from src import admission, config, metrics, registry, resilience
+from src.history import attach_summary, is_summary
+
+MAX_WORDS = 500
+# Session id the API used to give clients that sent none; treated as none
+ANONYMOUS_SESSION_ID = 'default'
+
+
+class RequestError(Exception):
+    """A client error to be returned as ``{"error": ..., "status": "error"}``."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def parse_query_payload(data):
+    """Validate a query body; returns ``(question, session_id, conversation_history)``.
+
+    ``session_id`` is ``None`` when the client did not name a session, and
+    ``conversation_history`` is ``None`` when the client did not send one.
+    """
+    if data is None:
+        raise RequestError("Request must be JSON")
+
+    if 'question' not in data:
+        raise RequestError("Missing 'question' field in request")
+
+    if not isinstance(data['question'], str):
+        raise RequestError("'question' must be a string")
+
+    question = data['question'].strip()
+    session_id = data.get('session_id') or None
+    if session_id == ANONYMOUS_SESSION_ID:
+        session_id = None
+    conversation_history = data.get('conversation_history')
+
+    if not question:
+        raise RequestError("Question cannot be empty")
+
+    word_count = len(question.split())
+    if word_count > MAX_WORDS:
+        raise RequestError(
+            f"Question too long. Maximum length is {MAX_WORDS} words. Current word count: {word_count}"
+        )
+
+    return question, session_id, parse_conversation_history(conversation_history)
+
+
+def parse_conversation_history(conversation_history):
+    """Check a client-sent history is a list of ``{role, content}`` string messages.
+
+    A rolling summary message (``src/history.py``) may come first, as it
+    does in stored sessions. Returns the history, or ``None`` if none was sent.
+    """
+    if conversation_history is None:
+        return None
+    if not isinstance(conversation_history, list):
+        raise RequestError("'conversation_history' must be a list of messages")
+    for index, message in enumerate(conversation_history):
+        if (not isinstance(message, dict) or not isinstance(message.get('role'), str)
+                or not isinstance(message.get('content'), str)):
+            raise RequestError(
+                f"'conversation_history' item {index} must be an object with string 'role' and 'content'"
+            )
+        if is_summary(message) and (index > 0 or not isinstance(message.get('messages'), int)
+                                    or not isinstance(message.get('digest'), str)):
+            raise RequestError(f"'conversation_history' item {index} is not a valid summary")
+    return conversation_history
+
+
+def parse_batch_payload(data):
+    """Validate a batch body; returns one parsed query or ``RequestError`` per item.
+
+    Items are question strings or objects shaped like a ``/query`` body.
+    Only a malformed batch as a whole raises.
+    """
+    if data is None:
+        raise RequestError("Request must be JSON")
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not questions:
+        raise RequestError("'questions' must be a non-empty list")
+    if len(questions) > config.BATCH_MAX_QUESTIONS:
+        raise RequestError(
+            f"Too many questions. Maximum is {config.BATCH_MAX_QUESTIONS} per batch. Received: {len(questions)}"
+        )
+
+    entries = []
+    for item in questions:
+        try:
+            if isinstance(item, str):
+                item = {'question': item}
+            if not isinstance(item, dict):
+                raise RequestError("Each item must be a question string or an object")
+            entries.append(parse_query_payload(item))
+        except RequestError as e:
+            entries.append(e)
+    return entries
+
+
+def prepare_batch(entries):
+    """Return ``(items, slots)``: ``(question, history)`` to answer and where each goes."""
+    items, slots = [], []
+    for index, entry in enumerate(entries):
+        if isinstance(entry, RequestError):
+            continue
+        question, session_id, conversation_history = entry
+        items.append((question, start_turn(session_id, conversation_history)))
+        slots.append((index, session_id, question))
+    return items, slots
+
+
+async def aprepare_batch(entries):
+    """Async :func:`prepare_batch`; sessions are read on the blocking executor."""
+    return await registry.run_blocking(prepare_batch, entries)
+
+
+def finish_batch(entries, slots, results):
+    """Record answered items in their sessions and build the per-item response."""
+    response = [
+        {"index": index, "error": entry.message, "status": "error"} if isinstance(entry, RequestError) else None
+        for index, entry in enumerate(entries)
+    ]
+    for (index, session_id, question), result in zip(slots, results):
+        if isinstance(result, resilience.Unavailable):
+            response[index] = {"index": index, "error": result.message, "status": "error"}
+            continue
+        if isinstance(result, Exception):
+            response[index] = {"index": index, "error": f"Internal server error: {str(result)}", "status": "error"}
+            continue
+        if not result.degraded:
+            finish_turn(session_id, result.history, question, result.answer)
+        response[index] = {
+            "index": index,
+            "answer": result.answer,
+            "cache_hit": result.cache_hit,
+            "usage": result.stats,
+            "status": "degraded" if result.degraded else "success"
+        }
+    return response
+
+
+async def afinish_batch(entries, slots, results):
+    """Async :func:`finish_batch`; sessions are written on the blocking executor."""
+    return await registry.run_blocking(finish_batch, entries, slots, results)
+
+
+@contextmanager
+def admitted(question, headers, weight=1):
+    """Hold ``weight`` of this worker's query slots, under the request's deadline.
+
+    Raises ``admission.Rejected`` when the request is shed. The deadline
+    (``src/resilience.py``) starts before the wait for a slot, so upstream
+    calls only get what the wait left.
+    """
+    timeout = admission.request_timeout(headers)
+    with resilience.deadline(timeout) if config.RESILIENCE_ENABLED else nullcontext():
+        if not config.ADMISSION_ENABLED:
+            yield
+            return
+        with admission.get_admission_controller().admit(question, timeout, weight):
+            yield
+
+
+@asynccontextmanager
+async def aadmitted(question, headers, weight=1):
+    """Async :func:`admitted`."""
+    timeout = admission.request_timeout(headers)
+    with resilience.deadline(timeout) if config.RESILIENCE_ENABLED else nullcontext():
+        if not config.ADMISSION_ENABLED:
+            yield
+            return
+        async with admission.get_admission_controller().aadmit(question, timeout, weight):
+            yield
+
+
+def admitted_stream(question, headers, events):
+    """Run the event generator ``events()`` inside :func:`admitted`.
+
+    Admission happens here, before the response starts, so a shed request
+    can still be answered with a 429; the slot is held until the stream
+    ends or is closed.
+    """
+    def run():
+        with admitted(question, headers):
+            yield
+            yield from events()
+
+    stream = run()
+    next(stream)
+    return stream
+
+
+async def aadmitted_stream(question, headers, events):
+    """Async :func:`admitted_stream`; ``events()`` is an async generator."""
+    async def run():
+        async with aadmitted(question, headers):
+            yield
+            async for event in events():
+                yield event
+
+    stream = run()
+    await stream.__anext__()
+    return stream
+
+
+def batch_admission(entries):
+    """``(question, weight)`` to admit a parsed batch with: all its valid
+    questions, and a slot per question it answers at once."""
+    questions = [entry[0] for entry in entries if not isinstance(entry, RequestError)]
+    return " ".join(questions), min(len(questions), config.BATCH_MAX_CONCURRENCY)
+
+
+def retry_headers(error):
+    """Headers of the 429 or 503 answering an ``admission.Rejected`` or
+    ``resilience.Unavailable`` request."""
+    return {"Retry-After": str(error.retry_after)}
+
+
+def start_turn(session_id, conversation_history):
+    """Return the history to answer with.
+
+    The client's history wins when it sends one, with the messages the
+    stored session already summarized replaced by that summary; otherwise
+    the history stored for the session is used, whichever worker stored it.
+    Without a session only the client's history is used, so anonymous
+    clients never see each other's turns. Fitting it into the prompt's
+    token budget happens in ``src.query``.
+    """
+    if session_id is None:
+        return conversation_history or []
+    stored = registry.get_session_store().get(session_id)
+    if conversation_history is None:
+        return stored or []
+    return attach_summary(conversation_history, stored)
+
+
+async def astart_turn(session_id, conversation_history):
+    """Async :func:`start_turn`.
+
+    The session store is read on the blocking executor: a SQLite read can
+    wait on another worker's write, and must not hold up the event loop.
+    """
+    if session_id is None:
+        return start_turn(session_id, conversation_history)
+    return await registry.run_blocking(start_turn, session_id, conversation_history)
+
+
+def finish_turn(session_id, history, question, answer):
+    """Record a completed question/answer exchange in the session.
+
+    ``history`` should be the one the answer was produced with
+    (``QueryResult.history``), so a freshly folded summary is kept.
+    Nothing is stored without a session.
+    """
+    if session_id is None:
+        return
+    registry.get_session_store().set(session_id, history + [
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": answer}
+    ])
+
+
+async def afinish_turn(session_id, history, question, answer):
+    """Async :func:`finish_turn`, writing the session on the blocking executor."""
+    if session_id is None:
+        return
+    await registry.run_blocking(finish_turn, session_id, history, question, answer)
+
+
+def clear_sessions(session_id=None):
+    """Clear one session, or drop expired sessions when none is given; returns a message."""
+    store = registry.get_session_store()
+    if session_id:
+        if store.delete(session_id):
+            return f"Session {session_id} cleared successfully"
+        return "Session not found"
+
+    removed = store.prune()
+    if removed:
+        return f"Cleaned up {removed} old sessions"
+    return "No cleanup needed"
+
+
+def sessions_info():
+    """Occupancy and eviction stats of the session store."""
+    store = registry.get_session_store()
+    stats = store.stats()
+    return {
+        "active_sessions": stats["sessions"],
+        "session_ids": store.recent_ids(10),
+        "store": stats,
+    }
+
+
+def metrics_text():
+    """``/metrics`` body: every worker's metrics plus the session store's occupancy.
+
+    With the sqlite backend the session numbers are shared by all workers;
+    with the memory backend they describe the worker serving the scrape.
+    """
+    stats = registry.get_session_store().stats()
+    labels = {"backend": stats["backend"]}
+    return metrics.render(gauges=[
+        ("paddleprompt_sessions", labels, stats["sessions"]),
+        ("paddleprompt_session_evictions_total", {**labels, "reason": "lru"}, stats["lru_evictions"]),
+        ("paddleprompt_session_evictions_total", {**labels, "reason": "ttl"}, stats["ttl_evictions"]),
+    ])
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_done_event(session_id, question, result):
+    """The final ``done`` event of a stream, recording a full answer in the session."""
+    if not result.degraded:
+        # Session history is only updated once the answer is complete
+        finish_turn(session_id, result.history, question, result.answer)
+    return sse_event("done", {
+        "answer": result.answer,
+        "cache_hit": result.cache_hit,
+        "usage": result.stats,
+        "status": "degraded" if result.degraded else "success"
+    })
+
+
+async def astream_done_event(session_id, question, result):
+    """Async :func:`stream_done_event`, writing the session on the blocking executor."""
+    if session_id is None:
+        return stream_done_event(session_id, question, result)
+    return await registry.run_blocking(stream_done_event, session_id, question, result)
+
+
+def stream_error_event(error):
+    """The ``error`` event ending a stream that failed after it started."""
+    if isinstance(error, resilience.Unavailable):
+        return sse_event("error", {"error": error.message, "retry_after": error.retry_after, "status": "error"})
+    return sse_event("error", {"error": f"Internal server error: {str(error)}", "status": "error"})
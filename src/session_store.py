@@ -0,0 +1,290 @@
+"""Bounded store of conversation histories, keyed by session id.
+
+Two backends share one interface (``get``, ``set``, ``delete``, ``prune``,
+``recent_ids``, ``stats``):
+
+* ``sqlite`` (default): one SQLite database in WAL mode that every gunicorn
+  worker on the host reads and writes, so a follow-up question finds its
+  history whichever worker it lands on. Reads are a primary-key lookup
+  that only writes ``last_used`` back once the stored one is older than
+  ``touch_fraction`` of the TTL, so most reads never take SQLite's write
+  lock; the least recently used sessions are found through an index on
+  ``last_used``, and the session count is kept in the ``counters`` table
+  rather than counted.
+* ``memory``: a per-process ``OrderedDict`` with O(1) LRU updates, for a
+  single worker (e.g. one async worker) or local development.
+
+Both enforce a session count cap, a hard cap on the total size of the
+stored (JSON encoded) histories, and a TTL since a session was last used.
+Eviction counts are kept with the data, so ``stats()`` reports the same
+numbers from every worker.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from src import config
+
+
+_COUNTERS = ("sessions", "bytes", "lru_evictions", "ttl_evictions")
+
+
+def encode_history(history):
+    return json.dumps(history, separators=(",", ":"), ensure_ascii=False)
+
+
+class MemorySessionStore:
+    """Per-process session store with O(1) LRU and TTL eviction."""
+
+    backend = "memory"
+
+    def __init__(self, max_sessions=config.SESSION_MAX_SESSIONS, max_bytes=config.SESSION_MAX_BYTES,
+                 ttl=config.SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lru_evictions = 0
+        self.ttl_evictions = 0
+        self._bytes = 0
+        self._sessions = OrderedDict()  # session_id -> (history, size, last_used)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Return the session's history, or ``None`` if unknown or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if now - entry[2] > self.ttl:
+                self._remove(session_id)
+                self.ttl_evictions += 1
+                return None
+            self._sessions[session_id] = (entry[0], entry[1], now)
+            self._sessions.move_to_end(session_id)
+            return list(entry[0])
+
+    def set(self, session_id, history):
+        size = len(encode_history(history).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            if session_id in self._sessions:
+                self._remove(session_id)
+            if size > self.max_bytes:
+                return
+            self._sessions[session_id] = (list(history), size, now)
+            self._bytes += size
+            self._expire(now)
+            while len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._sessions)))
+                self.lru_evictions += 1
+
+    def delete(self, session_id):
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._remove(session_id)
+            return True
+
+    def prune(self):
+        """Drop expired sessions; returns how many were removed."""
+        with self._lock:
+            return self._expire(time.time())
+
+    def recent_ids(self, limit=10):
+        with self._lock:
+            return list(reversed(self._sessions))[:limit]
+
+    def _remove(self, session_id):
+        _, size, _ = self._sessions.pop(session_id)
+        self._bytes -= size
+
+    def _expire(self, now):
+        # Oldest first, so stop at the first live session
+        removed = 0
+        while self._sessions:
+            session_id, (_, _, last_used) = next(iter(self._sessions.items()))
+            if now - last_used <= self.ttl:
+                break
+            self._remove(session_id)
+            removed += 1
+        self.ttl_evictions += removed
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "lru_evictions": self.lru_evictions,
+                "ttl_evictions": self.ttl_evictions,
+            }
+
+
+class SQLiteSessionStore:
+    """Session store shared by every process on the host through SQLite (WAL)."""
+
+    backend = "sqlite"
+
+    def __init__(self, path=config.SESSION_STORE_PATH, max_sessions=config.SESSION_MAX_SESSIONS,
+                 max_bytes=config.SESSION_MAX_BYTES, ttl=config.SESSION_TTL,
+                 touch_fraction=config.SESSION_TOUCH_FRACTION):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # A session may expire up to this long after its last read
+        self.touch_interval = ttl * touch_fraction
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, history TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        # Databases from before the count was kept start from the rows they hold
+        self._db.execute("INSERT OR IGNORE INTO counters (name, value) SELECT 'sessions', COUNT(*) FROM sessions")
+        self._db.executemany("INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)",
+                             [(name,) for name in _COUNTERS])
+
+    def _transaction(self, work):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work()
+                self._db.execute("COMMIT")
+                return result
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _add(self, name, amount):
+        if amount:
+            self._db.execute("UPDATE counters SET value = value + ? WHERE name = ?", (amount, name))
+
+    def get(self, session_id):
+        """Return the session's history, or ``None`` if unknown or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT history, last_used FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                return None
+            if now - row[1] >= self.touch_interval:
+                self._db.execute("UPDATE sessions SET last_used = ? WHERE session_id = ?", (now, session_id))
+        return json.loads(row[0])
+
+    def set(self, session_id, history):
+        encoded = encode_history(history)
+        size = len(encoded.encode("utf-8"))
+
+        def work():
+            now = time.time()
+            old = self._db.execute("SELECT size FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if old is not None:
+                self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._add("sessions", -1)
+                self._add("bytes", -old[0])
+            if size > self.max_bytes:
+                return
+            self._db.execute(
+                "INSERT INTO sessions (session_id, history, size, last_used) VALUES (?, ?, ?, ?)",
+                (session_id, encoded, size, now),
+            )
+            self._add("sessions", 1)
+            self._add("bytes", size)
+            self._expire(now)
+            self._enforce_caps()
+
+        self._transaction(work)
+
+    def delete(self, session_id):
+        def work():
+            row = self._db.execute("SELECT size FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return False
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._add("sessions", -1)
+            self._add("bytes", -row[0])
+            return True
+
+        return self._transaction(work)
+
+    def prune(self):
+        """Drop expired sessions; returns how many were removed."""
+        return self._transaction(lambda: self._expire(time.time()))
+
+    def recent_ids(self, limit=10):
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT session_id FROM sessions WHERE last_used >= ? ORDER BY last_used DESC LIMIT ?",
+                (time.time() - self.ttl, limit),
+            )]
+
+    def _evict(self, rows, counter):
+        self._db.executemany("DELETE FROM sessions WHERE session_id = ?", [(row[0],) for row in rows])
+        self._add("sessions", -len(rows))
+        self._add("bytes", -sum(row[1] for row in rows))
+        self._add(counter, len(rows))
+        return len(rows)
+
+    def _expire(self, now):
+        rows = self._db.execute(
+            "SELECT session_id, size FROM sessions WHERE last_used < ?", (now - self.ttl,)
+        ).fetchall()
+        return self._evict(rows, "ttl_evictions")
+
+    def _enforce_caps(self):
+        count = self._counter("sessions")
+        total = self._counter("bytes")
+        victims = []
+        if count > self.max_sessions or total > self.max_bytes:
+            for session_id, size in self._db.execute(
+                    "SELECT session_id, size FROM sessions ORDER BY last_used"):
+                if count <= self.max_sessions and total <= self.max_bytes:
+                    break
+                victims.append((session_id, size))
+                count -= 1
+                total -= size
+        self._evict(victims, "lru_evictions")
+
+    def _counter(self, name):
+        return self._db.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._db.execute("SELECT name, value FROM counters").fetchall())
+        return {
+            "backend": self.backend,
+            "sessions": counters["sessions"],
+            "bytes": counters["bytes"],
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "lru_evictions": counters["lru_evictions"],
+            "ttl_evictions": counters["ttl_evictions"],
+        }
+
+
+def create_session_store(backend=config.SESSION_STORE_BACKEND):
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    raise ValueError(f"Unknown SESSION_STORE_BACKEND: {backend}")
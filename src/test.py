@@ -2,7 +2,7 @@
 
 import os
 from dotenv import load_dotenv
-from query import query_documents
+from src.query import query_documents
 
 def main():
     load_dotenv()
@@ -0,0 +1,145 @@
+"""Build the fine-tuning dataset (``CLEAN_DATA.jsonl``) from the design papers in one pass.
+
+    python -m src.training_data --pdf-dir ./pdfs --output CLEAN_DATA.jsonl
+
+Ports ``notebooks/training_script.ipynb`` and
+``scripts/json_cleaning_script.ipynb``. Each PDF is read and split at its
+section headings on a process pool (:func:`src.pdf_loader.map_pdfs`). Each
+section becomes a ``{"system", "prompt", "output"}`` record, and the
+cleaning filters run there too. Records stream back in file order and are
+written as they arrive, so there is no intermediate ``RAW_DATA.jsonl``.
+
+The heading patterns are the notebook's, not the stricter ones in
+``src/chunking.py``, so the dataset matches what the notebooks produced.
+They are compiled once into a single alternation with a named group per
+section, which tells which section a heading belongs to without matching
+each pattern again.
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from src import config
+from src.pdf_loader import PDFLoader, map_pdfs
+
+SYSTEM_PROMPT = "You are a helpful assistant that writes proposals for the ASCE Concrete Canoe Competition."
+
+SECTIONS = {
+    "Executive Summary": r"\bExecutive Summary\b",
+    "Project and Quality Management": r"\bProject Management|Project and Quality Management|Quality Management\b",
+    "Hull Design and Structural Analysis": r"\bHull Design|Analysis|Hull Design and Structural Analysis|Structural Analysis\b",
+    "Development and Testing": r"\bDevelopment and Testing|Development|Testing\b",
+    "Construction": r"\bConstruction\b",
+}
+
+PROMPTS = {
+    "Executive Summary": "Write the executive summary for an ASCE Concrete Canoe Competition.",
+    "Project and Quality Management": "Write the project management section for an ASCE Concrete Canoe Competition.",
+    "Hull Design and Structural Analysis": "Write the hull design and structural analysis section for an ASCE Concrete Canoe Competition.",
+    "Development and Testing": "Write the development and testing section for an ASCE Concrete Canoe Competition.",
+    "Construction": "Write the construction section for an ASCE Concrete Canoe Competition.",
+}
+
+# Filters from the cleaning notebook
+MIN_SECTION_CHARS = 50
+MIN_WORDS = 50
+MAX_NUMBER_RATIO = 0.2
+MAX_LAYOUT_LINES = 3
+
+_SECTION_NAMES = list(SECTIONS)
+_HEADING = re.compile(
+    "|".join(f"(?P<s{i}>{pattern})" for i, pattern in enumerate(SECTIONS.values())),
+    re.IGNORECASE,
+)
+_NUMBER = re.compile(r"\d+\.?\d*")
+
+
+def extract_sections(text):
+    """Yield ``(section, text)`` for the text between each heading match and the next."""
+    matches = list(_HEADING.finditer(text))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        section_text = text[match.end():end].strip()
+        if section_text:
+            yield _SECTION_NAMES[int(match.lastgroup[1:])], section_text
+
+
+def number_ratio(text):
+    """Numbers per word; tables and spec sheets score high."""
+    return len(_NUMBER.findall(text)) / max(len(text.split()), 1)
+
+
+def is_layout_like(text):
+    """More than ``MAX_LAYOUT_LINES`` lines without surrounding whitespace.
+
+    This is the notebook's ``line.strip() == line.center(len(line.strip()))``
+    test, which reduces to that.
+    """
+    return sum(1 for line in text.splitlines() if line.strip() and line.strip() == line) > MAX_LAYOUT_LINES
+
+
+def is_bad_entry(entry):
+    output = entry["output"].strip()
+    return (len(output.split()) < MIN_WORDS
+            or number_ratio(output) > MAX_NUMBER_RATIO
+            or is_layout_like(output))
+
+
+def build_records(pdf_path):
+    """Worker: ``(kept records, skipped count)`` for one PDF."""
+    records, skipped = [], 0
+    for section, content in extract_sections(PDFLoader(pdf_path).extract_text()):
+        if len(content) < MIN_SECTION_CHARS:
+            continue
+        entry = {"system": SYSTEM_PROMPT, "prompt": PROMPTS[section], "output": content}
+        if is_bad_entry(entry):
+            skipped += 1
+        else:
+            records.append(entry)
+    return records, skipped
+
+
+def iter_records(pdf_paths, max_workers=config.EXTRACT_WORKERS, prefetch=2):
+    """Yield ``(pdf_path, kept records, skipped count)`` per readable PDF, in order."""
+    for pdf_path, (records, skipped) in map_pdfs(build_records, pdf_paths, max_workers, prefetch):
+        yield pdf_path, records, skipped
+
+
+def build_training_data(pdf_dir, output_path, max_workers=config.EXTRACT_WORKERS):
+    """Write the cleaned records of every PDF in ``pdf_dir`` to ``output_path``; returns a report."""
+    pdf_paths = sorted(os.path.join(pdf_dir, f) for f in os.listdir(pdf_dir) if f.endswith(".pdf"))
+    report = {"files": len(pdf_paths), "processed": 0, "kept": 0, "skipped": 0}
+    started = time.perf_counter()
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as outfile:
+        for _, records, skipped in iter_records(pdf_paths, max_workers):
+            for entry in records:
+                outfile.write(json.dumps(entry) + "\n")
+            report["processed"] += 1
+            report["kept"] += len(records)
+            report["skipped"] += skipped
+    os.replace(tmp_path, output_path)
+
+    report["seconds"] = time.perf_counter() - started
+    report["files_per_second"] = report["processed"] / report["seconds"] if report["seconds"] else 0.0
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdf-dir", default="./pdfs")
+    parser.add_argument("--output", default="CLEAN_DATA.jsonl")
+    parser.add_argument("--workers", type=int, default=config.EXTRACT_WORKERS)
+    args = parser.parse_args()
+
+    report = build_training_data(args.pdf_dir, args.output, args.workers)
+    print(f"Processed {report['processed']}/{report['files']} files in {report['seconds']:.1f}s "
+          f"({report['files_per_second']:.1f} files/s)")
+    print(f"Kept {report['kept']} entries, skipped {report['skipped']} bad ones.")
+
+
+if __name__ == "__main__":
+    main()
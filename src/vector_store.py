@@ -1,14 +1,127 @@
 """Pinecone vector store functionality."""
 
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pinecone import Pinecone, ServerlessSpec
+from tqdm import tqdm
+from src import config
+
+# Rough JSON size of one float in an upsert body
+_BYTES_PER_VALUE = 20
+
+
+@dataclass
+class UpsertReport:
+    vectors: int = 0
+    batches: int = 0
+    retried_batches: int = 0
+    failed_vectors: int = 0
+    seconds: float = 0.0
+
+    @property
+    def vectors_per_second(self):
+        return self.vectors / self.seconds if self.seconds else 0.0
+
+    def __add__(self, other):
+        return UpsertReport(
+            vectors=self.vectors + other.vectors,
+            batches=self.batches + other.batches,
+            retried_batches=self.retried_batches + other.retried_batches,
+            failed_vectors=self.failed_vectors + other.failed_vectors,
+            seconds=self.seconds + other.seconds,
+        )
+
+    def __str__(self):
+        return (f"{self.vectors} vectors in {self.batches} batches "
+                f"({self.retried_batches} retried, {self.failed_vectors} vectors failed) "
+                f"over {self.seconds:.1f}s: {self.vectors_per_second:.0f} vectors/s")
+
+
+def estimate_vector_bytes(vector):
+    """Approximate request payload size of one ``(id, values, metadata)`` tuple."""
+    vector_id, values, metadata = vector
+    return len(vector_id) + len(values) * _BYTES_PER_VALUE + len(json.dumps(metadata))
+
+
+def make_upsert_batches(vectors, max_vectors=config.UPSERT_BATCH_VECTORS, max_bytes=config.UPSERT_BATCH_BYTES):
+    """Group vectors into batches bounded by vector count and payload bytes."""
+    batches, current, current_bytes = [], [], 0
+    for vector in vectors:
+        size = estimate_vector_bytes(vector)
+        if current and (len(current) >= max_vectors or current_bytes + size > max_bytes):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append(vector)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def bulk_upsert(index, vectors, max_workers=config.UPSERT_WORKERS, max_retries=config.UPSERT_MAX_RETRIES,
+                show_progress=True, **batch_limits):
+    """Upsert ``(id, values, metadata)`` tuples in parallel, size-bounded batches.
+
+    Batches that fail are collected and retried on their own, with backoff,
+    up to ``max_retries`` rounds; the rest of the upload is never resent.
+    Returns an :class:`UpsertReport`.
+    """
+    started = time.perf_counter()
+    pending = make_upsert_batches(vectors, **batch_limits)
+    report = UpsertReport(vectors=len(vectors), batches=len(pending))
+    if not pending:
+        return report
+
+    progress = tqdm(total=len(vectors), unit="vec", desc="Upserting", disable=not show_progress)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for attempt in range(max_retries + 1):
+            if attempt:
+                time.sleep(min(30.0, 2 ** (attempt - 1)))
+                report.retried_batches += len(pending)
+            futures = [(batch, pool.submit(index.upsert, vectors=batch)) for batch in pending]
+            failed = []
+            for batch, future in futures:
+                try:
+                    future.result()
+                    progress.update(len(batch))
+                except Exception as e:
+                    failed.append(batch)
+                    last_error = e
+            pending = failed
+            if not pending:
+                break
+    progress.close()
+
+    report.failed_vectors = sum(len(batch) for batch in pending)
+    report.seconds = time.perf_counter() - started
+    if pending:
+        raise RuntimeError(
+            f"{report.failed_vectors} vectors failed to upsert after {max_retries} retries: {last_error}"
+        )
+    return report
+
+
+def delete_vectors(index, vector_ids, batch_size=1000):
+    """Delete vectors by id, at most ``batch_size`` ids per request."""
+    for i in range(0, len(vector_ids), batch_size):
+        index.delete(ids=vector_ids[i:i + batch_size])
+
+
+def update_metadata(index, updates, max_workers=config.UPSERT_WORKERS):
+    """Merge metadata into stored vectors; ``updates`` maps vector id to the fields to set."""
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(lambda item: index.update(id=item[0], set_metadata=item[1]), updates.items()))
+
 
 class PineconeStore:
     def __init__(self, environmeent="us-east-1"):
         pinecone_api_key = os.getenv("PINECONE_API_KEY")
         if not pinecone_api_key:
             raise ValueError("PINECONE_API_KEY not set")
-        
+
         # pinecone instance
         self.pc = Pinecone(api_key=pinecone_api_key)
         self.index_name = "text-analyzer"
@@ -20,11 +133,11 @@ class PineconeStore:
                 metric='cosine',
                 spec=ServerlessSpec(cloud='aws', region='us-east-1')
             )
-    
-    def save_vectors(self, vectors, metadata, chunks):
-        index = self.pc.Index(self.index_name)
+        self.index = self.pc.Index(self.index_name)
 
+    def save_vectors(self, vectors, metadata, chunks):
         # save each embedding with unique metadata
+        records = []
         for i, vector in enumerate(vectors):
             vector_id = f"{metadata['id']}_chunk_{i}" # uniqe id
             chunk_metadata = {
@@ -33,9 +146,9 @@ class PineconeStore:
                 "chunk" : i,
                 "text": chunks[i]
             }
+            records.append((vector_id, vector, chunk_metadata))
 
-            index.upsert(vectors=[(vector_id, vector, chunk_metadata)])
+        return bulk_upsert(self.index, records)
 
     def delete(self):
-        index = self.pc.Index(self.index_name)
-        index.delete(delete_all=True) 
\ No newline at end of file
+        self.index.delete(delete_all=True)
@@ -0,0 +1,169 @@
+"""Tests for the admission controller in ``src/admission.py``."""
+
+import asyncio
+import threading
+import time
+import pytest
+from src import config
+from src.admission import AdmissionController, Rejected, request_timeout
+
+
+@pytest.fixture(autouse=True)
+def no_metrics(monkeypatch):
+    monkeypatch.setattr(config, "METRICS_ENABLED", False)
+
+
+def controller(**kwargs):
+    return AdmissionController(**{"max_concurrency": 1, "max_queue": 4, "prioritize_short": False,
+                                  "service_seconds": 0.01, **kwargs})
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def queue(admission, question, order, weight=1):
+    """Start a thread that waits for ``question``'s slots and records when it gets them."""
+    queued = len(admission._waiting)
+
+    def run():
+        with admission.admit(question, timeout=5, weight=weight):
+            order.append(question)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    wait_for(lambda: len(admission._waiting) > queued)
+    return thread
+
+
+def test_requests_wait_for_a_slot_in_arrival_order():
+    admission, order = controller(), []
+
+    with admission.admit("first"):
+        threads = [queue(admission, question, order) for question in ("second", "third")]
+        assert admission.in_flight == 1 and order == []
+    for thread in threads:
+        thread.join()
+
+    assert order == ["second", "third"]
+    assert admission.in_flight == 0 and not admission._waiting
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    admission = controller(max_queue=1)
+
+    with admission.admit("first"):
+        thread = queue(admission, "second", [])
+        with pytest.raises(Rejected) as rejected:
+            with admission.admit("third"):
+                pass
+    thread.join()
+
+    assert rejected.value.reason == "queue_full" and rejected.value.retry_after >= 1
+
+
+def test_request_that_cannot_be_served_in_time_is_rejected_up_front():
+    admission = controller(service_seconds=10)
+
+    with admission.admit("first"):
+        with pytest.raises(Rejected) as rejected:
+            with admission.admit("second", timeout=5):
+                pass
+
+    assert rejected.value.reason == "deadline"
+    assert not admission._waiting
+
+
+def test_request_that_waits_past_its_timeout_expires():
+    admission = controller(service_seconds=0)
+
+    with admission.admit("first"):
+        with pytest.raises(Rejected) as rejected:
+            with admission.admit("second", timeout=0.05):
+                pass
+
+    assert rejected.value.reason == "expired"
+    assert admission.in_flight == 0 and not admission._waiting
+
+
+def test_batch_holds_one_slot_per_question_and_is_not_overtaken():
+    admission, order = controller(max_concurrency=2), []
+
+    with admission.admit("first"):
+        batch = queue(admission, "batch", order, weight=2)
+        single = queue(admission, "single", order)
+        assert admission.in_flight == 1
+    batch.join()
+    single.join()
+
+    assert order == ["batch", "single"]
+
+
+def test_batch_weight_is_capped_at_the_whole_limit():
+    admission = controller(max_concurrency=2)
+
+    with admission.admit("batch", weight=10):
+        assert admission.in_flight == 2
+    assert admission.in_flight == 0
+
+
+def test_short_questions_go_first_when_prioritized():
+    admission, order = controller(prioritize_short=True, short_words=3), []
+
+    with admission.admit("first"):
+        threads = [queue(admission, question, order)
+                   for question in ("what was the hull made of in the end", "hull material?")]
+    for thread in threads:
+        thread.join()
+
+    assert order == ["hull material?", "what was the hull made of in the end"]
+
+
+def test_only_single_questions_update_the_service_time():
+    admission = controller(max_concurrency=2, service_seconds=100)
+
+    with admission.admit("batch", weight=2):
+        pass
+    assert admission.service_seconds == 100
+    with admission.admit("single"):
+        pass
+    assert admission.service_seconds < 100
+
+
+def test_async_and_sync_requests_share_the_slots():
+    admission, order = controller(), []
+
+    async def main():
+        async with admission.aadmit("first"):
+            thread = queue(admission, "sync", order)
+            waiting = asyncio.ensure_future(run("async"))
+            while len(admission._waiting) < 2:
+                await asyncio.sleep(0.001)
+            order.append("first")
+        await asyncio.to_thread(thread.join)
+        await waiting
+
+    async def run(question):
+        async with admission.aadmit(question, timeout=5):
+            order.append(question)
+
+    asyncio.run(main())
+
+    assert order == ["first", "sync", "async"]
+    assert admission.in_flight == 0 and not admission._waiting
+
+
+@pytest.mark.parametrize("header, timeout", [
+    (None, config.ADMISSION_TIMEOUT),
+    ("5", 5.0),
+    (str(config.ADMISSION_TIMEOUT * 10), config.ADMISSION_TIMEOUT),
+    ("0", config.ADMISSION_TIMEOUT),
+    ("soon", config.ADMISSION_TIMEOUT),
+])
+def test_request_timeout_header_is_capped(header, timeout):
+    headers = {} if header is None else {"X-Request-Timeout": header}
+
+    assert request_timeout(headers) == timeout
@@ -0,0 +1,183 @@
+"""Tests for single-flight coalescing in ``src/coalescing.py``."""
+
+import asyncio
+import threading
+import time
+import pytest
+from src import config, resilience
+from src.coalescing import SingleFlight, flight_key
+
+
+@pytest.fixture(autouse=True)
+def no_metrics(monkeypatch):
+    monkeypatch.setattr(config, "METRICS_ENABLED", False)
+
+
+@pytest.fixture
+def make_flight(tmp_path):
+    def make(**kwargs):
+        return SingleFlight(encode=lambda value: value, decode=lambda value: value,
+                            directory=str(tmp_path), poll_interval=0.005, **kwargs)
+    return make
+
+
+class Leader:
+    """A function that blocks until released, then returns or raises ``outcome``."""
+
+    def __init__(self, outcome="leader answer"):
+        self.outcome = outcome
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.started.set()
+        self.release.wait(5)
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+
+def lead(flight, key, fn):
+    """Run ``fn`` as the leader in a thread; returns the thread and its outcome."""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = flight.run(key, fn)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    fn.started.wait(5)
+    return thread, outcome
+
+
+def follow(flight, key, fn):
+    outcome = {}
+    thread = threading.Thread(target=lambda: outcome.update(result=flight.run(key, fn)))
+    thread.start()
+    return thread, outcome
+
+
+def test_flight_key_ignores_case_and_whitespace_but_not_history():
+    history = [{"role": "user", "content": "Hi"}]
+
+    assert flight_key("What was the hull made of?", []) == flight_key("  what was the HULL made of?", [])
+    assert flight_key("What was the hull made of?", []) != flight_key("What was the hull made of?", history)
+
+
+def test_followers_share_the_leaders_result(make_flight):
+    flight, leader = make_flight(), Leader()
+    thread, led = lead(flight, "key", leader)
+    follower, followed = follow(flight, "key", lambda: "follower answer")
+    time.sleep(0.05)
+
+    leader.release.set()
+    thread.join()
+    follower.join()
+
+    assert led["result"] == followed["result"] == "leader answer"
+
+
+def test_follower_retries_when_the_leader_fails(make_flight):
+    flight, leader = make_flight(), Leader(RuntimeError("upstream timed out"))
+    thread, led = lead(flight, "key", leader)
+    follower, followed = follow(flight, "key", lambda: "follower answer")
+    time.sleep(0.05)
+
+    leader.release.set()
+    thread.join()
+    follower.join()
+
+    assert isinstance(led["error"], RuntimeError)
+    assert followed["result"] == "follower answer"
+
+
+def test_unshareable_results_are_not_handed_to_followers(make_flight):
+    flight, leader = make_flight(share=lambda result: result != "degraded"), Leader("degraded")
+    thread, _ = lead(flight, "key", leader)
+    follower, followed = follow(flight, "key", lambda: "follower answer")
+    time.sleep(0.05)
+
+    leader.release.set()
+    thread.join()
+    follower.join()
+
+    assert followed["result"] == "follower answer"
+
+
+def test_follower_stops_waiting_at_its_deadline(make_flight):
+    flight, leader = make_flight(), Leader()
+    thread, _ = lead(flight, "key", leader)
+
+    started = time.monotonic()
+    with resilience.deadline(0.05):
+        result = flight.run("key", lambda: "follower answer")
+    leader.release.set()
+    thread.join()
+
+    assert result == "follower answer"
+    assert time.monotonic() - started < 1
+
+
+def test_other_workers_get_the_result_through_the_shared_directory(make_flight):
+    first, second, leader = make_flight(), make_flight(), Leader()
+    thread, _ = lead(first, "key", leader)
+    follower, followed = follow(second, "key", lambda: "follower answer")
+    time.sleep(0.05)
+
+    leader.release.set()
+    thread.join()
+    follower.join()
+
+    assert followed["result"] == "leader answer"
+
+
+def test_other_workers_run_it_themselves_when_the_leader_fails(make_flight):
+    first, second, leader = make_flight(), make_flight(), Leader(RuntimeError("boom"))
+    thread, _ = lead(first, "key", leader)
+    follower, followed = follow(second, "key", lambda: "follower answer")
+    time.sleep(0.05)
+
+    leader.release.set()
+    thread.join()
+    follower.join()
+
+    assert followed["result"] == "follower answer"
+
+
+def test_async_follower_retries_when_the_leader_fails(make_flight):
+    flight = make_flight()
+
+    async def failing():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("upstream timed out")
+
+    async def answering():
+        return "follower answer"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.arun("key", failing))
+        await asyncio.sleep(0.01)
+        follower = await flight.arun("key", answering)
+        with pytest.raises(RuntimeError):
+            await leader
+        return follower
+
+    assert asyncio.run(main()) == "follower answer"
+
+
+def test_async_followers_share_the_leaders_result(make_flight):
+    flight, calls = make_flight(), []
+
+    async def answer():
+        calls.append(True)
+        await asyncio.sleep(0.05)
+        return "leader answer"
+
+    async def main():
+        return await asyncio.gather(*(flight.arun("key", answer) for _ in range(3)))
+
+    assert asyncio.run(main()) == ["leader answer"] * 3
+    assert len(calls) == 1
@@ -0,0 +1,72 @@
+"""Tests for packing retrieved chunks into the prompt context (``src/context_packer.py``)."""
+
+from langchain_core.documents import Document
+from src.context_packer import ContextPacker, join_overlapping
+from src.history import count_tokens
+
+
+def chunk(text, source="a.pdf", number=None):
+    metadata = {"source": source}
+    if number is not None:
+        metadata["chunk"] = number
+    return Document(page_content=text, metadata=metadata)
+
+
+def sentence(topic, words=40):
+    return " ".join(f"{topic}{i}" for i in range(words))
+
+
+def test_near_duplicates_of_a_better_ranked_chunk_are_dropped():
+    best = chunk(sentence("hull"), source="a.pdf")
+    copy = chunk(sentence("hull") + " scanned", source="a_ocr.pdf")
+    other = chunk(sentence("mix"), source="b.pdf")
+
+    context = ContextPacker(token_budget=10_000, similarity=0.8).pack([best, copy, other])
+
+    assert list(context) == [best, other]
+    assert context.stats["context_duplicates_dropped"] == 1
+
+
+def test_neighbouring_chunks_are_merged_with_their_overlap_written_once():
+    first = chunk("the hull was cast in two layers of lightweight concrete", number=3)
+    second = chunk("two layers of lightweight concrete over a foam mold", number=4)
+    unrelated = chunk(sentence("mix"), source="b.pdf", number=4)
+
+    context = ContextPacker(token_budget=10_000).pack([second, unrelated, first])
+
+    merged = context[0]
+    assert merged.page_content == "the hull was cast in two layers of lightweight concrete over a foam mold"
+    assert merged.metadata["chunk"] == 3 and merged.metadata["chunks"] == [3, 4]
+    assert context[1] == unrelated
+    assert context.stats["context_chunks_merged"] == 1 and context.stats["context_passages"] == 2
+
+
+def test_chunks_without_positions_are_kept_apart():
+    assert join_overlapping("no shared words", "at the seam") == "no shared words\nat the seam"
+    documents = [chunk(sentence("hull")), chunk(sentence("mix"))]
+
+    assert list(ContextPacker(token_budget=10_000).pack(documents)) == documents
+
+
+def test_passages_that_do_not_fit_are_skipped_for_smaller_ones():
+    large, medium, small = chunk(sentence("hull", 300)), chunk(sentence("mix", 200)), chunk(sentence("paddle", 20))
+    budget = count_tokens(large.page_content) + count_tokens(small.page_content)
+
+    context = ContextPacker(token_budget=budget).pack([large, medium, small])
+
+    assert list(context) == [large, small]
+    assert context.stats["context_tokens"] <= budget
+    assert context.stats["context_tokens_retrieved"] > budget
+
+
+def test_best_passage_is_truncated_when_nothing_fits():
+    context = ContextPacker(token_budget=10).pack([chunk(sentence("hull", 300))])
+
+    assert len(context) == 1 and context[0].metadata["truncated"]
+    assert context.stats["context_tokens"] <= 10
+
+
+def test_nothing_retrieved_packs_nothing():
+    context = ContextPacker().pack([])
+
+    assert list(context) == [] and context.stats["context_tokens"] == 0
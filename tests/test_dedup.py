@@ -0,0 +1,79 @@
+"""Tests for near-duplicate chunk detection in ``src/dedup.py``."""
+
+from src.dedup import DedupIndex, MinHasher, dedup_path, near_duplicates, similarity
+
+RULES = ("All mixtures met the competition rules for cementitious materials, aggregates and "
+         "reinforcement, and every material used is listed in the technical data sheets in Appendix B.")
+RULES_REPRINTED = RULES.replace("Appendix B", "Appendix B of this paper")
+HULL = ("Team Granite Otter cast its hull from mix MX4821 with glass microspheres over a "
+        "male foam mold, then sanded, stained and sealed it before the regional races.")
+
+
+def test_signatures_are_stable_and_estimate_jaccard_similarity():
+    first, second = MinHasher(), MinHasher()
+
+    assert list(first.signature(RULES)) == list(second.signature(RULES))
+    assert similarity(first.signature(RULES), first.signature(RULES_REPRINTED)) > 0.7
+    assert similarity(first.signature(RULES), first.signature(HULL)) < 0.2
+
+
+def test_near_duplicates_point_at_the_first_copy():
+    assert near_duplicates([RULES, HULL, RULES_REPRINTED, RULES]) == [0, 1, 0, 0]
+
+
+def test_near_duplicate_chunk_is_assigned_to_its_canonical(tmp_path):
+    index = DedupIndex(str(tmp_path / "manifest.dedup.json"), enabled=True)
+
+    assert index.assign("a_chunk_0", RULES, source="a.pdf") is None
+    assert index.assign("a_chunk_1", HULL, source="a.pdf") is None
+    assert index.assign("b_chunk_0", RULES_REPRINTED, source="b.pdf") == "a_chunk_0"
+
+    assert index.is_duplicate("b_chunk_0") and not index.is_duplicate("a_chunk_1")
+    assert index.has_role("b_chunk_0") and not index.has_role("c_chunk_0")
+    assert index.sources("a_chunk_0") == ["a.pdf", "b.pdf"]
+
+
+def test_disabled_index_keeps_every_chunk_canonical(tmp_path):
+    index = DedupIndex(str(tmp_path / "manifest.dedup.json"), enabled=False)
+
+    assert index.assign("a_chunk_0", RULES, source="a.pdf") is None
+    assert index.assign("b_chunk_0", RULES, source="b.pdf") is None
+    assert index.params == {"enabled": False} and not index.duplicates
+
+
+def test_releasing_a_duplicate_updates_its_canonicals_sources(tmp_path):
+    index = DedupIndex(str(tmp_path / "manifest.dedup.json"), enabled=True)
+    index.assign("a_chunk_0", RULES, source="a.pdf")
+    index.assign("b_chunk_0", RULES, source="b.pdf")
+
+    touched, orphaned = index.release(["b_chunk_0"])
+
+    assert touched == {"a_chunk_0"} and orphaned == {}
+    assert index.sources("a_chunk_0") == ["a.pdf"]
+
+
+def test_releasing_a_canonical_orphans_its_duplicates(tmp_path):
+    index = DedupIndex(str(tmp_path / "manifest.dedup.json"), enabled=True)
+    index.assign("a_chunk_0", RULES, source="a.pdf")
+    index.assign("b_chunk_0", RULES, source="b.pdf")
+
+    touched, orphaned = index.release(["a_chunk_0"])
+
+    assert touched == set() and orphaned == {"b_chunk_0": "b.pdf"}
+    assert not index.has_role("a_chunk_0") and not index.has_role("b_chunk_0")
+    assert index.assign("b_chunk_0", RULES, source="b.pdf") is None
+
+
+def test_saved_index_is_reloaded_only_with_the_same_params(tmp_path):
+    path = dedup_path(str(tmp_path / "manifest.json"))
+    index = DedupIndex(path, enabled=True)
+    index.assign("a_chunk_0", RULES, source="a.pdf")
+    index.assign("b_chunk_0", RULES, source="b.pdf")
+    index.save()
+
+    reloaded = DedupIndex(path, enabled=True)
+    assert reloaded.is_duplicate("b_chunk_0")
+    assert reloaded.assign("c_chunk_0", RULES_REPRINTED, source="c.pdf") == "a_chunk_0"
+
+    assert not DedupIndex(path, threshold=0.99, enabled=True).has_role("a_chunk_0")
+    assert not DedupIndex(path, enabled=False).has_role("a_chunk_0")
@@ -0,0 +1,57 @@
+"""Tests for the persistent embedding cache in ``src/embedding_cache.py``."""
+
+import asyncio
+import threading
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class ThreadRecordingCache(EmbeddingCache):
+    """Records the thread each lookup or store ran on."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threads = []
+
+    def get_many(self, texts):
+        self.threads.append(threading.current_thread())
+        return super().get_many(texts)
+
+    def put_many(self, texts, vectors):
+        self.threads.append(threading.current_thread())
+        super().put_many(texts, vectors)
+
+
+def test_vectors_round_trip_and_are_shared_between_workers(tmp_path):
+    first = EmbeddingCache("model", 4, directory=str(tmp_path), max_entries=8)
+    second = EmbeddingCache("model", 4, directory=str(tmp_path), max_entries=8)
+
+    first.put_many(["hull", "mix"], [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0]])
+    assert second.get_many(["mix", "keel", "hull"]) == [[0.0, 1.0, 0.0, 0.0], None, [1.0, 0.0, 0.0, 0.0]]
+    assert EmbeddingCache("other model", 4, directory=str(tmp_path), max_entries=8).get_many(["hull"]) == [None]
+
+
+def test_least_recently_used_rows_are_reused_when_full(tmp_path):
+    cache = EmbeddingCache("model", 2, directory=str(tmp_path), max_entries=2, touch_interval=0)
+    cache.put_many(["a"], [[1.0, 0.0]])
+    cache.put_many(["b"], [[0.0, 1.0]])
+    cache.get_many(["a"])
+    cache.put_many(["c"], [[1.0, 1.0]])
+
+    assert cache.get_many(["a", "b", "c"]) == [[1.0, 0.0], None, [1.0, 1.0]]
+
+
+def test_async_embeddings_use_the_cache_off_the_event_loop(tmp_path):
+    cache = ThreadRecordingCache("model", 8, directory=str(tmp_path), max_entries=8)
+    embeddings = CachedEmbeddings(DeterministicFakeEmbedding(size=8), cache)
+
+    async def embed():
+        vector = await embeddings.aembed_query("hull")
+        vectors = await embeddings.aembed_documents(["hull", "mix"])
+        return vector, vectors, threading.current_thread()
+
+    vector, vectors, loop_thread = asyncio.run(embed())
+    # Cached vectors come back as float32
+    assert vectors[0] == pytest.approx(vector, rel=1e-6)
+    assert len(cache.threads) == 4 and loop_thread not in cache.threads
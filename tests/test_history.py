@@ -0,0 +1,125 @@
+"""Tests for fitting conversation histories into a token budget (``src/history.py``)."""
+
+import asyncio
+import types
+import pytest
+from src.history import HistoryManager, attach_summary, message_tokens, prefix_digest
+
+
+class FakeSummaryModel:
+    """Summarizes by listing the messages it was given, and records each prompt."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt[1][1])
+        if self.fail:
+            raise RuntimeError("summary model unavailable")
+        return types.SimpleNamespace(content=f"summary {len(self.prompts)}")
+
+    async def ainvoke(self, prompt):
+        return self.invoke(prompt)
+
+
+def conversation(turns):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Question {i} about the hull and the concrete mix"})
+        history.append({"role": "assistant", "content": f"Answer {i} about the hull and the concrete mix"})
+    return history
+
+
+MESSAGE = message_tokens(conversation(1)[0])
+
+
+def manager(keep=4, **kwargs):
+    """A manager whose budget holds ``keep`` messages verbatim next to the summary."""
+    summary_max_tokens = 20
+    return HistoryManager(token_budget=keep * MESSAGE + summary_max_tokens + 4,
+                          summary_max_tokens=summary_max_tokens, **kwargs)
+
+
+def test_history_within_budget_is_kept_verbatim():
+    llm = FakeSummaryModel()
+    history = conversation(2)
+
+    fitted = manager().fit(history, llm=llm)
+
+    assert fitted.history == history and llm.prompts == []
+    assert fitted.stats["summarized_messages"] == 0 and fitted.stats["dropped_messages"] == 0
+
+
+def test_older_messages_are_folded_into_a_summary_of_the_client_prefix():
+    history = conversation(4)
+
+    fitted = manager().fit(history, llm=FakeSummaryModel())
+
+    summary = fitted.history[0]
+    assert fitted.history[1:] == history[4:]
+    assert summary["role"] == "summary" and summary["messages"] == 4
+    assert summary["digest"] == prefix_digest(history[:4])
+    assert fitted.stats["summarized_messages"] == 4
+
+
+def test_stored_summary_is_extended_with_only_the_new_messages():
+    history = conversation(4)
+    fitted = manager(summary_cache_entries=0).fit(history, llm=FakeSummaryModel())
+    stored = fitted.history + conversation(6)[8:]
+
+    llm = FakeSummaryModel()
+    client = attach_summary(conversation(6), stored)
+    refitted = manager(summary_cache_entries=0).fit(client, llm=llm)
+
+    assert client[0] == fitted.history[0]
+    assert len(llm.prompts) == 1 and "Question 0" not in llm.prompts[0]
+    assert "Summary so far: summary 1" in llm.prompts[0]
+    assert refitted.history[0]["digest"] == prefix_digest(conversation(6)[:8])
+
+
+def test_clients_without_a_session_are_summarized_incrementally():
+    history_manager, llm = manager(), FakeSummaryModel()
+
+    history_manager.fit(conversation(4), llm=llm)
+    history_manager.fit(conversation(5), llm=llm)
+    fitted = history_manager.fit(conversation(5), llm=llm)
+
+    assert len(llm.prompts) == 2
+    assert "Question 0" not in llm.prompts[1] and "Question 2" in llm.prompts[1]
+    assert fitted.history[0]["content"] == "summary 2" and fitted.history[1:] == conversation(5)[6:]
+
+
+def test_summary_after_dropping_past_the_message_cap_matches_the_full_history():
+    history = conversation(6)
+
+    fitted = manager(max_messages=8).fit(history, llm=FakeSummaryModel())
+
+    summary = fitted.history[0]
+    assert fitted.stats["dropped_messages"] == 4
+    assert summary["messages"] == 8 and summary["digest"] == prefix_digest(history[:8])
+    assert attach_summary(history, fitted.history)[0] == summary
+
+
+def test_failed_summary_drops_the_older_messages(caplog):
+    fitted = manager().fit(conversation(4), llm=FakeSummaryModel(fail=True))
+
+    assert fitted.history == conversation(4)[4:]
+    assert fitted.stats["dropped_messages"] == 4
+    assert "Could not summarize" in caplog.text
+
+
+def test_afit_matches_fit():
+    history = conversation(5)
+
+    fitted = manager().fit(history, llm=FakeSummaryModel())
+    afitted = asyncio.run(manager().afit(history, llm=FakeSummaryModel()))
+
+    assert afitted.history == fitted.history and afitted.stats == fitted.stats
+
+
+@pytest.mark.parametrize("stored", [None, [], conversation(1)])
+def test_attach_summary_leaves_histories_without_a_matching_summary_alone(stored):
+    history = conversation(3)
+
+    assert attach_summary(history, stored) == history
@@ -0,0 +1,135 @@
+"""Tests for the BM25 index and hybrid retrieval in ``src/lexical_index.py``."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from src import config, resilience
+from src.lexical_index import HybridRetriever, LexicalIndex, reciprocal_rank_fusion
+
+CHUNKS = {
+    "granite_chunk_0": "Team Granite Otter cast its hull from mix MX4821 with glass microspheres.",
+    "silver_chunk_0": "Team Silver Heron used a foam mold and two layers of carbon mesh.",
+    "maple_chunk_0": "The Maple Drifter hull was sanded, stained and sealed before the races.",
+    "rules_chunk_0": "Every team tested its concrete mix for compressive and tensile strength.",
+}
+
+
+@pytest.fixture(autouse=True)
+def no_metrics(monkeypatch):
+    monkeypatch.setattr(config, "METRICS_ENABLED", False)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical"))
+    index.upsert([(vector_id, [], {"id": vector_id, "text": text}) for vector_id, text in CHUNKS.items()])
+    index.save()
+    return index
+
+
+def test_search_ranks_chunks_by_bm25(index):
+    matches, max_score = index.search("Which team used mix MX4821?")
+
+    assert matches[0][0] == "granite_chunk_0"
+    assert 0 < matches[0][1] <= max_score
+    assert index.search("submarine propeller") == ([], pytest.approx(0.0))
+
+
+def test_saved_snapshot_is_shared_and_updated_in_place(index, tmp_path):
+    reader = LexicalIndex(str(tmp_path / "lexical"))
+    assert len(reader) == 4 and "maple_chunk_0" in reader
+
+    index.delete(ids=["maple_chunk_0"])
+    index.update("silver_chunk_0", set_metadata={"source": "silver.pdf"})
+    assert "maple_chunk_0" not in index and len(reader) == 4
+    index.save()
+
+    matches, _ = reader.search("foam mold carbon mesh")
+    assert len(reader) == 3 and "maple_chunk_0" not in reader
+    assert matches[0][2]["source"] == "silver.pdf"
+
+
+def test_reciprocal_rank_fusion_favours_documents_both_rankings_agree_on():
+    fused = reciprocal_rank_fusion([[("a", "A"), ("b", "B")], [("b", "B"), ("c", "C")]])
+
+    assert fused == ["B", "A", "C"]
+
+
+class FakeVectorRetriever(BaseRetriever):
+    """Vector search that returns the rules chunk, or raises ``error``."""
+
+    error: object = None
+    calls: int = 0
+
+    def get_documents_by_vector(self, vector, query=None):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return [Document(page_content=CHUNKS["rules_chunk_0"], metadata={"id": "rules_chunk_0"})]
+
+    async def aget_documents_by_vector(self, vector, query=None):
+        return self.get_documents_by_vector(vector, query)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.get_documents_by_vector(None)
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [0.0]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+def hybrid(index, fast_path=True, error=None):
+    return HybridRetriever(vector_retriever=FakeVectorRetriever(error=error), lexical_index=index,
+                           embeddings=CountingEmbeddings(), executor=ThreadPoolExecutor(2), k=3,
+                           fast_path=fast_path, fast_path_coverage=0.4, fast_path_margin=1.5)
+
+
+def ids(documents):
+    return [document.metadata["id"] for document in documents]
+
+
+def test_decisive_lexical_hit_skips_the_embedding(index):
+    retriever = hybrid(index)
+
+    documents = retriever.invoke("Granite Otter MX4821")
+
+    assert ids(documents)[0] == "granite_chunk_0"
+    assert retriever.embeddings.calls == 0 and retriever.vector_retriever.calls == 0
+
+
+@pytest.mark.parametrize("fast_path", [True, False])
+def test_vague_query_fuses_lexical_and_vector_results(index, fast_path):
+    retriever = hybrid(index, fast_path=fast_path)
+
+    documents = retriever.invoke("How was the hull finished?")
+
+    assert "rules_chunk_0" in ids(documents) and "maple_chunk_0" in ids(documents)
+    assert retriever.embeddings.calls == 1
+    assert asyncio.run(retriever.ainvoke("How was the hull finished?")) == documents
+
+
+def test_unavailable_vector_search_falls_back_to_bm25(index):
+    retriever = hybrid(index, error=resilience.CircuitOpen("vector_search", 5))
+
+    documents = retriever.invoke("How was the hull finished?")
+
+    assert "maple_chunk_0" in ids(documents) and "rules_chunk_0" not in ids(documents)
+
+
+def test_batch_path_fuses_with_the_known_vector(index):
+    retriever = hybrid(index)
+
+    documents = retriever.get_documents_by_vector([0.0], "How was the hull finished?")
+
+    assert "rules_chunk_0" in ids(documents) and "maple_chunk_0" in ids(documents)
+    assert retriever.embeddings.calls == 0
@@ -0,0 +1,174 @@
+"""Tests for the ingest manifest (``src/manifest.py``) and incremental ingestion."""
+
+import os
+import types
+import fitz
+import pytest
+from src import config, load_documents, registry
+from src.local_index import LocalVectorIndex
+from src.manifest import IngestManifest, file_sha256, text_sha256
+
+PARAMS = {"chunk_size": 800, "embedding_model": "text-embedding-3-small"}
+
+
+def test_recorded_files_survive_a_reload(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = IngestManifest(path)
+    manifest.record("a.pdf", "hash a", PARAMS, [("a_chunk_0", "hull"), ("a_chunk_1", "mix")])
+    manifest.save()
+
+    reloaded = IngestManifest(path)
+    assert reloaded.is_unchanged("a.pdf", "hash a", PARAMS)
+    assert reloaded.vector_ids("a.pdf") == ["a_chunk_0", "a_chunk_1"]
+    assert reloaded.reusable_chunks("a.pdf", PARAMS) == {"a_chunk_0": text_sha256("hull"),
+                                                          "a_chunk_1": text_sha256("mix")}
+    assert not os.path.exists(f"{path}.tmp")
+
+
+def test_changed_content_or_settings_make_an_entry_stale(tmp_path):
+    manifest = IngestManifest(str(tmp_path / "manifest.json"))
+    manifest.record("a.pdf", "hash a", PARAMS, [("a_chunk_0", "hull")])
+    other_params = {**PARAMS, "chunk_size": 400}
+
+    assert not manifest.is_unchanged("a.pdf", "hash b", PARAMS)
+    assert not manifest.is_unchanged("a.pdf", "hash a", other_params)
+    assert manifest.reusable_chunks("a.pdf", other_params) == {}
+    assert not manifest.is_unchanged("b.pdf", "hash a", PARAMS) and manifest.vector_ids("b.pdf") == []
+
+    manifest.remove("a.pdf")
+    assert manifest.get("a.pdf") is None
+
+
+def test_manifest_of_another_version_is_ignored(tmp_path):
+    path = tmp_path / "manifest.json"
+    path.write_text('{"version": 0, "files": {"a.pdf": {}}}', encoding="utf-8")
+
+    assert IngestManifest(str(path)).files == {}
+
+
+def test_file_hash_reads_in_blocks(tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"concrete canoe" * 1000)
+
+    assert file_sha256(str(path), block_size=7) == file_sha256(str(path))
+
+
+def paragraph(team, topic, words=450):
+    return " ".join(f"{team} {topic} {i}" for i in range(words // 3)) + "."
+
+
+PAPERS = {
+    "granite.pdf": [paragraph("granite", topic) for topic in ("hull", "mix", "paddling")],
+    "silver.pdf": [paragraph("silver", topic) for topic in ("hull", "mix", "paddling")],
+}
+
+
+def write_pdf(path, paragraphs):
+    """One page per paragraph."""
+    document = fitz.open()
+    for text in paragraphs:
+        document.new_page().insert_textbox(fitz.Rect(36, 36, 576, 756), text, fontsize=8)
+    document.save(path)
+    document.close()
+
+
+class FakeOpenAI:
+    """Embeddings client that records every text sent to it."""
+
+    def __init__(self):
+        self.embedded = []
+        self.embeddings = self
+
+    def with_options(self, **kwargs):
+        return self
+
+    def create(self, input, model):
+        self.embedded.extend(input)
+        return types.SimpleNamespace(data=[types.SimpleNamespace(index=i, embedding=[1.0, float(i), 0.0, 0.0])
+                                           for i in range(len(input))])
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """A ``pdfs/`` folder and a local backend (under ``./data``) in ``tmp_path``; returns the fake client."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("pdfs")
+    for name, paragraphs in PAPERS.items():
+        write_pdf(os.path.join("pdfs", name), paragraphs)
+    monkeypatch.setattr(config, "METRICS_ENABLED", False)
+    monkeypatch.setattr(config, "EMBEDDING_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "EMBEDDING_DIMENSION", 4)
+    client = FakeOpenAI()
+    monkeypatch.setattr(registry, "get_openai_client", lambda: client)
+    return client
+
+
+def ingest(**kwargs):
+    load_documents.load_pdfs_to_vectordb(backend="local", **kwargs)
+
+
+def stored_ids():
+    index = LocalVectorIndex(dimension=4)
+    return {vector_id for vector_id, _, _ in index.search([1.0, 0.0, 0.0, 0.0], k=len(index))}
+
+
+def test_second_run_skips_unchanged_files(workspace):
+    ingest()
+    first = len(workspace.embedded)
+    ids = stored_ids()
+
+    ingest()
+
+    assert first > 0 and len(workspace.embedded) == first
+    assert stored_ids() == ids
+
+
+def test_changed_file_only_re_embeds_its_changed_chunks(workspace):
+    ingest()
+    workspace.embedded.clear()
+
+    write_pdf(os.path.join("pdfs", "silver.pdf"), PAPERS["silver.pdf"][:2] + [paragraph("silver", "racing")])
+    ingest()
+
+    # Chunks straddle pages, so the chunk before the edited page changes too
+    assert 0 < len(workspace.embedded) < len(PAPERS["silver.pdf"])
+    assert "silver racing" in workspace.embedded[-1]
+    assert not any("granite" in text or "silver hull" in text for text in workspace.embedded)
+
+
+def test_removed_file_loses_its_vectors(workspace):
+    ingest()
+    silver = {vector_id for vector_id in stored_ids() if vector_id.startswith("silver_chunk_")}
+
+    os.remove(os.path.join("pdfs", "silver.pdf"))
+    ingest()
+
+    assert silver and not stored_ids() & silver
+    assert IngestManifest(os.path.join(config.LOCAL_INDEX_DIR, "ingest_manifest.json")).get("silver.pdf") is None
+    assert stored_ids() == {vector_id for vector_id in stored_ids() if vector_id.startswith("granite_chunk_")}
+
+
+def test_full_run_re_embeds_everything(workspace):
+    ingest()
+    first = len(workspace.embedded)
+
+    ingest(incremental=False)
+
+    assert len(workspace.embedded) == 2 * first
+
+
+def test_copied_paper_is_not_embedded_and_takes_over_when_the_original_goes(workspace):
+    ingest()
+    workspace.embedded.clear()
+
+    write_pdf(os.path.join("pdfs", "granite_draft.pdf"), PAPERS["granite.pdf"])
+    ingest()
+    assert workspace.embedded == []
+    assert not any(vector_id.startswith("granite_draft_") for vector_id in stored_ids())
+
+    os.remove(os.path.join("pdfs", "granite.pdf"))
+    ingest()
+    ids = stored_ids()
+    assert len(workspace.embedded) == len(PAPERS["granite.pdf"])
+    assert any(vector_id.startswith("granite_draft_") for vector_id in ids)
+    assert not any(vector_id.startswith("granite_chunk_") for vector_id in ids)
@@ -0,0 +1,102 @@
+"""Tests for the batch and streaming answer paths of ``src/query.py``."""
+
+import asyncio
+import types
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.runnables import RunnableLambda
+from langchain_pinecone import PineconeVectorStore
+from src import query, registry, resilience
+from src.answer_cache import AnswerCache
+
+
+class FakeRetriever:
+    def get_documents_by_vector(self, vector, query=None):
+        return [Document(page_content="The hull was cast in lightweight concrete.", metadata={"source": "a.pdf"})]
+
+    async def aget_documents_by_vector(self, vector, query=None):
+        return self.get_documents_by_vector(vector, query)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = AnswerCache()
+    embeddings = DeterministicFakeEmbedding(size=8)
+    # Like create_stuff_documents_chain, the answer chain returns a plain string
+    chain = RunnableLambda(lambda inputs: f"Answer to {inputs['input']} from {len(inputs['context'])} documents")
+    monkeypatch.setattr(registry, "get_embedding_model", lambda: embeddings)
+    monkeypatch.setattr(query, "get_retriever", lambda: FakeRetriever())
+    monkeypatch.setattr(query, "get_answer_chain_with_history", lambda: chain)
+    monkeypatch.setattr(query, "get_summary_model", lambda: None)
+    monkeypatch.setattr(query, "get_answer_cache", lambda: cache)
+    return cache
+
+
+def check_results(results):
+    hit, miss = results
+    assert hit.cache_hit and hit.answer == "Cached answer about the hull."
+    assert not miss.cache_hit
+    assert miss.answer == "Answer to How thick was the hull? from 1 documents"
+    assert miss.stats["context_tokens"] > 0
+
+
+def test_answer_batch_answers_cache_misses(cache):
+    cache.put("What was the hull made of?", [], "Cached answer about the hull.")
+
+    check_results(query.answer_batch([("What was the hull made of?", []), ("How thick was the hull?", [])]))
+    assert cache.get("How thick was the hull?", [])[0] == "Answer to How thick was the hull? from 1 documents"
+
+
+def test_aanswer_batch_answers_cache_misses(cache):
+    cache.put("What was the hull made of?", [], "Cached answer about the hull.")
+
+    check_results(asyncio.run(
+        query.aanswer_batch([("What was the hull made of?", []), ("How thick was the hull?", [])])))
+
+
+def test_answer_batch_degrades_items_whose_upstream_is_unavailable(cache, monkeypatch):
+    def unavailable(self, vector, query=None):
+        raise resilience.CircuitOpen("vector_search", 5)
+
+    monkeypatch.setattr(FakeRetriever, "get_documents_by_vector", unavailable)
+
+    result, = query.answer_batch([("How thick was the hull?", [])])
+    assert result.degraded == "vector_search" and result.answer == query.DEGRADED_ANSWER
+    assert cache.get("How thick was the hull?", [])[0] is None
+
+
+def test_stream_answer_replaces_tokens_with_a_degraded_answer(cache, monkeypatch):
+    def chain(inputs):
+        yield {"answer": "The hull"}
+        raise resilience.DeadlineExceeded("chat", 20)
+
+    monkeypatch.setattr(query, "get_qa_chain_with_history", lambda: RunnableLambda(chain))
+
+    events = list(query.stream_answer("How thick was the hull?", []))
+    assert [event for event, _ in events] == ["token", "replace", "done"]
+    assert events[1][1] == query.DEGRADED_ANSWER and events[2][1].degraded == "chat"
+
+
+class FakePineconeIndex:
+    config = types.SimpleNamespace(host="http://127.0.0.1", api_key="test")
+
+    def __init__(self):
+        self.queries = []
+
+    def query(self, vector, top_k, **kwargs):
+        self.queries.append(top_k)
+        return {"matches": [{"id": "a_chunk_0", "score": 0.42,
+                             "metadata": {"text": "The hull was cast in lightweight concrete.", "source": "a.pdf"}}]}
+
+
+def test_pinecone_retriever_searches_by_vector():
+    index = FakePineconeIndex()
+    vector_store = PineconeVectorStore(index=index, embedding=DeterministicFakeEmbedding(size=8), text_key="text")
+    retriever = query.PineconeRetriever(vector_store=vector_store, search_kwargs={"k": 8, "score_threshold": 0.6})
+
+    documents = retriever.invoke("What was the hull made of?")
+    adocuments = asyncio.run(retriever.ainvoke("What was the hull made of?"))
+
+    assert [document.page_content for document in documents] == ["The hull was cast in lightweight concrete."]
+    assert adocuments == documents and index.queries == [8, 8]
@@ -0,0 +1,167 @@
+"""Tests for deadlines, hedging and circuit breaking in ``src/resilience.py``."""
+
+import asyncio
+import time
+import httpx
+import openai
+import pytest
+from pinecone.exceptions import PineconeApiException, ServiceException
+from src import config, resilience
+from src.resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded, Upstream
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+
+
+def openai_status(status):
+    return openai.APIStatusError("refused", response=httpx.Response(status, request=REQUEST), body=None)
+
+
+def httpx_status(status):
+    response = httpx.Response(status, request=REQUEST)
+    return httpx.HTTPStatusError("refused", request=REQUEST, response=response)
+
+
+@pytest.fixture(autouse=True)
+def no_metrics(monkeypatch):
+    monkeypatch.setattr(config, "METRICS_ENABLED", False)
+    monkeypatch.setattr(config, "RESILIENCE_ENABLED", True)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """A fresh ``embed`` upstream whose breaker opens after two failures."""
+    upstream = Upstream("embed", timeout=1)
+    upstream.breaker = CircuitBreaker("embed", failures=2, cooldown=0.05)
+    monkeypatch.setattr(resilience, "get_upstream", lambda name: upstream)
+    return upstream
+
+
+def fail_with(error):
+    def fn():
+        raise error
+    return fn
+
+
+@pytest.mark.parametrize("error", [
+    TimeoutError(),
+    ConnectionResetError(),
+    httpx.ConnectError("refused", request=REQUEST),
+    httpx.ReadTimeout("slow", request=REQUEST),
+    openai.APITimeoutError(request=REQUEST),
+    openai.APIConnectionError(request=REQUEST),
+    openai_status(500),
+    openai_status(429),
+    httpx_status(503),
+    ServiceException(status=503, reason="unavailable"),
+])
+def test_upstream_outages_are_failures(error):
+    assert resilience.is_failure(error)
+
+
+@pytest.mark.parametrize("error", [
+    openai_status(400),
+    openai_status(401),
+    httpx_status(404),
+    PineconeApiException(status=400, reason="bad vector"),
+    ValueError("bad input"),
+    KeyError("metadata"),
+])
+def test_refusals_and_our_own_errors_are_not_failures(error):
+    assert not resilience.is_failure(error)
+
+
+def test_breaker_opens_after_consecutive_failures_and_closes_after_a_probe(upstream):
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            resilience.call("embed", fail_with(httpx.ConnectError("refused", request=REQUEST)))
+
+    with pytest.raises(CircuitOpen):
+        resilience.call("embed", lambda: "vector")
+    time.sleep(0.06)
+    assert resilience.call("embed", lambda: "vector") == "vector"
+    assert upstream.breaker.state == "closed"
+
+
+def test_failed_probe_reopens_the_breaker(upstream):
+    upstream.breaker.failure()
+    upstream.breaker.failure()
+    time.sleep(0.06)
+
+    with pytest.raises(openai.APIStatusError):
+        resilience.call("embed", fail_with(openai_status(502)))
+    assert upstream.breaker.state == "open"
+
+
+@pytest.mark.parametrize("error", [openai_status(400), ValueError("bad input")])
+def test_other_errors_are_reraised_without_opening_the_breaker(upstream, error):
+    for _ in range(3):
+        with pytest.raises(type(error)):
+            resilience.call("embed", fail_with(error))
+
+    assert upstream.breaker.state == "closed" and upstream.breaker.failures == 0
+
+
+def test_our_own_error_during_a_probe_leaves_the_breaker_half_open(upstream):
+    upstream.breaker.failure()
+    upstream.breaker.failure()
+    time.sleep(0.06)
+
+    with pytest.raises(ValueError):
+        resilience.call("embed", fail_with(ValueError("bad input")))
+    assert upstream.breaker.state == "half_open"
+    assert resilience.call("embed", lambda: "vector") == "vector"
+    assert upstream.breaker.state == "closed"
+
+
+def test_call_is_cut_off_at_the_request_deadline(upstream):
+    started = time.monotonic()
+    with resilience.deadline(0.05):
+        with pytest.raises(DeadlineExceeded):
+            resilience.call("embed", lambda: time.sleep(0.5))
+
+    assert time.monotonic() - started < 0.4
+    assert upstream.breaker.failures == 1
+
+
+def test_spent_deadline_fails_without_blaming_the_upstream(upstream):
+    with resilience.deadline(0):
+        with pytest.raises(DeadlineExceeded):
+            resilience.call("embed", lambda: "vector")
+
+    assert upstream.breaker.failures == 0 and upstream.calls == 0
+
+
+def test_acall_counts_only_upstream_failures(upstream):
+    async def refused():
+        raise openai_status(404)
+
+    async def unreachable():
+        raise openai.APIConnectionError(request=REQUEST)
+
+    async def main():
+        with pytest.raises(openai.APIStatusError):
+            await resilience.acall("embed", refused)
+        assert upstream.breaker.failures == 0
+        for _ in range(2):
+            with pytest.raises(openai.APIConnectionError):
+                await resilience.acall("embed", unreachable)
+        with pytest.raises(CircuitOpen):
+            await resilience.acall("embed", refused)
+
+    asyncio.run(main())
+
+
+def test_slow_idempotent_call_is_hedged(upstream, monkeypatch):
+    monkeypatch.setattr(config, "RESILIENCE_HEDGE_BUDGET", 1.0)
+    for _ in range(upstream.latency.min_samples):
+        upstream.latency.record(0.01)
+    calls = []
+
+    def embed():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            time.sleep(0.5)
+        return "vector"
+
+    assert resilience.call("embed", embed, hedge=True) == "vector"
+    assert len(calls) == 2 and upstream.hedges == 1
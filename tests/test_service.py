@@ -0,0 +1,160 @@
+"""Tests for the framework-neutral request handling in ``src/service.py``."""
+
+import asyncio
+import threading
+import types
+import pytest
+from src import admission, config, registry, service
+from src.session_store import MemorySessionStore
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = MemorySessionStore()
+    monkeypatch.setattr(registry, "get_session_store", lambda: store)
+    return store
+
+
+def ask(body, answer):
+    """Run one ``/query`` turn through the session handling; returns the history answered with."""
+    question, session_id, conversation_history = service.parse_query_payload(body)
+    history = service.start_turn(session_id, conversation_history)
+    service.finish_turn(session_id, history, question, answer)
+    return history
+
+
+def test_anonymous_requests_do_not_share_history(store):
+    ask({"question": "My name is Alice and my student id is 1234"}, "Nice to meet you, Alice.")
+
+    assert ask({"question": "What is my name?"}, "I don't know.") == []
+    assert ask({"question": "What is my name?", "session_id": "default"}, "I don't know.") == []
+    assert store.stats()["sessions"] == 0
+
+
+def test_anonymous_request_uses_the_history_it_sent(store):
+    sent = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]
+
+    assert ask({"question": "And then?", "conversation_history": sent}, "Then this.") == sent
+    assert store.stats()["sessions"] == 0
+
+
+def test_named_session_keeps_its_history(store):
+    ask({"question": "My name is Alice", "session_id": "alice"}, "Nice to meet you, Alice.")
+
+    history = ask({"question": "What is my name?", "session_id": "alice"}, "Alice.")
+    assert [message["content"] for message in history] == ["My name is Alice", "Nice to meet you, Alice."]
+    assert ask({"question": "What is my name?", "session_id": "bob"}, "I don't know.") == []
+
+
+class ThreadRecordingStore(MemorySessionStore):
+    """Records the thread each session read or write ran on."""
+
+    def __init__(self):
+        super().__init__()
+        self.threads = []
+
+    def get(self, session_id):
+        self.threads.append(threading.current_thread())
+        return super().get(session_id)
+
+    def set(self, session_id, history):
+        self.threads.append(threading.current_thread())
+        super().set(session_id, history)
+
+
+def test_async_turns_use_the_session_store_off_the_event_loop(monkeypatch):
+    store = ThreadRecordingStore()
+    monkeypatch.setattr(registry, "get_session_store", lambda: store)
+    result = types.SimpleNamespace(answer="Alice.", history=[], degraded=False, cache_hit=False, stats={})
+
+    async def turns():
+        history = await service.astart_turn("alice", None)
+        await service.afinish_turn("alice", history, "What is my name?", "Alice.")
+        entries = service.parse_batch_payload({"questions": [{"question": "And mine?", "session_id": "bob"}]})
+        items, slots = await service.aprepare_batch(entries)
+        await service.afinish_batch(entries, slots, [result])
+        await service.astream_done_event("carol", "Who am I?", result)
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(turns())
+    assert len(store.threads) == 5
+    assert loop_thread not in store.threads
+    assert store.stats()["sessions"] == 3
+
+
+@pytest.mark.parametrize("conversation_history", [
+    "Hi",
+    {"role": "user", "content": "Hi"},
+    ["Hi"],
+    [{"role": "user"}],
+    [{"content": "Hi"}],
+    [{"role": "user", "content": ["Hi"]}],
+    [{"role": "user", "content": "Hi"}, {"role": "summary", "content": "Earlier", "messages": 2, "digest": "x"}],
+    [{"role": "summary", "content": "Earlier"}],
+])
+def test_malformed_conversation_history_is_a_client_error(conversation_history):
+    with pytest.raises(service.RequestError) as error:
+        service.parse_query_payload({"question": "Why?", "conversation_history": conversation_history})
+    assert error.value.status_code == 400
+
+
+def test_well_formed_conversation_history_is_accepted():
+    sent = [{"role": "summary", "content": "Earlier", "messages": 2, "digest": "x"},
+            {"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]
+
+    assert service.parse_query_payload({"question": "Why?", "conversation_history": sent})[2] == sent
+    assert service.parse_query_payload({"question": "Why?", "conversation_history": []})[2] == []
+
+
+def test_batch_items_are_validated_one_by_one():
+    entries = service.parse_batch_payload({"questions": [
+        "What was the hull made of?",
+        {"question": "And then?", "conversation_history": "not a list"},
+        {"question": "   "},
+        42,
+        {"question": "Who built it?", "session_id": "alice"},
+    ]})
+
+    assert entries[0] == ("What was the hull made of?", None, None)
+    assert entries[4] == ("Who built it?", "alice", None)
+    assert [type(entry) for entry in entries[1:4]] == [service.RequestError] * 3
+
+
+@pytest.mark.parametrize("questions", [None, [], "What?", ["What?"] * (config.BATCH_MAX_QUESTIONS + 1)])
+def test_malformed_batch_is_rejected_as_a_whole(questions):
+    with pytest.raises(service.RequestError):
+        service.parse_batch_payload({"questions": questions})
+
+
+def test_batch_answers_go_back_to_their_items_and_sessions(store):
+    ask({"question": "My name is Alice", "session_id": "alice"}, "Nice to meet you, Alice.")
+    entries = service.parse_batch_payload({"questions": [
+        {"question": "What is my name?", "session_id": "alice"}, 42, "What was the hull made of?"]})
+
+    items, slots = service.prepare_batch(entries)
+    answered = types.SimpleNamespace(answer="Alice.", history=items[0][1], degraded=False,
+                                     cache_hit=False, stats={})
+    response = service.finish_batch(entries, slots, [answered, RuntimeError("boom")])
+
+    assert [len(history) for _, history in items] == [2, 0]
+    assert [item["status"] for item in response] == ["success", "error", "error"]
+    assert response[0]["answer"] == "Alice." and "boom" in response[2]["error"]
+    assert len(store.get("alice")) == 4
+    assert service.batch_admission(entries) == ("What is my name? What was the hull made of?", 2)
+
+
+def test_shed_stream_never_starts_its_events(monkeypatch):
+    busy = admission.AdmissionController(max_concurrency=1, max_queue=0)
+    monkeypatch.setattr(admission, "get_admission_controller", lambda: busy)
+    monkeypatch.setattr(config, "ADMISSION_ENABLED", True)
+    started = []
+
+    def events():
+        started.append(True)
+        yield "data: {}\n\n"
+
+    with busy.admit("in flight"):
+        with pytest.raises(admission.Rejected):
+            service.admitted_stream("What was the hull made of?", {}, events)
+
+    assert started == []
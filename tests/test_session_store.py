@@ -0,0 +1,157 @@
+"""Tests for the bounded session stores in ``src/session_store.py``."""
+
+import sqlite3
+import types
+import pytest
+from src import session_store
+from src.session_store import MemorySessionStore, SQLiteSessionStore, encode_history
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(session_store, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return MemorySessionStore(**kwargs)
+        # Exact recency, so both backends evict the same sessions
+        return SQLiteSessionStore(path=str(tmp_path / "sessions.sqlite"), **{"touch_fraction": 0, **kwargs})
+    return make
+
+
+def turn(text):
+    return [{"role": "user", "content": text}, {"role": "assistant", "content": f"About {text}"}]
+
+
+def size(history):
+    return len(encode_history(history).encode("utf-8"))
+
+
+def test_get_returns_what_was_set(make_store, clock):
+    store = make_store()
+    store.set("alice", turn("hulls"))
+
+    assert store.get("alice") == turn("hulls")
+    assert store.get("bob") is None
+    assert store.delete("alice") and not store.delete("alice")
+    assert store.get("alice") is None
+
+
+def test_least_recently_used_session_is_evicted_at_the_count_cap(make_store, clock):
+    store = make_store(max_sessions=2)
+    store.set("a", turn("a"))
+    clock.now += 1
+    store.set("b", turn("b"))
+    clock.now += 1
+    store.get("a")
+    clock.now += 1
+    store.set("c", turn("c"))
+
+    assert store.get("b") is None
+    assert store.get("a") == turn("a") and store.get("c") == turn("c")
+    stats = store.stats()
+    assert stats["sessions"] == 2 and stats["lru_evictions"] == 1
+
+
+def test_byte_cap_evicts_oldest_and_skips_oversized_histories(make_store, clock):
+    store = make_store(max_bytes=2 * size(turn("a")))
+    store.set("a", turn("a"))
+    clock.now += 1
+    store.set("b", turn("b"))
+    clock.now += 1
+    store.set("c", turn("c"))
+
+    assert store.get("a") is None
+    assert store.stats()["bytes"] == 2 * size(turn("a"))
+
+    store.set("b", turn("a much longer history than the store can hold"))
+    assert store.get("b") is None
+    stats = store.stats()
+    assert stats["sessions"] == 1 and stats["bytes"] == size(turn("c"))
+
+
+def test_sessions_expire_after_the_ttl(make_store, clock):
+    store = make_store(ttl=60)
+    store.set("a", turn("a"))
+    clock.now += 30
+    store.set("b", turn("b"))
+    clock.now += 31
+
+    assert store.get("a") is None
+    assert store.get("b") == turn("b")
+    clock.now += 61
+    store.prune()
+    stats = store.stats()
+    assert stats["sessions"] == 0 and stats["bytes"] == 0 and stats["ttl_evictions"] == 2
+
+
+def test_prune_drops_only_expired_sessions(make_store, clock):
+    store = make_store(ttl=60)
+    for session_id in ("a", "b"):
+        store.set(session_id, turn(session_id))
+    clock.now += 45
+    store.set("c", turn("c"))
+    clock.now += 30
+
+    assert store.prune() == 2
+    assert store.recent_ids() == ["c"]
+    assert store.stats()["ttl_evictions"] == 2
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path, clock):
+    path = str(tmp_path / "sessions.sqlite")
+    first = SQLiteSessionStore(path=path, max_sessions=2)
+    second = SQLiteSessionStore(path=path, max_sessions=2)
+
+    first.set("a", turn("a"))
+    assert second.get("a") == turn("a")
+    clock.now += 1
+    second.set("b", turn("b"))
+    clock.now += 1
+    first.set("c", turn("c"))
+
+    assert second.get("a") is None
+    assert first.stats() == second.stats()
+    assert second.stats()["sessions"] == 2 and second.stats()["lru_evictions"] == 1
+
+
+def test_sqlite_reads_only_write_last_used_once_it_is_stale(tmp_path, clock):
+    path = str(tmp_path / "sessions.sqlite")
+    store = SQLiteSessionStore(path=path, ttl=1000, touch_fraction=0.1)
+    store.set("a", turn("a"))
+    written = clock.now
+
+    def last_used():
+        with sqlite3.connect(path) as db:
+            return db.execute("SELECT last_used FROM sessions WHERE session_id = 'a'").fetchone()[0]
+
+    clock.now += 99
+    store.get("a")
+    assert last_used() == written
+    clock.now += 1
+    store.get("a")
+    assert last_used() == clock.now
+
+
+def test_sqlite_session_count_starts_from_existing_rows(tmp_path, clock):
+    path = str(tmp_path / "sessions.sqlite")
+    store = SQLiteSessionStore(path=path)
+    store.set("a", turn("a"))
+    store.set("b", turn("b"))
+    with sqlite3.connect(path) as db:
+        db.execute("DELETE FROM counters WHERE name = 'sessions'")
+
+    assert SQLiteSessionStore(path=path).stats()["sessions"] == 2